@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the package's hot paths using synthetic instance catalogs.
+
+Each benchmark is run in a fresh worker process so that the reported
+peak RSS reflects that benchmark alone.  Results are written as JSON
+and optionally compared to, or saved as, a baseline in
+benchmarks/baselines.  No network or database access is needed.
+
+Example:
+
+    $ python benchmarks/run_benchmarks.py --sizes 1000 100000 \\
+          --outfile bench_output.json --compare
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import resource
+import subprocess
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_instcat import write_synthetic_instcat
+
+_baseline_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baselines')
+
+def bench_instcat_commands(instcat_file, objs):
+    "Parse the physics commands."
+    import desc.imsimdeep
+    desc.imsimdeep.instcat_commands(instcat_file)
+    return 1
+
+def bench_sky_cone_select(instcat_file, objs):
+    "Select objects in a 0.1 degree cone around the pointing direction."
+    import desc.imsimdeep
+    commands = desc.imsimdeep.instcat_commands(instcat_file)
+    outfile = instcat_file + '.cone'
+    desc.imsimdeep.sky_cone_select(instcat_file, commands['rightascension'],
+                                   commands['declination'], 0.1, outfile)
+    os.remove(outfile)
+    return len(objs['ra'])
+
+def bench_select_by_chip_name(instcat_file, objs):
+    "Select the objects on the central chip."
+    import lsst.obs.lsstSim as obs_lsstSim
+    import desc.imsimdeep
+    commands = desc.imsimdeep.instcat_commands(instcat_file)
+    obs_md = desc.imsimdeep.obs_metadata(commands)
+    camera = obs_lsstSim.LsstSimMapper().camera
+    df = pd.DataFrame(dict(ra=objs['ra'], dec=objs['dec']))
+    desc.imsimdeep.select_by_chip_name(df, 'R:2,2 S:1,1', obs_md, camera)
+    return len(df)
+
+def bench_parallel_chip_names(instcat_file, objs):
+    "Assign all objects to chips using a pool of processes."
+    import desc.imsimdeep
+    commands = desc.imsimdeep.instcat_commands(instcat_file)
+    desc.imsimdeep.parallel_chip_names(objs['ra'], objs['dec'], commands)
+    return len(objs['ra'])
+
+def bench_apparent_magnitude(instcat_file, objs, max_objects=2000):
+    "Compute r-band apparent magnitudes, one ApparentMagnitude per SED."
+    import desc.imsim
+    import desc.imsimdeep
+    instcat = desc.imsim.parsePhoSimInstanceFile(instcat_file,
+                                                 numRows=max_objects)
+    objects = instcat.objects
+    app_mags = dict()
+    for i in range(len(objects)):
+        pars = objects.iloc[i]
+        if pars.sedFilepath not in app_mags:
+            app_mags[pars.sedFilepath] \
+                = desc.imsimdeep.ApparentMagnitude(pars.sedFilepath)
+        app_mags[pars.sedFilepath](pars, 'r')
+    return len(objects)
+
+def bench_truth_catalog_match(instcat_file, objs):
+    "Match perturbed positions against the instance catalog objects."
+    import desc.imsimdeep
+    from desc.imsimdeep.instcat_comparison import Level2Catalog
+    instcat = pd.DataFrame(dict(raICRS=objs['ra'], decICRS=objs['dec'],
+                                r=objs['magNorm'],
+                                galSimType=np.where(objs['is_point'],
+                                                    'pointSource', 'sersic')))
+    truth_index = desc.imsimdeep.TruthCatalogIndex(instcat)
+    rng = np.random.RandomState(1234)
+    nobjs = len(objs['ra'])
+    dra = rng.normal(0, 0.1/3600., nobjs)
+    ddec = rng.normal(0, 0.1/3600., nobjs)
+    catalog = Level2Catalog(np.arange(nobjs),
+                            np.radians(objs['ra'] + dra),
+                            np.radians(objs['dec'] + ddec),
+                            np.ones(nobjs), np.ones(nobjs))
+    truth_index.match(catalog, 'r')
+    return nobjs
+
+def _fresh_import(statement):
+    "Run an import statement in a fresh interpreter."
+    subprocess.check_call([sys.executable, '-c', statement])
+
+def bench_import_package(instcat_file, objs, repeat=5):
+    "Import desc.imsimdeep in a fresh interpreter."
+    for _ in range(repeat):
+        _fresh_import('import desc.imsimdeep')
+    return repeat
+
+def bench_import_sky_cone_select(instcat_file, objs, repeat=5):
+    "Import only what a per-sensor sky_cone_select worker needs."
+    for _ in range(repeat):
+        _fresh_import('from desc.imsimdeep import sky_cone_select')
+    return repeat
+
+benchmarks = [bench_import_package, bench_import_sky_cone_select,
+              bench_instcat_commands, bench_sky_cone_select,
+              bench_select_by_chip_name, bench_parallel_chip_names,
+              bench_apparent_magnitude,
+              bench_truth_catalog_match]
+
+# The current synthetic catalog, inherited by the forked worker
+# processes to avoid pickling large arrays.
+_catalog = dict()
+
+def _run_benchmark(func):
+    """
+    Run a benchmark in a worker process, returning the elapsed time,
+    number of items, and peak RSS in GB.
+    """
+    instcat_file, objs = _catalog['instcat_file'], _catalog['objs']
+    t0 = time.time()
+    nitems = func(instcat_file, objs)
+    elapsed = time.time() - t0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.**2
+    return elapsed, nitems, peak_rss
+
+def run_benchmarks(sizes, selection=None, repeat=1, seed=42,
+                   work_dir=None):
+    """
+    Run the benchmarks for synthetic catalogs of each size.
+
+    Parameters
+    ----------
+    sizes : sequence of ints
+        Numbers of objects in the synthetic instance catalogs.
+    selection : sequence of str, optional
+        Names of the benchmarks to run.  Default: None (i.e., all)
+    repeat : int, optional
+        Number of times to run each benchmark; the fastest time is
+        reported.  Default: 1
+    seed : int, optional
+        Random number seed for the synthetic catalogs.  Default: 42
+    work_dir : str, optional
+        Directory for the synthetic catalogs.  Default: a temporary
+        directory.
+
+    Returns
+    -------
+    dict
+        Results keyed by '<benchmark name>[<size>]'.
+    """
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp()
+    results = dict()
+    for size in sizes:
+        instcat_file = os.path.join(work_dir, 'synthetic_%i.txt' % size)
+        _catalog['instcat_file'] = instcat_file
+        _catalog['objs'] = write_synthetic_instcat(instcat_file, size,
+                                                   seed=seed)
+        for func in benchmarks:
+            name = func.__name__[len('bench_'):]
+            if selection is not None and name not in selection:
+                continue
+            timings = []
+            for _ in range(repeat):
+                pool = multiprocessing.Pool(1)
+                try:
+                    timings.append(pool.apply(_run_benchmark, (func,)))
+                finally:
+                    pool.close()
+                    pool.join()
+            elapsed, nitems, peak_rss = min(timings)
+            key = '%s[%i]' % (name, size)
+            results[key] = dict(elapsed=elapsed, items=nitems,
+                                throughput=nitems/elapsed if elapsed > 0
+                                else None,
+                                peak_rss_gb=max(x[2] for x in timings))
+            print('%-36s %10.3f s %12.1f items/s %8.3f GB'
+                  % (key, elapsed, results[key]['throughput'] or 0, peak_rss))
+        os.remove(instcat_file)
+    return results
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results to a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results from run_benchmarks.
+    baseline : dict
+        Baseline results.
+    tolerance : float, optional
+        Fractional increase in elapsed time or peak RSS that is flagged
+        as a regression.  Default: 0.2
+
+    Returns
+    -------
+    list of str
+        Descriptions of the regressions.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for quantity in ('elapsed', 'peak_rss_gb'):
+            ref = baseline[key][quantity]
+            if ref > 0 and result[quantity] > (1. + tolerance)*ref:
+                regressions.append('%s %s: %.3f vs baseline %.3f'
+                                   % (key, quantity, result[quantity], ref))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of desc.imsimdeep with synthetic instance catalogs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000],
+                        help='Numbers of objects in the synthetic catalogs')
+    parser.add_argument('--benchmarks', type=str, nargs='+', default=None,
+                        help='Benchmarks to run. Default: all')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of repetitions of each benchmark')
+    parser.add_argument('--outfile', type=str, default='bench_output.json',
+                        help='Output file for the results')
+    parser.add_argument('--baseline', type=str,
+                        default=os.path.join(_baseline_dir,
+                                             socket.gethostname() + '.json'),
+                        help='Baseline file')
+    parser.add_argument('--compare', action='store_true', default=False,
+                        help='Compare the results to the baseline')
+    parser.add_argument('--save_baseline', action='store_true', default=False,
+                        help='Save the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fractional tolerance for regressions')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, selection=args.benchmarks,
+                             repeat=args.repeat)
+    with open(args.outfile, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        if not os.path.isdir(os.path.dirname(args.baseline)):
+            os.makedirs(os.path.dirname(args.baseline))
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.baseline) as input_:
+            regressions = compare_to_baseline(results, json.load(input_),
+                                              tolerance=args.tolerance)
+        for item in regressions:
+            print('REGRESSION:', item)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,194 @@
+"""
+Generate synthetic PhoSim instance catalogs for benchmarking.
+
+The physics commands are those of tests/tiny_instcat.txt.  Objects are
+a mix of point sources and sersic2d galaxies distributed uniformly
+within a cone around the pointing direction, with SEDs drawn from the
+sims_sed_library (if available) and magNorm, redshift, and dust
+parameters drawn from simple but realistic distributions.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import numpy as np
+
+__all__ = ['header_lines', 'sed_names', 'synthetic_objects',
+           'write_synthetic_instcat']
+
+_tiny_instcat = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, 'tests', 'tiny_instcat.txt')
+
+def header_lines(instcat_file=_tiny_instcat):
+    """
+    The physics command lines from an instance catalog.
+
+    Parameters
+    ----------
+    instcat_file : str, optional
+        Instance catalog file.  Default: tests/tiny_instcat.txt
+
+    Returns
+    -------
+    list of str
+    """
+    with open(instcat_file) as input_:
+        return [line for line in input_ if not line.startswith('object')]
+
+def sed_names(max_seds=50, seed=None):
+    """
+    Star and galaxy SED file names from the sims_sed_library, relative
+    to the library directory.  If the library is not set up, the SEDs
+    used in tests/tiny_instcat.txt are returned.
+
+    Parameters
+    ----------
+    max_seds : int, optional
+        Maximum number of SEDs of each type to return.  Default: 50
+    seed : int, optional
+        Random number seed for selecting the SEDs.  Default: None
+
+    Returns
+    -------
+    (list, list)
+        The star and galaxy SED file names.
+    """
+    stars = ['starSED/phoSimMLT/lte037-5.5-1.0a+0.4.BT-Settl.spec.gz']
+    galaxies = ['galaxySED/Inst.32E09.02Z.spec.gz']
+    sed_dir = os.environ.get('SIMS_SED_LIBRARY_DIR', None)
+    if sed_dir is None:
+        return stars, galaxies
+    rng = np.random.RandomState(seed)
+    seds = []
+    for subdir in ('starSED', 'galaxySED'):
+        names = []
+        for root, _, files in os.walk(os.path.join(sed_dir, subdir)):
+            names.extend(os.path.relpath(os.path.join(root, item), sed_dir)
+                         for item in files if item.endswith('.gz'))
+        names.sort()
+        if len(names) > max_seds:
+            names = list(rng.choice(names, max_seds, replace=False))
+        seds.append(names)
+    return seds[0] or stars, seds[1] or galaxies
+
+def synthetic_objects(num_objects, ra0, dec0, radius=0.3, point_fraction=0.5,
+                      seds=None, seed=None):
+    """
+    Draw synthetic object parameters.
+
+    Parameters
+    ----------
+    num_objects : int
+        Number of objects.
+    ra0, dec0 : float
+        Center of the cone in degrees.
+    radius : float, optional
+        Radius of the cone in degrees.  Default: 0.3
+    point_fraction : float, optional
+        Fraction of point sources.  Default: 0.5
+    seds : (list, list), optional
+        Star and galaxy SED names.  Default: sed_names()
+    seed : int, optional
+        Random number seed.  Default: None
+
+    Returns
+    -------
+    dict of numpy.arrays
+    """
+    rng = np.random.RandomState(seed)
+    if seds is None:
+        seds = sed_names(seed=seed)
+    # Uniform sampling within the cone.
+    cos_theta = rng.uniform(np.cos(np.radians(radius)), 1., num_objects)
+    theta = np.arccos(cos_theta)
+    phi = rng.uniform(0, 2*np.pi, num_objects)
+    dec0_r, ra0_r = np.radians(dec0), np.radians(ra0)
+    dec = np.arcsin(np.sin(dec0_r)*np.cos(theta)
+                    + np.cos(dec0_r)*np.sin(theta)*np.cos(phi))
+    ra = ra0_r + np.arctan2(np.sin(phi)*np.sin(theta)*np.cos(dec0_r),
+                            np.cos(theta) - np.sin(dec0_r)*np.sin(dec))
+    is_point = rng.uniform(size=num_objects) < point_fraction
+    num_points = np.count_nonzero(is_point)
+    num_gals = num_objects - num_points
+    objs = dict(uniqueId=np.arange(num_objects, dtype=np.int64)*1024 + 1,
+                ra=np.degrees(ra) % 360., dec=np.degrees(dec),
+                is_point=is_point,
+                # Number counts rising toward faint magnitudes,
+                # roughly as 10**(0.3*magNorm).
+                magNorm=16. + 12.*rng.power(0.3*np.log(10.)*12. + 1.,
+                                            num_objects),
+                sed_index=np.zeros(num_objects, dtype=int),
+                redshift=np.zeros(num_objects),
+                internalAv=np.zeros(num_objects),
+                galacticAv=rng.gamma(2., 0.02, num_objects),
+                major=np.zeros(num_objects), minor=np.zeros(num_objects),
+                pa=rng.uniform(0, 360, num_objects),
+                sersic_index=np.zeros(num_objects))
+    objs['sed_index'][is_point] = rng.randint(len(seds[0]), size=num_points)
+    objs['sed_index'][~is_point] = rng.randint(len(seds[1]), size=num_gals)
+    objs['redshift'][~is_point] = rng.lognormal(np.log(0.7), 0.6, num_gals)
+    objs['internalAv'][~is_point] = rng.uniform(0, 1, num_gals)
+    objs['major'][~is_point] = rng.lognormal(np.log(1.), 0.5, num_gals)
+    objs['minor'][~is_point] = \
+        objs['major'][~is_point]*rng.uniform(0.2, 1, num_gals)
+    objs['sersic_index'][~is_point] = rng.choice([1, 4], num_gals)
+    objs['seds'] = seds
+    return objs
+
+def _object_lines(objs, start, stop):
+    star_seds, gal_seds = objs['seds']
+    lines = []
+    for i in range(start, stop):
+        if objs['is_point'][i]:
+            lines.append('object %i %.7f %.7f %.7f %s 0 0 0 0 0 0 point none CCM %.10f 3.1\n'
+                         % (objs['uniqueId'][i], objs['ra'][i], objs['dec'][i],
+                            objs['magNorm'][i],
+                            star_seds[objs['sed_index'][i]],
+                            objs['galacticAv'][i]))
+        else:
+            lines.append('object %i %.7f %.7f %.7f %s %.9f 0 0 0 0 0 sersic2d %.6f %.6f %.5f %i CCM %.7f 3.1 CCM %.10f 3.1\n'
+                         % (objs['uniqueId'][i], objs['ra'][i], objs['dec'][i],
+                            objs['magNorm'][i],
+                            gal_seds[objs['sed_index'][i]],
+                            objs['redshift'][i], objs['major'][i],
+                            objs['minor'][i], objs['pa'][i],
+                            objs['sersic_index'][i], objs['internalAv'][i],
+                            objs['galacticAv'][i]))
+    return lines
+
+def write_synthetic_instcat(outfile, num_objects, radius=0.3,
+                            point_fraction=0.5, seed=None, chunk_size=100000):
+    """
+    Write a synthetic instance catalog.
+
+    Parameters
+    ----------
+    outfile : str
+        Output filename.
+    num_objects : int
+        Number of objects.
+    radius : float, optional
+        Radius in degrees of the cone around the pointing direction.
+        Default: 0.3
+    point_fraction : float, optional
+        Fraction of point sources.  Default: 0.5
+    seed : int, optional
+        Random number seed.  Default: None
+    chunk_size : int, optional
+        Number of object lines to format at a time.  Default: 100000
+
+    Returns
+    -------
+    dict of numpy.arrays
+        The object parameters.
+    """
+    header = header_lines()
+    commands = dict(line.split()[:2] for line in header if line.strip())
+    objs = synthetic_objects(num_objects, float(commands['rightascension']),
+                             float(commands['declination']), radius=radius,
+                             point_fraction=point_fraction, seed=seed)
+    with open(outfile, 'w') as output:
+        output.writelines(header)
+        for start in range(0, num_objects, chunk_size):
+            output.writelines(_object_lines(objs, start,
+                                            min(start + chunk_size,
+                                                num_objects)))
+    return objs
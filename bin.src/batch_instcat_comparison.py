@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Compare the Stack source catalogs for all sensors of a set of visits
+to the instance catalog objects, writing a combined data frame.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Run instcat_comparison for all sensors of a list of visits.')
+parser.add_argument('repo', type=str,
+                    help='Output repo containing the Stack catalogs')
+parser.add_argument('outfile', type=str,
+                    help='Output file for the combined data frame (.pkl or .parquet)')
+parser.add_argument('--visits', type=int, nargs='+', required=True,
+                    help='Visit numbers to process')
+parser.add_argument('--app_mag_file', type=str, required=True,
+                    help="Apparent magnitude file template, e.g., 'app_mags_%%(visit)07i.pkl'")
+parser.add_argument('--catalog_type', type=str, default='forced',
+                    help="Catalog data product to use, 'forced' or 'src'")
+parser.add_argument('--flux_col', type=str, default='base_PsfFlux_flux',
+                    help='Flux column to use')
+parser.add_argument('--tract', type=str, default='0', help='Tract to use')
+parser.add_argument('--match_radius', type=float, default=None,
+                    help='Maximum offset in arcsec for an association')
+parser.add_argument('--processes', type=int, default=None,
+                    help='Number of worker processes')
+args = parser.parse_args()
+
+app_mag_files = dict((visit, args.app_mag_file % dict(visit=visit))
+                     for visit in args.visits)
+
+df, errors = desc.imsimdeep.batch_instcat_comparison(
+    app_mag_files, args.repo, catalog_type=args.catalog_type,
+    flux_col=args.flux_col, tract=args.tract, processes=args.processes,
+    match_radius=args.match_radius)
+
+desc.imsimdeep.write_batch_results(df, args.outfile)
+
+if len(df) > 0:
+    num_sensors = len(df.groupby(['visit', 'raft', 'sensor']))
+else:
+    num_sensors = 0
+print('%i objects from %i sensors written to %s'
+      % (len(df), num_sensors, args.outfile))
+for key in sorted(errors, key=str):
+    print('Failed:', key)
+    print(errors[key])
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+"""
+Precompute the band magnitude offsets for the SEDs in sims_sed_library.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Precompute the imsim bandpass magnitudes and the zero-redshift, undusted band magnitude offsets for the SED library.')
+parser.add_argument('outfile', type=str, help='The output filename')
+parser.add_argument('--sed_names', type=str, nargs='+', default=None,
+                    help='SED files relative to sims_sed_library. Default: all')
+args = parser.parse_args()
+
+desc.imsimdeep.build_sed_photometry_table(args.outfile,
+                                          sed_names=args.sed_names)
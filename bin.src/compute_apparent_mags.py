@@ -4,7 +4,6 @@ Compute apparent magnitudes for each object in a phosim instance catalog.
 """
 from __future__ import absolute_import, print_function
 import argparse
-import pickle
 import numpy as np
 import pandas as pd
 import desc.imsim
@@ -12,42 +11,70 @@ import desc.imsimdeep
 
 parser = argparse.ArgumentParser()
 parser.add_argument('instance_catalog', type=str,
-                    help='The phosim instance catalog (text or pickled dfs)')
+                    help='The phosim instance catalog (text or binary)')
 parser.add_argument('outfile', type=str, help='The output filename')
 parser.add_argument('--numrows', type=int, default=None,
                     help='Number of rows to read from the instance catalog')
+parser.add_argument('--sed_table', type=str, default=None,
+                    help='SED photometry table from build_sed_photometry_table.py')
+parser.add_argument('--mag_cache', type=str, default=None,
+                    help='SQLite file of magnitudes cached from previous visits')
 args = parser.parse_args()
 
-try:
-    commands, objs = pickle.load(open(args.instance_catalog))
-    if args.numrows is not None:
-        objs = objs.iloc[:args.numrows-len(commands)]
-except IndexError:
-    commands, objs = desc.imsim.parsePhoSimInstanceFile(args.instance_catalog,
-                                                        numRows=args.numrows)
+commands, objs = desc.imsimdeep.read_instance_catalog(args.instance_catalog,
+                                                     numRows=args.numrows)
 
 objs = desc.imsim.validate_phosim_object_list(objs).accepted
 
+# read_instance_catalog returns the SED and galSimType strings as
+# integer codes with shared lookup tables; make sure they are still
+# categoricals after the validation.
+objs = desc.imsimdeep.encode_categoricals(objs)
+
 band = commands['bandpass']
 columns = ('uniqueId', 'raICRS', 'decICRS', band)
 
-sed_names = [x[0] for x in objs.groupby('sedFilepath').sedFilepath.unique()]
-
-data_frames = []
-with open(args.instance_catalog) as inst_cat:
-    for sed_name in sed_names:
-        app_mag = desc.imsimdeep.ApparentMagnitude(sed_name)
-        my_objs = objs.query("sedFilepath=='%s'" % sed_name)
-        nrows = len(my_objs)
-        mags = [app_mag(my_objs.iloc[i], band) for i in range(nrows)]
-        df = pd.DataFrame(np.zeros((len(my_objs), len(columns))),
-                          columns=columns)
-        df['uniqueId'] = pd.to_numeric(my_objs['uniqueId']).tolist()
-        df['raICRS'] = pd.to_numeric(my_objs['raICRS']).tolist()
-        df['decICRS'] = pd.to_numeric(my_objs['decICRS']).tolist()
-        df['galSimType'] = my_objs['galSimType'].tolist()
-        df[band] = mags
-        data_frames.append(df)
-
-my_df = pd.concat(tuple(data_frames), ignore_index=True)
+# Skip objects with missing sedFilepath.
+objs = objs[objs['sedFilepath'].cat.codes.values >= 0]
+sed_names = objs['sedFilepath'].cat.categories
+sed_codes = objs['sedFilepath'].cat.codes.values
+
+sed_table = None
+if args.sed_table is not None:
+    sed_table = desc.imsimdeep.SedPhotometryTable.read(args.sed_table)
+
+mags = np.nan*np.ones(len(objs))
+mag_cache = None
+if args.mag_cache is not None:
+    # Cached magnitudes are reused only with the same throughputs and
+    # SED photometry table.
+    photometry_version = desc.imsimdeep.throughput_version()
+    if args.sed_table is not None:
+        photometry_version += ':' + desc.imsimdeep.file_digest(args.sed_table)
+    mag_cache = desc.imsimdeep.MagnitudeCache(
+        args.mag_cache, photometry_version=photometry_version)
+    mags = mag_cache.lookup(objs, band)
+new_rows = np.where(np.isnan(mags))[0]
+
+with desc.imsimdeep.profile_stage('compute_apparent_mags',
+                                  count=len(new_rows)):
+    sed_groups = pd.Series(sed_codes[new_rows]).groupby(sed_codes[new_rows])
+    for sed_code, positions in sed_groups.indices.items():
+        rows = new_rows[positions]
+        app_mag = desc.imsimdeep.ApparentMagnitude(sed_names[sed_code],
+                                                   sed_table=sed_table)
+        my_mags = app_mag.magnitudes(objs.iloc[rows], band)
+        my_mags[~np.isfinite(my_mags)] = 1000.
+        mags[rows] = my_mags
+
+if mag_cache is not None:
+    mag_cache.insert(objs.iloc[new_rows], band, mags[new_rows])
+    mag_cache.close()
+
+my_df = pd.DataFrame(np.zeros((len(objs), len(columns))), columns=columns)
+my_df['uniqueId'] = pd.to_numeric(objs['uniqueId']).values
+my_df['raICRS'] = pd.to_numeric(objs['raICRS']).values
+my_df['decICRS'] = pd.to_numeric(objs['decICRS']).values
+my_df['galSimType'] = objs['galSimType'].values
+my_df[band] = mags
 my_df.to_pickle(args.outfile)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+"""
+Convert a phosim instance catalog between the text and binary formats.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Convert a phosim instance catalog between the text and binary formats.  The direction of the conversion is determined by the input.')
+parser.add_argument('infile', type=str,
+                    help='Text instance catalog or binary catalog directory')
+parser.add_argument('outfile', type=str,
+                    help='Binary catalog directory or text instance catalog')
+parser.add_argument('--no_objects', action='store_true', default=False,
+                    help='Do not store the parsed object columns in the binary catalog')
+args = parser.parse_args()
+
+if desc.imsimdeep.is_binary_instcat(args.infile):
+    desc.imsimdeep.binary_to_text(args.infile, args.outfile)
+else:
+    desc.imsimdeep.text_to_binary(args.infile, args.outfile,
+                                  parse_objects=not args.no_objects)
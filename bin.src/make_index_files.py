@@ -9,6 +9,14 @@ import os
 import argparse
 import desc.imsimdeep
 
+def setup_version(product):
+    """
+    The eups version of a set-up product, from its SETUP_<PRODUCT>
+    environment variable, e.g., 'sims_catUtils 2.6.0 -f Linux64 -Z ...'.
+    """
+    setup = os.environ.get('SETUP_' + product.upper(), '').split()
+    return setup[1] if len(setup) > 1 else None
+
 parser = argparse.ArgumentParser(description='Generate the astrometry.net index files based on a OpSim visit.')
 parser.add_argument('opsim_db', help='OpSim database sqlite file')
 parser.add_argument('obsHistID', type=int,
@@ -30,6 +38,10 @@ parser.add_argument('--database', type=str, default='LSSTCATSIM',
                     help='CatSim database name')
 parser.add_argument('--driver', type=str, default='mssql+pymssql',
                     help='CatSim database driver')
+parser.add_argument('--manifest', type=str, default=None,
+                    help='Build manifest file used to skip up-to-date stages. If None, then use <outfile_root>_manifest.json')
+parser.add_argument('--force', action='store_true', default=False,
+                    help='Rebuild all stages, ignoring the build manifest')
 args = parser.parse_args()
 
 db_info = dict(host=args.host, port=args.port, database=args.database,
@@ -44,10 +56,27 @@ if args.index_id is None:
 else:
     index_id = args.index_id
 
-desc.imsimdeep.make_refcat(args.opsim_db, args.obsHistID, args.boundLength,
-                           refcat_txt, catsim_db_info=db_info)
+manifest_file = args.manifest
+if manifest_file is None:
+    manifest_file = args.outfile_root + '_manifest.json'
+if args.force and os.path.isfile(manifest_file):
+    os.remove(manifest_file)
+manifest = desc.imsimdeep.BuildManifest(manifest_file)
+
+refcat_inputs = dict(opsim_db=manifest.file_digest(args.opsim_db),
+                     obsHistID=args.obsHistID, boundLength=args.boundLength,
+                     catsim_db_info=db_info,
+                     sims_catUtils=setup_version('sims_catUtils'))
+manifest.run_stage('refcat', refcat_inputs, [refcat_txt],
+                   desc.imsimdeep.make_refcat, args.opsim_db, args.obsHistID,
+                   args.boundLength, refcat_txt, catsim_db_info=db_info)
 
-desc.imsimdeep.refcat_to_astrometry_net_input(refcat_txt, outfile=refcat_fits)
+fits_inputs = dict(refcat=manifest.file_digest(refcat_txt),
+                   text2fits=desc.imsimdeep.tool_digest('text2fits.py'))
+manifest.run_stage('refcat_fits', fits_inputs, [refcat_fits],
+                   desc.imsimdeep.refcat_to_astrometry_net_input, refcat_txt,
+                   outfile=refcat_fits)
 
 desc.imsimdeep.build_index_files(refcat_fits, index_id,
-                                 max_scale_number=args.max_scale)
+                                 max_scale_number=args.max_scale,
+                                 manifest=manifest)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Query the CatSim database for the stars in HEALPix tiles covering a
+sky region and generate astrometry.net index files for each tile, with
+one andConfig.py listing all of them.
+"""
+from __future__ import absolute_import
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Generate tiled astrometry.net index files covering a sky region.')
+parser.add_argument('ra', type=float, help='RA of the region center (degrees)')
+parser.add_argument('dec', type=float,
+                    help='Dec of the region center (degrees)')
+parser.add_argument('radius', type=float,
+                    help='Radius of the region (degrees)')
+parser.add_argument('--index_id', type=int, default=1,
+                    help='Numeric root of the index IDs; the zero-padded HEALPix pixel number and the scale number are appended for each tile')
+parser.add_argument('--nside', type=int, default=32,
+                    help='HEALPix nside of the tiles')
+parser.add_argument('--margin', type=float, default=0.1,
+                    help='Overlap margin of the tiles (degrees)')
+parser.add_argument('--max_scale', type=int, default=4,
+                    help='maximum scale for astrometry.net index files')
+parser.add_argument('--output_dir', type=str, default='.',
+                    help='Output directory')
+parser.add_argument('--processes', type=int, default=None,
+                    help='Number of processes building index files')
+parser.add_argument('--host', type=str,
+                    default='fatboy.phys.washington.edu',
+                    help='CatSim database host name')
+parser.add_argument('--port', type=int, default=1433,
+                    help='CatSim database host port')
+parser.add_argument('--database', type=str, default='LSSTCATSIM',
+                    help='CatSim database name')
+parser.add_argument('--driver', type=str, default='mssql+pymssql',
+                    help='CatSim database driver')
+args = parser.parse_args()
+
+db_info = dict(host=args.host, port=args.port, database=args.database,
+               driver=args.driver)
+
+desc.imsimdeep.make_tiled_index_files(
+    args.ra, args.dec, args.radius, args.index_id, nside=args.nside,
+    margin=args.margin, max_scale_number=args.max_scale,
+    output_dir=args.output_dir, processes=args.processes,
+    star_source=desc.imsimdeep.CatSimStarSource(db_info))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+Compute the apparent magnitudes and write the per-sensor instance
+catalogs for a visit in one pipelined pass over its instance catalog.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Compute apparent magnitudes and partition a phosim instance catalog by sensor, overlapping the catalog I/O with the computations.')
+parser.add_argument('instance_catalog', type=str,
+                    help='The phosim instance catalog (text or binary)')
+parser.add_argument('outfile', type=str,
+                    help='Output pickle file for the apparent magnitudes')
+parser.add_argument('--outdir', type=str, default='.',
+                    help='Output directory for the per-sensor instance catalogs')
+parser.add_argument('--chunk_size', type=int, default=100000,
+                    help='Number of objects per chunk')
+parser.add_argument('--magnitude_processes', type=int, default=None,
+                    help='Number of processes computing apparent magnitudes')
+parser.add_argument('--chip_processes', type=int, default=None,
+                    help='Number of processes assigning objects to sensors')
+parser.add_argument('--max_pending', type=int, default=None,
+                    help='Maximum number of chunks in flight per stage')
+parser.add_argument('--chip_names', type=str, nargs='+', default=None,
+                    help='Sensors to write, e.g., "R:2,2 S:1,1". Default: all')
+parser.add_argument('--sed_table', type=str, default=None,
+                    help='SED photometry table from build_sed_photometry_table.py')
+args = parser.parse_args()
+
+app_mags = desc.imsimdeep.run_visit_pipeline(
+    args.instance_catalog, args.outdir, chunk_size=args.chunk_size,
+    magnitude_processes=args.magnitude_processes,
+    chip_processes=args.chip_processes, max_pending=args.max_pending,
+    chip_names=args.chip_names, sed_table_file=args.sed_table)
+app_mags.to_pickle(args.outfile)
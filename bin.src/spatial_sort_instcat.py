@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+"""
+Sort the object lines of a phosim instance catalog along a Hilbert
+curve and write the block index used for partial reads.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import desc.imsimdeep
+
+parser = argparse.ArgumentParser(description='Spatially sort a phosim instance catalog and write its block index, <outfile>.blocks.json.')
+parser.add_argument('instance_catalog', type=str,
+                    help='The text phosim instance catalog')
+parser.add_argument('--outfile', type=str, default=None,
+                    help='Sorted instance catalog. Default: sort in place')
+parser.add_argument('--block_size', type=int, default=10000,
+                    help='Number of objects per block of the index')
+args = parser.parse_args()
+
+desc.imsimdeep.spatial_sort_instcat(args.instance_catalog,
+                                    outfile=args.outfile,
+                                    block_size=args.block_size)
@@ -5,10 +5,37 @@ the LSST Stack.
 from __future__ import absolute_import, print_function
 import os
 import copy
+import numpy as np
 import lsst.sims.photUtils as photUtils
 import lsst.utils as lsstUtils
+from .profiling import profiled
 
-__all__ = ['ApparentMagnitude']
+__all__ = ['ApparentMagnitude', 'lsst_bandpasses']
+
+_bandpasses = dict()
+
+def lsst_bandpasses():
+    """
+    The LSST bandpasses and the imsim bandpass, read once per process.
+
+    Returns
+    -------
+    (dict, lsst.photUtils.Bandpass)
+        Dictionary of LSST bandpasses keyed by band and the "imsim
+        bandpass" used to set magnorm.
+    """
+    if not _bandpasses:
+        throughput_dir = lsstUtils.getPackageDir('throughputs')
+        for band in 'ugrizy':
+            _bandpasses[band] = photUtils.Bandpass()
+            _bandpasses[band].readThroughput(os.path.join(throughput_dir,
+                                                          'baseline',
+                                                          'total_%s.dat'
+                                                          % band))
+        _bandpasses['imsim'] = photUtils.Bandpass()
+        _bandpasses['imsim'].imsimBandpass()
+    return (dict((band, _bandpasses[band]) for band in 'ugrizy'),
+            _bandpasses['imsim'])
 
 class ApparentMagnitude(object):
     """
@@ -24,37 +51,103 @@ class ApparentMagnitude(object):
     control_bandpass : lsst.photUtils.Bandpass instance
         The "imsim bandpass" which is used to set magnorm of an object's
         spectrum.
+    sed_file : str
+        Full path to the SED file.
     sed_unnormed : lsst.photUtils.Sed object
         The un-normalized SED.
     max_mag : float
         Sentinal value for underflows of Sed.calcMag
+    mag_offsets : dict or None
+        Precomputed band magnitude - imsim bandpass magnitude for the
+        un-normalized SED, from a SedPhotometryTable, if available.
     """
-    def __init__(self, sed_name, max_mag=1000.):
+    @profiled('ApparentMagnitude.__init__')
+    def __init__(self, sed_name, max_mag=1000., sed_table=None):
         """
         Set up the LSST bandpasses and un-normalized SED.
+
+        Parameters
+        ----------
+        sed_name : str
+            SED file name relative to the sims_sed_library directory.
+        max_mag : float, optional
+            Sentinal value for underflows of Sed.calcMag.  Default: 1000.
+        sed_table : desc.imsimdeep.SedPhotometryTable, optional
+            Precomputed synthetic photometry used for objects without
+            dust extinction or redshift.  Default: None
         """
-        self.bps = dict()
-        throughput_dir = lsstUtils.getPackageDir('throughputs')
-        for band in 'ugrizy':
-            self.bps[band] = photUtils.Bandpass()
-            self.bps[band].readThroughput(os.path.join(throughput_dir,
-                                                       'baseline',
-                                                       'total_%s.dat' % band))
+        self.bps, self.control_bandpass = lsst_bandpasses()
 
-        self.control_bandpass = photUtils.Bandpass()
-        self.control_bandpass.imsimBandpass()
+        self.mag_offsets = None
+        if sed_table is not None and sed_name in sed_table:
+            self.mag_offsets = sed_table.mag_offsets(sed_name)
 
         sed_dir = lsstUtils.getPackageDir('sims_sed_library')
-        self.sed_unnormed = photUtils.Sed()
-        self.sed_unnormed.readSED_flambda(os.path.join(sed_dir, sed_name))
+        self.sed_file = os.path.join(sed_dir, sed_name)
+        self._sed_unnormed = None
         self.max_mag = max_mag
 
+    @property
+    def sed_unnormed(self):
+        """
+        The un-normalized SED, read on first use, since objects whose
+        magnitudes come from the SED photometry table do not need it.
+        """
+        if self._sed_unnormed is None:
+            self._sed_unnormed = photUtils.Sed()
+            self._sed_unnormed.readSED_flambda(self.sed_file)
+        return self._sed_unnormed
+
     def _sed_copy(self):
         """
         Return a copy of the unnormalized SED.
         """
         return copy.deepcopy(self.sed_unnormed)
 
+    def _use_table(self, internalAv, galacticAv, redshift):
+        """
+        Mask of the objects whose magnitudes can be computed from the
+        SED photometry table, i.e., those without dust or redshift.
+        """
+        if self.mag_offsets is None:
+            return np.zeros(np.shape(redshift), dtype=bool)
+        return ((np.asarray(internalAv) == 0) & (np.asarray(galacticAv) == 0)
+                & (np.asarray(redshift) <= 0))
+
+    def _table_mags(self, magNorm, band):
+        "Magnitudes from magnorm plus the precomputed offset for the band."
+        mags = np.asarray(magNorm) + self.mag_offsets[band]
+        return np.where(np.isfinite(mags), mags, self.max_mag)
+
+    def magnitudes(self, objs, band):
+        """
+        Compute the apparent magnitudes of a set of objects with this
+        SED, using the SED photometry table where possible.
+
+        Parameters
+        ----------
+        objs : pandas.DataFrame
+            The instance catalog objects.
+        band : str
+            The LSST band ('u', 'g', 'r', 'i', 'z', or 'y') to use for
+            the apparent magnitude calculation.
+
+        Returns
+        -------
+        numpy.array
+            The apparent magnitudes in the desired band.
+        """
+        mags = np.zeros(len(objs))
+        use_table = self._use_table(objs['internalAv'].values,
+                                    objs['galacticAv'].values,
+                                    objs['redshift'].values)
+        if np.any(use_table):
+            magNorm = objs['magNorm'].values[use_table]
+            mags[use_table] = self._table_mags(magNorm, band)
+        for i in np.where(~use_table)[0]:
+            mags[i] = self(objs.iloc[i], band)
+        return mags
+
     def __call__(self, pars, band):
         """
         Compute the object's SED in the observer frame.
@@ -73,6 +166,11 @@ class ApparentMagnitude(object):
         float
             The apparent magnitude in the desired band.
         """
+        if self._use_table(pars.internalAv, pars.galacticAv, pars.redshift):
+            # Without dust or redshift, the magnitude is just magnorm
+            # plus the precomputed offset for this band.
+            return float(self._table_mags(pars.magNorm, band))
+
         # Normalize the spectrum to magnorm.
         spectrum = self._sed_copy()
         fnorm = spectrum.calcFluxNorm(pars.magNorm, self.control_bandpass)
@@ -16,6 +16,9 @@ with warnings.catch_warnings():
     from lsst.sims.catUtils.exampleCatalogDefinitions.phoSimCatalogExamples \
         import PhoSimCatalogPoint, PhoSimCatalogSersic2D
 
+from .profiling import profile_stage
+from .spatial_sort import spatial_sort_instcat
+
 __all__ = ['InstanceCatalogMaker']
 
 class InstanceCatalogMaker(object):
@@ -25,6 +28,10 @@ class InstanceCatalogMaker(object):
     Attributes
     ----------
     gen : lsst.sims.catUtils.utils.ObservationMetaDataGenerator
+        Generator used if no visit index is given.
+
+    visit_index : desc.imsimdeep.OpSimVisitIndex or None
+        Visit metadata read in bulk from the opsim db.
 
     db_config : dict
         Dictionary of database connection parameters.
@@ -34,7 +41,8 @@ class InstanceCatalogMaker(object):
     """
     star_objs = ['msstars', 'bhbstars', 'wdstars', 'rrlystars', 'cepheidstars']
     gal_objs = ['galaxyBulge', 'galaxyDisk']
-    def __init__(self, opsim_db, db_config=None, logger=None):
+    def __init__(self, opsim_db, db_config=None, logger=None,
+                 visit_index=None):
         """
         Constructor.
 
@@ -50,9 +58,16 @@ class InstanceCatalogMaker(object):
 
         logger : logging.logger, optional
             Logger object.
+
+        visit_index : desc.imsimdeep.OpSimVisitIndex, optional
+            Visit metadata to use instead of querying the opsim db for
+            each visit, e.g., when making catalogs for many visits.
         """
-        self.gen = ObservationMetaDataGenerator(database=opsim_db,
-                                                driver='sqlite')
+        self.visit_index = visit_index
+        self.gen = None
+        if visit_index is None:
+            self.gen = ObservationMetaDataGenerator(database=opsim_db,
+                                                    driver='sqlite')
         if db_config is not None:
             self.db_config = db_config
         else:
@@ -66,7 +81,8 @@ class InstanceCatalogMaker(object):
             logger = logging.getLogger()
         self.logger = logger
 
-    def make_instance_catalog(self, obsHistID, band, boundLength, outfile=None):
+    def make_instance_catalog(self, obsHistID, band, boundLength, outfile=None,
+                              spatial_sort=False):
         """
         Method to create instance catalogs.
 
@@ -85,29 +101,45 @@ class InstanceCatalogMaker(object):
             File name of the instance catalog to be produced.  If None,
             a default name will be generated, e.g.,
             phosim_input_0000230_r_0.3deg.txt.
+
+        spatial_sort : bool, optional
+            If True, sort the object lines along a Hilbert curve and
+            write a block index of their sky regions for partial reads.
+            Default: False
         """
         if outfile is None:
             outfile = 'phosim_input_%07i_%s_%.1fdeg.txt' % (obsHistID, band,
                                                             boundLength)
+        if self.visit_index is not None:
+            obs_md = self.visit_index.obs_metadata(obsHistID,
+                                                   boundLength=boundLength)
+        else:
             obs_md = self.gen.getObservationMetaData(obsHistID=obsHistID,
                                                      boundLength=boundLength)[0]
         do_header = True
         for objid in self.star_objs:
             self.logger.info("processing %s", objid)
-            db_obj = CatalogDBObject.from_objid(objid, **self.db_config)
-            phosim_object = PhoSimCatalogPoint(db_obj, obs_metadata=obs_md)
-            if do_header:
-                with open(outfile, 'w') as file_obj:
-                    phosim_object.write_header(file_obj)
-                do_header = False
-            phosim_object.write_catalog(outfile, write_mode='a',
-                                        write_header=False,
-                                        chunk_size=20000)
+            with profile_stage('InstanceCatalogMaker.%s' % objid):
+                db_obj = CatalogDBObject.from_objid(objid, **self.db_config)
+                phosim_object = PhoSimCatalogPoint(db_obj, obs_metadata=obs_md)
+                if do_header:
+                    with open(outfile, 'w') as file_obj:
+                        phosim_object.write_header(file_obj)
+                    do_header = False
+                phosim_object.write_catalog(outfile, write_mode='a',
+                                            write_header=False,
+                                            chunk_size=20000)
 
         for objid in self.gal_objs:
             self.logger.info("processing %s", objid)
-            db_obj = CatalogDBObject.from_objid(objid, **self.db_config)
-            phosim_object = PhoSimCatalogSersic2D(db_obj, obs_metadata=obs_md)
-            phosim_object.write_catalog(outfile, write_mode='a',
-                                        write_header=False,
-                                        chunk_size=20000)
+            with profile_stage('InstanceCatalogMaker.%s' % objid):
+                db_obj = CatalogDBObject.from_objid(objid, **self.db_config)
+                phosim_object = PhoSimCatalogSersic2D(db_obj,
+                                                      obs_metadata=obs_md)
+                phosim_object.write_catalog(outfile, write_mode='a',
+                                            write_header=False,
+                                            chunk_size=20000)
+
+        if spatial_sort:
+            with profile_stage('InstanceCatalogMaker.spatial_sort'):
+                spatial_sort_instcat(outfile)
@@ -1,7 +1,88 @@
+"""
+Simulation and analysis tools for use with products from imSim and
+the LSST Stack.
+
+The public names are imported from their submodules on first access
+(PEP 562), so that, e.g., a worker process that only needs
+sky_cone_select does not import matplotlib or the Stack.  For Python
+versions before 3.7, all of the submodules are imported eagerly.
+"""
 from __future__ import absolute_import
-from .ImSimDeep import *
-from .InstanceCatalogMaker import *
-from .instance_catalog_tools import *
-from .instcat_utils import sky_cone_select, ang_sep
-from .build_index_files import *
-from .instcat_comparison import *
+import sys
+import types
+import importlib
+
+# The public names of each submodule.
+_submodule_exports = (
+    ('ImSimDeep', ('ApparentMagnitude', 'lsst_bandpasses')),
+    ('sed_photometry', ('SedPhotometryTable', 'build_sed_photometry_table',
+                        'throughput_version')),
+    ('InstanceCatalogMaker', ('InstanceCatalogMaker',)),
+    ('instance_catalog_tools', ('select_by_chip_name', 'obs_metadata',
+                                'instcat_commands', 'parse_commands',
+                                'chip_center_coords', 'encode_categoricals',
+                                'parse_instcat_lines')),
+    ('instcat_utils', ('ang_sep',)),
+    ('profiling', ('profile_stage', 'profiled', 'stage_registry',
+                   'enable_profiling', 'dump_profile')),
+    ('build_index_files', ('make_refcat', 'refcat_to_astrometry_net_input',
+                           'build_index_files')),
+    ('build_cache', ('BuildManifest', 'file_digest', 'tool_digest')),
+    ('spherical_match', ('SphericalMatcher', 'unit_vectors',
+                         'great_circle_separation')),
+    ('instcat_comparison', ('TruthCatalogIndex', 'calexp_calibration',
+                            'instcat_comparison', 'plot_instcat_comparison',
+                            'plot_instcat_overlay', 'plot_instcat_magnitudes',
+                            'plot_instcat_offset_hists',
+                            'plot_instcat_offsets', 'plot_config')),
+    ('binary_instcat', ('BinaryInstanceCatalog', 'text_to_binary',
+                        'binary_to_text', 'is_binary_instcat',
+                        'read_instance_catalog', 'sky_cone_select')),
+    ('instcat_batch', ('find_sensor_catalogs', 'batch_instcat_comparison',
+                       'write_batch_results')),
+    ('photometry', ('MagFromAdu', 'residual_statistics')),
+    ('visit_pipeline', ('instcat_chunks', 'run_visit_pipeline')),
+    ('magnitude_cache', ('MagnitudeCache',)),
+    ('opsim_visits', ('OpSimVisitIndex',)),
+    ('spatial_sort', ('spatial_sort_instcat', 'read_block_index',
+                      'sorted_cone_select')),
+    ('chip_assignment', ('chip_codes', 'parallel_chip_names')),
+    ('tiled_refcat', ('CatSimStarSource', 'sky_tiles', 'tile_cone',
+                      'write_refcat_fits', 'make_tiled_index_files')),
+)
+
+_exports = dict((name, submodule) for submodule, names in _submodule_exports
+                for name in names)
+
+__all__ = [name for _, names in _submodule_exports for name in names]
+
+class _Package(types.ModuleType):
+    """
+    Importing a submodule binds it as an attribute of the package,
+    which would hide an exported function of the same name, e.g.,
+    instcat_comparison.  Bind the exported object instead.
+    """
+    def __setattr__(self, name, value):
+        if (_exports.get(name) == name and isinstance(value, types.ModuleType)
+                and value.__name__ == '%s.%s' % (__name__, name)):
+            value = getattr(value, name)
+        super(_Package, self).__setattr__(name, value)
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    module = importlib.import_module('.' + _exports[name], __name__)
+    globals()[name] = getattr(module, name)
+    return globals()[name]
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+if sys.version_info < (3, 7):
+    for _submodule, _names in _submodule_exports:
+        _module = importlib.import_module('.' + _submodule, __name__)
+        for _name in _names:
+            globals()[_name] = getattr(_module, _name)
+else:
+    sys.modules[__name__].__class__ = _Package
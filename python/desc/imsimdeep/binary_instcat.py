@@ -0,0 +1,409 @@
+"""
+Binary, memory-mappable representation of PhoSim instance catalogs.
+
+A binary instance catalog is a directory containing the following
+files:
+
+header.json
+    The format name and version, the physics commands (as returned
+    by instcat_commands), the non-object lines of the text file with
+    their line numbers, the number of object lines, and the
+    dictionaries of the categorical columns.
+object_text.bin, object_offsets.npy
+    The bytes of the object lines, without line terminators, and the
+    int64 offsets of the start of each line in object_text.bin, with
+    a final entry for the end of the last line.  These reproduce the
+    text catalog exactly.
+coord_ra.npy, coord_dec.npy
+    The RA and Dec values in degrees from the third and fourth tokens
+    of the object lines, as used for cone selections.
+object_<name>.npy
+    The columns of the object data frame produced by
+    desc.imsim.parsePhoSimInstanceFile, with string columns stored
+    as int32 codes into dictionaries in header.json.  These are read
+    back as pandas categoricals.
+    object_index.npy has the data frame index.
+
+The .npy arrays are read with numpy.load(..., mmap_mode='r') and
+object_text.bin with numpy.memmap.
+
+desc.imsim and the Stack are imported only by the functions that parse
+object lines, so that the cone selections need only numpy and
+instcat_utils.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import json
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from .spherical_match import great_circle_separation
+from .profiling import profiled
+from . import instcat_utils
+
+__all__ = ['BinaryInstanceCatalog', 'text_to_binary', 'binary_to_text',
+           'is_binary_instcat', 'read_instance_catalog', 'sky_cone_select']
+
+format_name = 'imsimdeep_binary_instcat'
+format_version = 2
+
+def is_binary_instcat(path):
+    """
+    Determine if a path is a binary instance catalog.
+
+    Parameters
+    ----------
+    path : str
+        The file or directory name.
+
+    Returns
+    -------
+    bool
+    """
+    return os.path.isfile(os.path.join(path, 'header.json'))
+
+def _encode_categorical(column):
+    "Encode a column of strings as int32 codes and a dictionary."
+    codes, dictionary = pd.factorize(column)
+    return codes.astype(np.int32), [str(x) for x in dictionary]
+
+def text_to_binary(instcat_file, outdir, parse_objects=True):
+    """
+    Convert a text instance catalog to the binary format.
+
+    The object lines are copied verbatim, and only their RA and Dec
+    tokens are converted, so the text is parsed once, by
+    desc.imsim.parsePhoSimInstanceFile, if the object data frame is
+    requested.
+
+    Parameters
+    ----------
+    instcat_file : str
+        The text instance catalog.
+    outdir : str
+        The output directory.
+    parse_objects : bool, optional
+        If True, also store the object data frame from
+        desc.imsim.parsePhoSimInstanceFile.  Default: True
+    """
+    from .instance_catalog_tools import parse_commands
+    try:
+        os.makedirs(outdir)
+    except OSError:
+        pass
+
+    header_lines = []
+    offsets = [0]
+    ra, dec = [], []
+    trailing_newline = True
+    with open(instcat_file, 'rb') as input_, \
+            open(os.path.join(outdir, 'object_text.bin'), 'wb') as output:
+        for line_number, line in enumerate(input_):
+            trailing_newline = line.endswith(b'\n')
+            text = line[:-1] if trailing_newline else line
+            if not text.startswith(b'object'):
+                header_lines.append((line_number, text.decode('utf-8')))
+                continue
+            output.write(text)
+            offsets.append(offsets[-1] + len(text))
+            tokens = text.split(None, 4)
+            ra.append(float(tokens[2]))
+            dec.append(float(tokens[3]))
+    nrows = len(offsets) - 1
+    np.save(os.path.join(outdir, 'object_offsets.npy'),
+            np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(outdir, 'coord_ra.npy'), np.array(ra))
+    np.save(os.path.join(outdir, 'coord_dec.npy'), np.array(dec))
+    del ra, dec, offsets
+
+    object_columns = []
+    if parse_objects:
+        import desc.imsim
+        objects = desc.imsim.parsePhoSimInstanceFile(instcat_file).objects
+        np.save(os.path.join(outdir, 'object_index.npy'),
+                np.asarray(objects.index))
+        for name in objects.columns:
+            column = objects[name]
+            if column.dtype.kind in 'biuf':
+                np.save(os.path.join(outdir, 'object_%s.npy' % name),
+                        column.values)
+                object_columns.append(dict(name=name, dictionary=None))
+            else:
+                codes, dictionary = _encode_categorical(column.values)
+                np.save(os.path.join(outdir, 'object_%s.npy' % name), codes)
+                object_columns.append(dict(name=name, dictionary=dictionary))
+
+    commands = parse_commands([text for _, text in header_lines])
+    header = dict(format=format_name, version=format_version,
+                  commands=commands, header_lines=header_lines,
+                  num_objects=nrows, trailing_newline=trailing_newline,
+                  object_columns=object_columns)
+    with open(os.path.join(outdir, 'header.json'), 'w') as output:
+        json.dump(header, output)
+
+class BinaryInstanceCatalog(object):
+    """
+    Reader for binary instance catalogs.
+
+    Attributes
+    ----------
+    path : str
+        The binary instance catalog directory.
+    header : dict
+        The contents of header.json.
+    commands : dict
+        The PhoSim instance catalog physics commands.
+    """
+    def __init__(self, path, mmap_mode='r'):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        path : str
+            The binary instance catalog directory.
+        mmap_mode : str, optional
+            Memory-map mode passed to numpy.load.  Default: 'r'
+        """
+        self.path = path
+        self._mmap_mode = mmap_mode
+        with open(os.path.join(path, 'header.json')) as input_:
+            self.header = json.load(input_)
+        if self.header.get('format') != format_name:
+            raise RuntimeError('%s is not a binary instance catalog' % path)
+        if self.header['version'] != format_version:
+            raise RuntimeError('Unsupported binary instance catalog version: %s'
+                               % self.header['version'])
+        self.commands = self.header['commands']
+
+    def __len__(self):
+        return self.header['num_objects']
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.path, filename),
+                       mmap_mode=self._mmap_mode)
+
+    def coordinates(self):
+        """
+        The RA and Dec values of the object lines.
+
+        Returns
+        -------
+        (numpy.array, numpy.array)
+            The RA and Dec values in degrees.
+        """
+        return self._load('coord_ra.npy'), self._load('coord_dec.npy')
+
+    def object_lines(self, rows=None):
+        """
+        The object lines, exactly as in the text catalog.
+
+        Parameters
+        ----------
+        rows : numpy.array, optional
+            Row indexes or boolean mask of the objects to return.
+            Default: None (i.e., all rows)
+
+        Returns
+        -------
+        list of str
+            The lines, without line terminators.
+        """
+        rows = np.arange(len(self))[slice(None) if rows is None else rows]
+        offsets = self._load('object_offsets.npy')
+        text_file = os.path.join(self.path, 'object_text.bin')
+        if offsets[-1] == 0:
+            return ['']*len(rows)
+        text = np.memmap(text_file, dtype=np.uint8, mode='r')
+        return [text[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+                for row in rows]
+
+    def lines(self, rows=None):
+        """
+        The lines of the text catalog in their original order, with
+        the object lines restricted to the selected rows.
+
+        Parameters
+        ----------
+        rows : numpy.array, optional
+            Sorted row indexes or boolean mask of the objects to
+            include.  Default: None (i.e., all rows)
+
+        Returns
+        -------
+        generator of str
+            The lines, without line terminators.
+        """
+        rows = np.arange(len(self))[slice(None) if rows is None else rows]
+        header_lines = self.header['header_lines']
+        # The line numbers in the text catalog of the selected objects.
+        line_numbers = np.setdiff1d(np.arange(len(header_lines) + len(self)),
+                                    [x[0] for x in header_lines])[rows]
+        object_lines = self.object_lines(rows)
+        i = 0
+        for line_number, text in header_lines:
+            while i < len(rows) and line_numbers[i] < line_number:
+                yield object_lines[i]
+                i += 1
+            yield text
+        for line in object_lines[i:]:
+            yield line
+
+    def objects(self, numRows=None):
+        """
+        The object data frame as produced by
+        desc.imsim.parsePhoSimInstanceFile, but with string columns
+        as pandas categoricals.
+
+        Parameters
+        ----------
+        numRows : int, optional
+            Number of lines from the top of the text catalog, including
+            the command lines, to read.  Default: None (i.e., all)
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if not self.header['object_columns']:
+            raise RuntimeError('%s does not contain the parsed object columns'
+                               % self.path)
+        index = self._load('object_index.npy')
+        nrows = len(index)
+        if numRows is not None:
+            nrows = min(nrows, numRows - len([x for x in
+                                              self.header['header_lines']
+                                              if x[0] < numRows]))
+        data = dict()
+        names = []
+        for column in self.header['object_columns']:
+            name = column['name']
+            values = self._load('object_%s.npy' % name)[:nrows]
+            if column['dictionary'] is not None:
+                values = pd.Categorical.from_codes(np.asarray(values),
+                                                   column['dictionary'])
+            data[name] = values
+            names.append(name)
+        return pd.DataFrame(data, columns=names,
+                            index=index[:nrows])
+
+def binary_to_text(path, outfile):
+    """
+    Write the text instance catalog from a binary instance catalog.
+
+    Parameters
+    ----------
+    path : str
+        The binary instance catalog directory.
+    outfile : str
+        The output text file.
+    """
+    catalog = BinaryInstanceCatalog(path)
+    with open(outfile, 'w') as output:
+        output.write('\n'.join(catalog.lines()))
+        num_lines = len(catalog.header['header_lines']) + len(catalog)
+        if num_lines > 0 and catalog.header['trailing_newline']:
+            output.write('\n')
+
+def _concat_objects(frames):
+    """
+    Concatenate object data frames, merging the categories of the
+    categorical columns.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    for column in frames[0].columns:
+        if frames[0][column].dtype.name != 'category':
+            continue
+        categories = union_categoricals([frame[column] for frame in frames],
+                                        ignore_order=True).categories
+        for frame in frames:
+            frame[column] = frame[column].cat.set_categories(categories)
+    # Renumber default indexes, which restart at zero for each chunk.
+    default_index = all(frame.index.equals(pd.RangeIndex(len(frame)))
+                        for frame in frames)
+    return pd.concat(frames, ignore_index=default_index)
+
+def read_instance_catalog(instcat, numRows=None, chunk_size=1000000):
+    """
+    Read the commands and objects of a text or binary instance catalog,
+    with the sedFilepath and galSimType columns as pandas categoricals.
+
+    Text catalogs are read once and parsed from memory in chunks of
+    object lines, whose string columns are encoded before the next
+    chunk is parsed, so that the string columns of the full catalog are
+    never in memory at once.
+
+    Parameters
+    ----------
+    instcat : str
+        The text file or binary instance catalog directory.
+    numRows : int, optional
+        Number of lines from the top of the text catalog, including
+        the command lines, to read.  Default: None (i.e., all)
+    chunk_size : int, optional
+        Number of object lines of text catalogs to parse at a time.
+        Default: 1000000
+
+    Returns
+    -------
+    (dict, pandas.DataFrame)
+        The physics commands and the object data frame.
+    """
+    if is_binary_instcat(instcat):
+        catalog = BinaryInstanceCatalog(instcat)
+        return catalog.commands, catalog.objects(numRows=numRows)
+    import desc.imsim
+    from .instance_catalog_tools import parse_instcat_lines, \
+        encode_categoricals
+    if numRows is not None:
+        commands, objs = desc.imsim.parsePhoSimInstanceFile(instcat,
+                                                            numRows=numRows)
+        return commands, encode_categoricals(objs)
+    from .visit_pipeline import instcat_chunks
+    header_lines, chunks = instcat_chunks(instcat, chunk_size=chunk_size)
+    frames = []
+    for object_lines in chunks:
+        commands, objs = parse_instcat_lines(header_lines, object_lines)
+        frames.append(encode_categoricals(objs))
+    if not frames:
+        commands, objs = desc.imsim.parsePhoSimInstanceFile(instcat)
+        return commands, encode_categoricals(objs)
+    return commands, _concat_objects(frames)
+
+@profiled()
+def sky_cone_select(infile, ra, dec, radius, outfile):
+    """
+    Write the text instance catalog lines of objects within a cone.
+    Spatially sorted text catalogs with a current block index are read
+    only over the blocks that overlap the cone.
+
+    Parameters
+    ----------
+    infile : str
+        The text file or binary instance catalog directory.
+    ra : float
+        RA of the cone center in degrees.
+    dec : float
+        Dec of the cone center in degrees.
+    radius : float
+        Cone radius in degrees.
+    outfile : str
+        The output text instance catalog.
+    """
+    if not is_binary_instcat(infile):
+        from .spatial_sort import read_block_index, sorted_cone_select
+        block_index = read_block_index(infile)
+        if block_index is not None:
+            return sorted_cone_select(infile, block_index, ra, dec, radius,
+                                      outfile)
+        return instcat_utils.sky_cone_select(infile, ra, dec, radius, outfile)
+    catalog = BinaryInstanceCatalog(infile)
+    separation = great_circle_separation(ra, dec, *catalog.coordinates())
+    selected = np.where(separation <= radius*3600.)[0]
+    # Write the lines in their original order, each with a newline, as
+    # the text catalog version does.
+    with open(outfile, 'w') as output:
+        for line in catalog.lines(selected):
+            output.write(line + '\n')
+    return None
@@ -0,0 +1,244 @@
+"""
+Manifest-based build cache for multi-stage file production pipelines,
+e.g., reference catalog -> FITS table -> astrometry.net index files.
+
+Each stage is recorded in a JSON manifest with the inputs that
+determined its outputs (parameters, content digests of input files,
+tool digests) and content digests of the output files.  A stage whose
+recorded inputs match the current ones and whose outputs are still on
+disk and unmodified can be skipped.
+"""
+from __future__ import absolute_import, print_function
+import os
+import json
+import hashlib
+import subprocess
+try:
+    from shutil import which
+except ImportError:
+    # Python 2
+    from distutils.spawn import find_executable as which
+
+__all__ = ['BuildManifest', 'file_digest', 'tool_digest']
+
+def file_digest(path, blocksize=2**20):
+    """
+    Compute the sha1 content digest of a file.
+
+    Parameters
+    ----------
+    path : str
+        The file name.
+    blocksize : int, optional
+        Number of bytes to read at a time.  Default: 2**20
+
+    Returns
+    -------
+    str
+        The hex digest of the file contents.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as input_:
+        while True:
+            chunk = input_.read(blocksize)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def tool_digest(executable):
+    """
+    Identify the version of an executable by the content digest of the
+    file found on the PATH.
+
+    Parameters
+    ----------
+    executable : str
+        Name of the executable, e.g., 'build-astrometry-index'.
+
+    Returns
+    -------
+    str or None
+        The hex digest of the executable or None if it is not on the PATH.
+    """
+    path = which(executable)
+    if path is None:
+        return None
+    return file_digest(path)
+
+def _normalize(inputs):
+    "Convert inputs to their JSON representation for comparison."
+    return json.loads(json.dumps(inputs, sort_keys=True))
+
+class BuildManifest(object):
+    """
+    Record of the inputs and outputs of the stages of a build.
+
+    Attributes
+    ----------
+    manifest_file : str or None
+        JSON file in which the manifest is persisted.  If None, nothing
+        is persisted, and no stage is ever considered current.
+    stages : dict
+        Dictionary of stage entries, keyed by stage name.
+    """
+    def __init__(self, manifest_file=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        manifest_file : str, optional
+            JSON file for the manifest.  If it exists, previous stage
+            records are read from it.  Default: None
+        """
+        self.manifest_file = manifest_file
+        self.stages = dict()
+        self._digests = dict()
+        if manifest_file is not None and os.path.isfile(manifest_file):
+            with open(manifest_file) as input_:
+                contents = json.load(input_)
+            self.stages = contents.get('stages', dict())
+            self._digests = contents.get('digests', dict())
+
+    def file_digest(self, path):
+        """
+        Content digest of a file, reusing a previously computed value
+        if the file size and modification time are unchanged.
+
+        Parameters
+        ----------
+        path : str
+            The file name.
+
+        Returns
+        -------
+        str
+            The hex digest of the file contents.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self._digests.get(path)
+        if (cached is not None and cached['size'] == stat.st_size
+                and cached['mtime'] == stat.st_mtime):
+            return cached['digest']
+        digest = file_digest(path)
+        self._digests[path] = dict(size=stat.st_size, mtime=stat.st_mtime,
+                                   digest=digest)
+        return digest
+
+    def is_current(self, stage, inputs, outputs):
+        """
+        Determine if a stage can be skipped.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        inputs : dict
+            JSON-serializable dictionary of the stage inputs.
+        outputs : sequence
+            Output file names of the stage.
+
+        Returns
+        -------
+        bool
+            True if the recorded inputs match and the outputs exist with
+            the recorded content digests.
+        """
+        if self.manifest_file is None or stage not in self.stages:
+            return False
+        entry = self.stages[stage]
+        if entry['inputs'] != _normalize(inputs):
+            return False
+        if sorted(entry['outputs']) != sorted(os.path.abspath(x)
+                                              for x in outputs):
+            return False
+        for path, digest in entry['outputs'].items():
+            if not os.path.isfile(path) or self.file_digest(path) != digest:
+                return False
+        return True
+
+    def record(self, stage, inputs, outputs):
+        """
+        Record the inputs and output digests of a completed stage and
+        write the manifest file.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        inputs : dict
+            JSON-serializable dictionary of the stage inputs.
+        outputs : sequence
+            Output file names of the stage.
+        """
+        self.stages[stage] = dict(inputs=_normalize(inputs),
+                                  outputs=dict((os.path.abspath(x),
+                                                self.file_digest(x))
+                                               for x in outputs))
+        self.write()
+
+    def invalidate(self, stage):
+        """
+        Remove the record of a stage, e.g., before it is re-run.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        """
+        if self.stages.pop(stage, None) is not None:
+            self.write()
+
+    def run_stage(self, stage, inputs, outputs, func, *args, **kwargs):
+        """
+        Run a stage function unless the stage is current.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        inputs : dict
+            JSON-serializable dictionary of the stage inputs.
+        outputs : sequence
+            Output file names of the stage.
+        func : callable or str
+            Function to run to produce the outputs, or a shell command.
+            Additional positional and keyword arguments are passed to
+            the function.  A RuntimeError is raised if a shell
+            command fails or does not produce all of the outputs.
+
+        Returns
+        -------
+        bool
+            True if the stage was run, False if it was skipped.
+        """
+        if self.is_current(stage, inputs, outputs):
+            print('skipping %s: outputs are up-to-date' % stage)
+            return False
+        self.invalidate(stage)
+        if isinstance(func, str):
+            print(func)
+            status = subprocess.call(func, shell=True)
+            if status != 0:
+                raise RuntimeError('stage %s failed with exit status %i: %s'
+                                   % (stage, status, func))
+            missing = [x for x in outputs if not os.path.isfile(x)]
+            if missing:
+                raise RuntimeError('stage %s did not produce %s: %s'
+                                   % (stage, ', '.join(missing), func))
+        else:
+            func(*args, **kwargs)
+        self.record(stage, inputs, outputs)
+        return True
+
+    def write(self):
+        "Write the manifest file, replacing any previous version atomically."
+        if self.manifest_file is None:
+            return
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as output:
+            json.dump(dict(stages=self.stages, digests=self._digests), output,
+                      indent=2, sort_keys=True)
+        os.rename(tmp_file, self.manifest_file)
@@ -4,8 +4,6 @@ catalog generated by InstanceCatalog.write_catalog.
 """
 from __future__ import absolute_import, print_function
 import os
-import shutil
-import glob
 import subprocess
 import numpy
 try:
@@ -17,6 +15,8 @@ except ImportError:
     from lsst.sims.catalogs.generation.db import CatalogDBObject
 from lsst.sims.catUtils.utils import ObservationMetaDataGenerator
 from lsst.sims.catUtils.mixins import AstrometryStars, PhotometryStars
+from .build_cache import BuildManifest, tool_digest
+from .profiling import profile_stage, profiled
 
 __all__ = ['make_refcat', 'refcat_to_astrometry_net_input', 'build_index_files']
 
@@ -36,8 +36,9 @@ class SimulationReference(InstanceCatalog, AstrometryStars, PhotometryStars):
     default_formats = {'S': '%s', 'f': '%.8f', 'i': '%i'}
     transformations = {'raJ2000': numpy.degrees, 'decJ2000': numpy.degrees}
 
+@profiled()
 def make_refcat(opsim_db, obsHistID, boundLength, outfile,
-                catsim_db_info=None, chunk_size=20000):
+                catsim_db_info=None, chunk_size=20000, visit_index=None):
     """
     Create a reference catalog of stars to use for astrometry from the
     CatSim db tables.
@@ -57,17 +58,27 @@ def make_refcat(opsim_db, obsHistID, boundLength, outfile,
         database.  Default: connection info for the UW fatboy server.
     chunk_size : int, optional
         The memory chunk size to pass to InstanceCatalog.write_catalog
+    visit_index : desc.imsimdeep.OpSimVisitIndex, optional
+        Visit metadata to use instead of querying opsim_db.
+        Default: None
     """
     if catsim_db_info is None:
         catsim_db_info = catsim_uw
-    generator = ObservationMetaDataGenerator(database=opsim_db, driver='sqlite')
-    obs_metadata = generator.getObservationMetaData(obsHistID=obsHistID,
-                                                    boundLength=boundLength)[0]
+    if visit_index is not None:
+        obs_metadata = visit_index.obs_metadata(obsHistID,
+                                                boundLength=boundLength)
+    else:
+        generator = ObservationMetaDataGenerator(database=opsim_db,
+                                                 driver='sqlite')
+        obs_metadata \
+            = generator.getObservationMetaData(obsHistID=obsHistID,
+                                               boundLength=boundLength)[0]
     stars = CatalogDBObject.from_objid('allstars', **catsim_db_info)
     ref_stars = SimulationReference(stars, obs_metadata=obs_metadata)
     ref_stars.write_catalog(outfile, write_mode='w', write_header=True,
                             chunk_size=chunk_size)
 
+@profiled()
 def refcat_to_astrometry_net_input(refcat_file, outfile=None):
     """
     Convert an ascii reference catalog to a FITS file in the form of a
@@ -94,7 +105,8 @@ def refcat_to_astrometry_net_input(refcat_file, outfile=None):
 
     return outfile
 
-def build_index_files(ref_file, index_id, max_scale_number=4, output_dir='.'):
+def build_index_files(ref_file, index_id, max_scale_number=4, output_dir='.',
+                      manifest=None, write_config=True):
     """
     Generate astrometry.net index files from a reference file of stars.
 
@@ -108,30 +120,61 @@ def build_index_files(ref_file, index_id, max_scale_number=4, output_dir='.'):
         Maximum scale for generating index files. Default: 4
     output_dir : str
         Output directory for index files. Default: '.'
+    manifest : desc.imsimdeep.BuildManifest, optional
+        Build manifest used to skip index files (and the andConfig.py
+        file) whose inputs are unchanged since a previous run.
+        Default: None, i.e., build everything.
+    write_config : bool, optional
+        If True, write the andConfig.py file listing the index files.
+        Default: True
+
+    Returns
+    -------
+    list of str
+        The index filenames, relative to output_dir.
     """
+    if manifest is None:
+        manifest = BuildManifest()
+    try:
+        os.makedirs(output_dir)
+    except OSError:
+        pass
+    build_tool = tool_digest('build-astrometry-index')
+
     file_ext = '%(index_id)s00' % locals()
     index_file_00 = 'index-%(file_ext)s.fits' % locals()
+    index_path_00 = os.path.join(output_dir, index_file_00)
+    log_file = os.path.join(output_dir, 'build-00.log')
     index_files = [index_file_00]
-    command = 'build-astrometry-index -i %(ref_file)s -o %(index_file_00)s -I %(file_ext)s -P 0 -S r -n 100 -L 20 -E -j 0.4 -r 1 > build-00.log' % locals()
-    print(command)
-    subprocess.call(command, shell=True)
+    command = 'build-astrometry-index -i %(ref_file)s -o %(index_path_00)s -I %(file_ext)s -P 0 -S r -n 100 -L 20 -E -j 0.4 -r 1 > %(log_file)s' % locals()
+    inputs = dict(ref_file=manifest.file_digest(ref_file), command=command,
+                  build_tool=build_tool)
+    with profile_stage('build_index_files'):
+        manifest.run_stage('index-%s' % file_ext, inputs, [index_path_00],
+                           command)
+
     for scale_number in range(1, max_scale_number+1):
         file_ext = '%(index_id)s%(scale_number)02i' % locals()
         index_file = 'index-%(file_ext)s.fits' % locals()
-        command = 'build-astrometry-index -1 %(index_file_00)s -o %(index_file)s -I %(file_ext)s -P %(scale_number)i -S r -L 20 -E -M -j 0.4 > build-%(scale_number)02i.log' % locals()
-        print(command)
-        subprocess.call(command, shell=True)
+        index_path = os.path.join(output_dir, index_file)
+        log_file = os.path.join(output_dir, 'build-%02i.log' % scale_number)
+        command = 'build-astrometry-index -1 %(index_path_00)s -o %(index_path)s -I %(file_ext)s -P %(scale_number)i -S r -L 20 -E -M -j 0.4 > %(log_file)s' % locals()
+        inputs = dict(index_file_00=manifest.file_digest(index_path_00),
+                      command=command, build_tool=build_tool)
+        with profile_stage('build_index_files'):
+            manifest.run_stage('index-%s' % file_ext, inputs, [index_path],
+                               command)
         index_files.append(index_file)
-    if output_dir != '.':
-        try:
-            os.makedirs(output_dir)
-        except OSError:
-            pass
-        for item in index_files:
-            shutil.move(item, os.path.join(output_dir, item))
-        for item in glob.glob('build-??.log'):
-            shutil.move(item, os.path.join(output_dir, item))
-    write_and_config_py(index_files, output_dir)
+
+    if write_config:
+        config_file = os.path.join(output_dir, 'andConfig.py')
+        inputs = dict((item,
+                       manifest.file_digest(os.path.join(output_dir, item)))
+                      for item in index_files
+                      if os.path.isfile(os.path.join(output_dir, item)))
+        manifest.run_stage('andConfig', inputs, [config_file],
+                           write_and_config_py, index_files, output_dir)
+    return index_files
 
 def write_and_config_py(index_files, output_dir):
     """
@@ -0,0 +1,150 @@
+"""
+Parallel assignment of objects to sensors.
+
+The RA, Dec arrays are copied once into shared memory that the worker
+processes inherit, and each worker runs chipNameFromRaDec on a range
+of indexes and writes integer chip codes into a shared output array,
+so that no coordinate or name arrays are pickled.  Passing the shared
+arrays to the pool initializer relies on the workers inheriting them,
+so the pool always uses the fork start method.  Unless a camera is
+given, each worker constructs its own, and the parent gets the sensor
+names from a worker rather than building another camera.
+"""
+from __future__ import absolute_import, print_function, division
+import multiprocessing
+import numpy as np
+from .profiling import profiled
+
+__all__ = ['chip_codes', 'parallel_chip_names']
+
+try:
+    _fork_context = multiprocessing.get_context('fork')
+except AttributeError:
+    # Python 2 always forks.
+    _fork_context = multiprocessing
+
+# Per-process state of the pool workers, set by _init_worker.
+_worker = dict()
+
+def _detector_names(camera):
+    "The sorted detector names of the camera."
+    return sorted(detector.getName() for detector in camera)
+
+def _init_worker(ra, dec, codes, commands, camera):
+    from .instance_catalog_tools import obs_metadata
+    _worker['ra'] = np.frombuffer(ra, dtype=np.float64)
+    _worker['dec'] = np.frombuffer(dec, dtype=np.float64)
+    _worker['codes'] = np.frombuffer(codes, dtype=np.int32)
+    if camera is None:
+        import lsst.obs.lsstSim as obs_lsstSim
+        camera = obs_lsstSim.LsstSimMapper().camera
+    _worker['camera'] = camera
+    _worker['obs_md'] = (obs_metadata(commands) if isinstance(commands, dict)
+                         else commands)
+    _worker['code_map'] = dict((name, i) for i, name in
+                               enumerate(_detector_names(_worker['camera'])))
+
+def _worker_detector_names():
+    "The detector names, ordered by code, of a worker's camera."
+    code_map = _worker['code_map']
+    return sorted(code_map, key=code_map.get)
+
+def _assign_chips(start, stop):
+    "Write the chip codes for the objects in [start, stop)."
+    import lsst.sims.coordUtils as coordUtils
+    names = coordUtils.chipNameFromRaDec(_worker['ra'][start:stop],
+                                         _worker['dec'][start:stop],
+                                         camera=_worker['camera'],
+                                         obs_metadata=_worker['obs_md'])
+    code_map = _worker['code_map']
+    _worker['codes'][start:stop] = [-1 if name is None else code_map[name]
+                                    for name in names]
+
+@profiled()
+def chip_codes(ra, dec, commands, processes=None, chunk_size=None,
+               camera=None):
+    """
+    Compute integer codes of the sensors containing each position.
+
+    Parameters
+    ----------
+    ra : numpy.array
+        Right ascension values in degrees.
+    dec : numpy.array
+        Declination values in degrees.
+    commands : dict or lsst.sims.utils.ObservationMetaData
+        Dictionary of phosim instance catalog commands, or the
+        observation metadata itself.
+    processes : int, optional
+        Number of worker processes.
+        Default: None (i.e., multiprocessing.cpu_count())
+    chunk_size : int, optional
+        Number of positions per task.  Default: None (i.e., four
+        tasks per process)
+    camera : lsst.afw.cameraGeom.camera.Camera, optional
+        The camera, which the forked workers inherit.
+        Default: None (i.e., each worker constructs
+        lsst.obs.lsstSim.LsstSimMapper().camera)
+
+    Returns
+    -------
+    (numpy.array, list of str)
+        The int32 chip codes, -1 for positions that do not land on a
+        sensor, and the sensor names indexed by code.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    nobjs = len(ra)
+    if chunk_size is None:
+        chunk_size = max(1, -(-nobjs//(4*processes)))
+    shared_ra = _fork_context.RawArray('d', nobjs)
+    shared_dec = _fork_context.RawArray('d', nobjs)
+    shared_codes = _fork_context.RawArray('i', nobjs)
+    np.frombuffer(shared_ra, dtype=np.float64)[:] = ra
+    np.frombuffer(shared_dec, dtype=np.float64)[:] = dec
+
+    pool = _fork_context.Pool(processes, initializer=_init_worker,
+                              initargs=(shared_ra, shared_dec, shared_codes,
+                                        commands, camera))
+    try:
+        results = [pool.apply_async(_assign_chips,
+                                    (start, min(start + chunk_size, nobjs)))
+                   for start in range(0, nobjs, chunk_size)]
+        for result in results:
+            result.get()
+        detector_names = pool.apply(_worker_detector_names)
+    finally:
+        pool.close()
+        pool.join()
+    return (np.frombuffer(shared_codes, dtype=np.int32).copy(),
+            detector_names)
+
+def parallel_chip_names(ra, dec, commands, processes=None, chunk_size=None):
+    """
+    Parallel version of lsst.sims.coordUtils.chipNameFromRaDec.
+
+    Parameters
+    ----------
+    ra : numpy.array
+        Right ascension values in degrees.
+    dec : numpy.array
+        Declination values in degrees.
+    commands : dict
+        Dictionary of phosim instance catalog commands.
+    processes : int, optional
+        Number of worker processes.
+        Default: None (i.e., multiprocessing.cpu_count())
+    chunk_size : int, optional
+        Number of positions per task.  Default: None (i.e., four
+        tasks per process)
+
+    Returns
+    -------
+    numpy.array
+        The chip names, with None for positions that do not land on a
+        sensor.
+    """
+    codes, detector_names = chip_codes(ra, dec, commands, processes=processes,
+                                       chunk_size=chunk_size)
+    # Code -1 selects the trailing None.
+    return np.array(detector_names + [None], dtype=object)[codes]
@@ -2,17 +2,22 @@
 Tools for manipulating instance catalogs read in as pandas DataFrames.
 """
 from __future__ import absolute_import, print_function, division
+import io
 import os
 import time
+import itertools
 import subprocess
-import psutil
+import numpy as np
 import lsst.sims.coordUtils as coordUtils
 from lsst.sims.photUtils import LSSTdefaults
 from lsst.sims.utils import ObservationMetaData
 import desc.imsim
+from .profiling import profile_stage
+from .chip_assignment import chip_codes
 
 __all__ = ['select_by_chip_name', 'obs_metadata', 'instcat_commands',
-           'chip_center_coords']
+           'parse_commands', 'chip_center_coords', 'encode_categoricals',
+           'parse_instcat_lines']
 
 default_logger = desc.imsim.get_logger("DEBUG")
 
@@ -32,7 +37,8 @@ def instcat_commands(instcat_file, numlines=1000):
     Parameters
     ----------
     instcat_file : str
-        The filename of the instance catalog file.
+        The filename of the instance catalog file or binary instance
+        catalog directory.
     numlines : int, optional
         The number of lines from the top of the file to read. Default: 1000
 
@@ -41,9 +47,28 @@ def instcat_commands(instcat_file, numlines=1000):
     dict
         The PhoSim instance catalog physics commands.
     """
-    phosim_commands = dict()
+    from .binary_instcat import is_binary_instcat, BinaryInstanceCatalog
+    if is_binary_instcat(instcat_file):
+        return BinaryInstanceCatalog(instcat_file).commands
     command = "head -%i %s | grep -v object" % (numlines, instcat_file)
     lines = subprocess.check_output(command, shell=True).split('\n')
+    return parse_commands(lines)
+
+def parse_commands(lines):
+    """
+    Parse PhoSim instance catalog command lines.
+
+    Parameters
+    ----------
+    lines : sequence of str
+        The non-object lines of an instance catalog.
+
+    Returns
+    -------
+    dict
+        The PhoSim instance catalog physics commands.
+    """
+    phosim_commands = dict()
     for line in lines:
         if line.startswith('#'):
             continue
@@ -55,6 +80,53 @@ def instcat_commands(instcat_file, numlines=1000):
     phosim_commands['bandpass'] = 'ugrizy'[phosim_commands['filter']]
     return phosim_commands
 
+def encode_categoricals(objs, columns=('sedFilepath', 'galSimType')):
+    """
+    Convert string columns of an object data frame to pandas
+    categoricals, i.e., integer codes with a shared lookup table.
+
+    Parameters
+    ----------
+    objs : pandas.DataFrame
+        DataFrame of phosim objects.  It is modified in place.
+    columns : sequence of str, optional
+        Columns to convert.  Missing columns are skipped.
+        Default: ('sedFilepath', 'galSimType')
+
+    Returns
+    -------
+    pandas.DataFrame
+        The input DataFrame.
+    """
+    for column in columns:
+        if column in objs and objs[column].dtype.name != 'category':
+            objs[column] = objs[column].astype('category')
+    return objs
+
+def parse_instcat_lines(header_lines, object_lines):
+    """
+    Parse instance catalog lines, e.g., a chunk of a large catalog,
+    with desc.imsim.parsePhoSimInstanceFile.  The lines are parsed
+    from memory, without writing them to a file: parsePhoSimInstanceFile
+    passes its argument to pandas.read_csv, which accepts a file-like
+    object.
+
+    Parameters
+    ----------
+    header_lines : sequence of str
+        The command lines.
+    object_lines : sequence of str
+        The object lines.
+
+    Returns
+    -------
+    (dict, pandas.DataFrame)
+        The physics commands and the object data frame.
+    """
+    text = io.StringIO(u'\n'.join(itertools.chain(header_lines,
+                                                  object_lines)) + u'\n')
+    return desc.imsim.parsePhoSimInstanceFile(text)
+
 def mem_use_message(pid=None):
     """
     Return memory usage string.
@@ -66,6 +138,7 @@ def mem_use_message(pid=None):
     """
     if pid is None:
         pid = os.getpid()
+    import psutil
     process = psutil.Process(pid)
     mem_info = process.memory_full_info()
     return "  memory used: %.3f GB\n" % (mem_info.uss/1024.**3)
@@ -90,7 +163,8 @@ def chip_center_coords(chip_name, obs_md, camera):
                                                  camera=camera,
                                                  obs_metadata=obs_md))
 
-def select_by_chip_name(objs, chip_name, obs_md, camera, logger=default_logger):
+def select_by_chip_name(objs, chip_name, obs_md, camera, logger=default_logger,
+                        processes=None):
     """
     Select only objects that are on the specified chip.
     Parameters
@@ -103,6 +177,9 @@ def select_by_chip_name(objs, chip_name, obs_md, camera, logger=default_logger):
         The camera instance from lsst.obs.lsstSim.LsstSimMapper().
     logger : logging.Logger, optional
         The logger to use.
+    processes : int, optional
+        If given, assign the objects to chips with chip_codes in this
+        many worker processes.  Default: None (i.e., serially)
 
     Returns
     -------
@@ -110,13 +187,22 @@ def select_by_chip_name(objs, chip_name, obs_md, camera, logger=default_logger):
         The DataFrame containing down-selected objects.
     """
     t0 = time.time()
-    my_objs = objs.copy(deep=True)
-    my_objs['chip_name'] = coordUtils.chipNameFromRaDec(my_objs['ra'].values,
-                                                        my_objs['dec'].values,
-                                                        camera=camera,
-                                                        obs_metadata=obs_md)
-    my_objs = my_objs.query('chip_name=="%s"' % chip_name)
-    del my_objs['chip_name']
+    with profile_stage('select_by_chip_name', count=len(objs)):
+        if processes is None:
+            chip_names = coordUtils.chipNameFromRaDec(objs['ra'].values,
+                                                      objs['dec'].values,
+                                                      camera=camera,
+                                                      obs_metadata=obs_md)
+            selected = np.asarray(chip_names) == chip_name
+        else:
+            codes, detector_names = chip_codes(objs['ra'].values,
+                                               objs['dec'].values, obs_md,
+                                               processes=processes,
+                                               camera=camera)
+            selected = (codes == detector_names.index(chip_name)
+                        if chip_name in detector_names
+                        else np.zeros(len(objs), dtype=bool))
+        my_objs = objs[selected]
     logger.debug('select_by_chip_name:\n  elapsed time: %f s',
                  time.time()- t0)
     logger.debug('  # objects remaining: %i', len(my_objs))
@@ -0,0 +1,160 @@
+"""
+Run instcat_comparison over all of the sensors of a list of visits
+using a pool of worker processes, combining the results in a single
+data frame with visit, raft, and sensor columns.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import glob
+import traceback
+import multiprocessing
+import pandas as pd
+from .instcat_comparison import TruthCatalogIndex, instcat_comparison
+
+__all__ = ['find_sensor_catalogs', 'batch_instcat_comparison',
+           'write_batch_results']
+
+def find_sensor_catalogs(repo, visit, catalog_type='forced', tract='0'):
+    """
+    Find the (raft, sensor) pairs with catalogs for a visit.
+
+    Parameters
+    ----------
+    repo : str
+        Output repo containing the Stack catalogs.
+    visit : int
+        Visit number.
+    catalog_type : str, optional
+        Catalog data product to use, either 'forced' or 'src'.
+        Default: 'forced'
+    tract : str, optional
+        Tract to use for forced source catalogs.  Default: '0'
+
+    Returns
+    -------
+    list of (str, str)
+        The raft and sensor ids, e.g., ('2,2', '1,1').
+    """
+    if catalog_type == 'forced':
+        visit_dirs = os.path.join(repo, catalog_type, tract, 'v%i-f*' % visit)
+    else:
+        visit_dirs = os.path.join(repo, catalog_type, 'v%i-f*' % visit)
+    sensors = []
+    for src_file in sorted(glob.glob(os.path.join(visit_dirs, 'R??',
+                                                  'S??.fits'))):
+        raft_name = os.path.basename(os.path.dirname(src_file))
+        sensor_name = os.path.basename(src_file)
+        sensors.append(('%s,%s' % tuple(raft_name[1:3]),
+                        '%s,%s' % tuple(sensor_name[1:3])))
+    return sensors
+
+_truth_index = None
+
+def _init_worker(truth_index):
+    "Pool initializer to set the per-visit TruthCatalogIndex."
+    global _truth_index
+    _truth_index = truth_index
+
+def _process_sensor(args):
+    """
+    Worker function to run instcat_comparison for a single sensor,
+    returning the traceback instead of raising on failure.
+    """
+    repo, visit, raft, sensor, kwds = args
+    try:
+        df = instcat_comparison(_truth_index, repo, visit, raft, sensor,
+                                **kwds)[0]
+    except Exception:
+        return visit, raft, sensor, None, traceback.format_exc()
+    df['visit'] = visit
+    df['raft'] = raft
+    df['sensor'] = sensor
+    return visit, raft, sensor, df, None
+
+def batch_instcat_comparison(app_mag_files, repo, catalog_type='forced',
+                             flux_col='base_PsfFlux_flux', tract='0',
+                             processes=None, **kwds):
+    """
+    Run instcat_comparison for all of the sensors with catalogs for
+    each visit.
+
+    Parameters
+    ----------
+    app_mag_files : dict
+        Dictionary of apparent magnitude files produced by
+        compute_apparent_mags.py, keyed by visit number.
+    repo : str
+        Output repo containing the Stack catalogs.
+    catalog_type : str, optional
+        Catalog data product to use, either 'forced' or 'src'.
+        Default: 'forced'
+    flux_col : str, optional
+        Name of the column in the source catalog to use for the
+        flux measurment.  Default: 'base_PsfFlux_flux'
+    tract : str, optional
+        Tract to use.  Default: '0'
+    processes : int, optional
+        Number of worker processes.  Default: None (i.e., use
+        multiprocessing.cpu_count()).
+    kwds : dict
+        Additional keyword arguments to pass to instcat_comparison,
+        e.g., match_radius.
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, dict)
+        The combined data frame with additional visit, raft, and sensor
+        columns, and a dictionary of tracebacks for the sensors that
+        failed, keyed by (visit, raft, sensor).
+    """
+    kwds.update(dict(catalog_type=catalog_type, flux_col=flux_col,
+                     tract=tract))
+    data_frames = []
+    errors = dict()
+    for visit in sorted(app_mag_files):
+        sensors = find_sensor_catalogs(repo, visit, catalog_type=catalog_type,
+                                       tract=tract)
+        if not sensors:
+            errors[(visit, None, None)] = 'No catalogs found for visit %i' \
+                                          % visit
+            continue
+        try:
+            truth_index = TruthCatalogIndex.read(app_mag_files[visit])
+        except Exception:
+            errors[(visit, None, None)] = traceback.format_exc()
+            continue
+        pool = multiprocessing.Pool(processes=processes,
+                                    initializer=_init_worker,
+                                    initargs=(truth_index,))
+        try:
+            tasks = [(repo, visit, raft, sensor, kwds)
+                     for raft, sensor in sensors]
+            for result in pool.imap_unordered(_process_sensor, tasks):
+                visit_, raft, sensor, df, error = result
+                if error is not None:
+                    errors[(visit_, raft, sensor)] = error
+                else:
+                    data_frames.append(df)
+        finally:
+            pool.close()
+            pool.join()
+    if not data_frames:
+        return pd.DataFrame(), errors
+    return pd.concat(data_frames, ignore_index=True), errors
+
+def write_batch_results(df, outfile):
+    """
+    Write the combined data frame from batch_instcat_comparison.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The combined data frame.
+    outfile : str
+        Output filename.  Files with a .parquet extension are written in
+        Parquet format; otherwise a pickled data frame is written.
+    """
+    if outfile.endswith('.parquet'):
+        df.to_parquet(outfile)
+    else:
+        df.to_pickle(outfile)
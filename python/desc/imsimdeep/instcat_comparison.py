@@ -14,45 +14,54 @@ import numpy as np
 import astropy.io.fits as fits
 import pandas as pd
 import matplotlib.pyplot as plt
-import sklearn.neighbors
 import lsst.afw.image as afwImage
 import lsst.daf.persistence as dp
 import desc.imsim
+from .spherical_match import SphericalMatcher
+from .photometry import MagFromAdu
+from .profiling import profile_stage, profiled
 
-__all__ = ['instcat_comparison', 'plot_instcat_comparison',
-           'plot_instcat_overlay', 'plot_instcat_magnitudes',
-           'plot_instcat_offset_hists', 'plot_instcat_offsets']
+__all__ = ['TruthCatalogIndex', 'calexp_calibration', 'instcat_comparison',
+           'plot_instcat_comparison', 'plot_instcat_overlay',
+           'plot_instcat_magnitudes', 'plot_instcat_offset_hists',
+           'plot_instcat_offsets', 'plot_config']
 
 logger = desc.imsim.get_logger('INFO')
 
-class MagFromAdu(object):
-    "Class to convert from ADU to magnitude given a zero point flux"
-    def __init__(self, fluxmag0):
-        self.fluxmag0 = fluxmag0
-    def __call__(self, counts):
-        """
-        Convert the flux in ADU to the calibrated magnitude
-        from the zero point.
-        """
-        return -2.5*np.log10(counts/self.fluxmag0)
-    def error(self, counts, counts_err):
-        "Convert the error in ADU to magnitude error."
-        return 2.5*np.log10(self.fluxmag0)*counts_err/counts
+# Configuration for the plotting functions: data frames with more than
+# max_points rows are rendered as hexbin densities with the given
+# gridsize, and offset vectors are averaged in offset_bins x
+# offset_bins cells.
+plot_config = dict(max_points=20000, gridsize=100, offset_bins=20)
+
+def _native(column):
+    """
+    Return a copy of a FITS table column as a numpy array with native
+    byte order.
+    """
+    return np.array(column, dtype=column.dtype.newbyteorder('='))
 
 class Level2Catalog(object):
     "Class to encapsulate catalog data."
-    def __init__(self, objectId, coord_ra, coord_dec, flux, fluxerr):
-        self.objectId = np.array(objectId)
-        self.coord_ra = np.array(coord_ra)
-        self.coord_dec = np.array(coord_dec)
-        self.flux = np.array(flux)
-        self.fluxerr = np.array(fluxerr)
+    def __init__(self, objectId, coord_ra, coord_dec, flux, fluxerr,
+                 file_index=None):
+        self.objectId = np.asarray(objectId)
+        self.coord_ra = np.asarray(coord_ra)
+        self.coord_dec = np.asarray(coord_dec)
+        self.flux = np.asarray(flux)
+        self.fluxerr = np.asarray(fluxerr)
+        self.file_index = file_index
+
+    def __len__(self):
+        return len(self.objectId)
 
     @staticmethod
-    def read_src_file(src_file, flux_col='base_PsfFlux_flux'):
+    def read_src_file(src_file, flux_col='base_PsfFlux_flux',
+                      positive_flux=False):
         """
         Read objectId, coordinate, and flux information from forced source
-        files.
+        files.  The binary table is memory-mapped and only the needed
+        columns are copied.
 
         Parameters
         ----------
@@ -60,6 +69,9 @@ class Level2Catalog(object):
             FITS file with the catalog information.
         flux_col : str, optional
             Flux column to use.  Default: 'base_PsfFlux_flux'
+        positive_flux : bool, optional
+            If True, only keep rows with finite, positive fluxes.
+            Default: False
 
         Returns
         -------
@@ -67,20 +79,198 @@ class Level2Catalog(object):
             A Level2Catalog object with objectId, coord_ra, coord_dec, flux,
             fluxerr info.
         """
-        src = fits.open(src_file)
-        if 'objectId' in [x.name for x in src[1].data.columns]:
-            id_colname = 'objectId'
-        else:
-            id_colname = 'id'
-        return Level2Catalog(src[1].data[id_colname],
-                             src[1].data['coord_ra'],
-                             src[1].data['coord_dec'],
-                             src[1].data[flux_col],
-                             src[1].data[flux_col + 'Sigma'])
+        with fits.open(src_file, memmap=True) as src:
+            data = src[1].data
+            if 'objectId' in data.columns.names:
+                id_colname = 'objectId'
+            else:
+                id_colname = 'id'
+            columns = [_native(data.field(colname)) for colname in
+                       (id_colname, 'coord_ra', 'coord_dec', flux_col,
+                        flux_col + 'Sigma')]
+        if positive_flux:
+            flux = columns[3]
+            keep = np.isfinite(flux) & (flux > 0)
+            columns = [column[keep] for column in columns]
+        return Level2Catalog(*columns)
+
+    @staticmethod
+    def read_src_files(src_files, flux_col='base_PsfFlux_flux',
+                       positive_flux=False):
+        """
+        Read and concatenate the objectId, coordinate, and flux
+        information from several forced source files.
+
+        Parameters
+        ----------
+        src_files : sequence
+            FITS files with the catalog information.
+        flux_col : str, optional
+            Flux column to use.  Default: 'base_PsfFlux_flux'
+        positive_flux : bool, optional
+            If True, only keep rows with finite, positive fluxes.
+            Default: False
+
+        Returns
+        -------
+        Level2Catalog
+            A Level2Catalog object with the combined data.  The
+            file_index attribute gives the position in src_files of
+            the file from which each row was read.
+        """
+        catalogs = [Level2Catalog.read_src_file(src_file, flux_col=flux_col,
+                                                positive_flux=positive_flux)
+                    for src_file in src_files]
+        file_index = np.concatenate([np.full(len(catalog), i, dtype=int)
+                                     for i, catalog in enumerate(catalogs)])
+        return Level2Catalog(*[np.concatenate([getattr(catalog, attr)
+                                               for catalog in catalogs])
+                               for attr in ('objectId', 'coord_ra',
+                                            'coord_dec', 'flux', 'fluxerr')],
+                             file_index=file_index)
+
+class TruthCatalogIndex(object):
+    """
+    Spatial index of the instance catalog objects for a visit, built
+    once and used to match the catalogs of any number of sensors.
+    Instances are picklable, so they can be saved to disk or passed
+    to worker processes.
+
+    Attributes
+    ----------
+    instcat : pandas.DataFrame
+        Data frame of coordinates, apparent magnitudes, and galSimType
+        of the instance catalog objects.
+    matcher : desc.imsimdeep.SphericalMatcher
+        Spatial index of the object coordinates.
+    """
+    def __init__(self, instcat):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        instcat : pandas.DataFrame
+            Data frame of apparent magnitudes computed from an instance
+            catalog via compute_apparent_mags.py.
+        """
+        columns = ['raICRS', 'decICRS', 'galSimType'] \
+            + [band for band in 'ugrizy' if band in instcat]
+        self.instcat = instcat[columns].reset_index(drop=True)
+        self.instcat['galSimType'] = \
+            self.instcat['galSimType'].astype('category')
+        self.matcher = SphericalMatcher(self.instcat['raICRS'].values,
+                                        self.instcat['decICRS'].values)
+
+    @staticmethod
+    @profiled('TruthCatalogIndex.read')
+    def read(app_mag_file):
+        """
+        Create a TruthCatalogIndex from a pickled data frame of
+        apparent magnitudes.
+
+        Parameters
+        ----------
+        app_mag_file : str
+            Filename of a pickled pandas data frame of in-band apparent
+            magnitudes computed from an instance catalog via
+            compute_apparent_mags.py.
+
+        Returns
+        -------
+        TruthCatalogIndex
+        """
+        return TruthCatalogIndex(pd.read_pickle(app_mag_file))
+
+    def match(self, catalog, band, match_radius=None, blend_radius=None):
+        """
+        Associate each object in a Level2Catalog with the nearest
+        instance catalog object.
+
+        Parameters
+        ----------
+        catalog : Level2Catalog
+            The measured objects.
+        band : str
+            The band of the true magnitudes to use.
+        match_radius : float, optional
+            Maximum offset in arcsec for an association.  Measured objects
+            without an instance catalog object within this radius are
+            omitted.  Default: None
+        blend_radius : float, optional
+            If given, add a 'blend_count' column with the number of
+            instance catalog objects within this radius (in arcsec) of
+            each measured object.  Default: None
+
+        Returns
+        -------
+        pandas.DataFrame
+            Data frame of measured coordinates (in degrees) and fluxes,
+            the true coordinates, magnitudes and galSimType values of
+            the associated objects, and the offsets in arcsec.
+        """
+        coord_ra = catalog.coord_ra*180./np.pi
+        coord_dec = catalog.coord_dec*180./np.pi
+        with profile_stage('TruthCatalogIndex.match', count=len(coord_ra)):
+            offset, index = self.matcher.match(coord_ra, coord_dec,
+                                               radius=match_radius)
+        matched = np.where(index >= 0)
+        truth = self.instcat.iloc[index[matched]]
+        df = pd.DataFrame(dict(objectId=catalog.objectId[matched],
+                               coord_ra=coord_ra[matched],
+                               coord_dec=coord_dec[matched],
+                               flux=catalog.flux[matched],
+                               flux_err=catalog.fluxerr[matched],
+                               coord_ra_true=truth['raICRS'].values,
+                               coord_dec_true=truth['decICRS'].values,
+                               magnitude_true=truth[band].values,
+                               offset=offset[matched],
+                               galSimType=truth['galSimType'].values))
+        if blend_radius is not None:
+            df['blend_count'] = self.matcher.count_within(coord_ra[matched],
+                                                          coord_dec[matched],
+                                                          blend_radius)
+        return df
+
+_butlers = dict()
+_calibrations = dict()
+
+def calexp_calibration(repo, visit, raft, sensor):
+    """
+    Get the zero point flux and filter name for a sensor-visit from
+    the calexp header, without reading the pixel data.  Butler
+    instances and results are cached for reuse in subsequent calls.
+
+    Parameters
+    ----------
+    repo : str
+        Output repo containing the calexps.
+    visit : int
+        Visit number.
+    raft : str
+        Raft id, e.g., '2,2'.
+    sensor : str
+        Sensor id, e.g., '1,1'
 
+    Returns
+    -------
+    tuple(float, str)
+        The fluxMag0 value and the filter name.
+    """
+    key = (repo, visit, raft, sensor)
+    if key not in _calibrations:
+        if repo not in _butlers:
+            _butlers[repo] = dp.Butler(repo)
+        dataId = dict(visit=visit, raft=raft, sensor=sensor)
+        metadata = _butlers[repo].get('calexp_md', dataId=dataId)
+        _calibrations[key] = (afwImage.Calib(metadata).getFluxMag0()[0],
+                              afwImage.Filter(metadata).getName())
+    return _calibrations[key]
+
+@profiled()
 def instcat_comparison(app_mag_file, repo, visit, raft, sensor,
                        catalog_type='forced', flux_col='base_PsfFlux_flux',
-                       tract='0'):
+                       tract='0', match_radius=None, blend_radius=None):
     """
     Do a positional association between the forced source objects and
     the instance catalog coordintaes.  Return a data frame with
@@ -89,10 +279,12 @@ def instcat_comparison(app_mag_file, repo, visit, raft, sensor,
 
     Parameters
     ----------
-    app_mag_file : str
+    app_mag_file : str or TruthCatalogIndex
         Filename of a pickled pandas data frame of in-band apparent
         magnitudes computed from an instance catalog via
-        compute_apparent_mags.py.
+        compute_apparent_mags.py, or a TruthCatalogIndex built from
+        one.  Use the latter when processing several sensors of the
+        same visit.
     repo : str
         Output repo containing the Stack forced source catalogs.
     visit : int
@@ -109,6 +301,15 @@ def instcat_comparison(app_mag_file, repo, visit, raft, sensor,
         flux measurment.  Default: 'base_PsfFlux_flux'
     tract : str, optional
         Tract to use.  Default: '0'
+    match_radius : float, optional
+        Maximum offset in arcsec for an association.  Measured objects
+        without an instance catalog object within this radius are
+        omitted.  Default: None (i.e., use the nearest object regardless
+        of offset).
+    blend_radius : float, optional
+        If given, add a 'blend_count' column with the number of
+        instance catalog objects within this radius (in arcsec) of each
+        measured object.  Default: None
 
     Returns
     -------
@@ -120,10 +321,8 @@ def instcat_comparison(app_mag_file, repo, visit, raft, sensor,
         visit number and retrieved band, e.g., 'v230-fr'.
 
     """
-    dataId = dict(visit=visit, raft=raft, sensor=sensor)
-    calexp = dp.Butler(repo).get('calexp', dataId=dataId)
-    mag_from_adu = MagFromAdu(calexp.getCalib().getFluxMag0()[0])
-    band = calexp.getFilter().getName()
+    fluxmag0, band = calexp_calibration(repo, visit, raft, sensor)
+    mag_from_adu = MagFromAdu(fluxmag0)
     visit_name = 'v%i-f%s' % (visit, band)
     raft_name = 'R%s' % raft[::2]
     sensor_file = 'S%s.fits' % sensor[::2]
@@ -141,38 +340,21 @@ def instcat_comparison(app_mag_file, repo, visit, raft, sensor,
     else:
         src_file = os.path.join(repo, catalog_type, visit_name,
                                 raft_name, sensor_file)
-    catalog = Level2Catalog.read_src_file(src_file, flux_col=flux_col)
-
-    instcat = pd.read_pickle(app_mag_file)
-
-    # Use a KD tree to find nearest instance catalog object for each
-    # detected and measured object.
-    tree = sklearn.neighbors.KDTree(
-        np.array(((instcat['raICRS'].values*np.pi/180.,
-                   instcat['decICRS'].values*np.pi/180.))).transpose())
-    candidates = np.array(((catalog.coord_ra, catalog.coord_dec))).transpose()
-    offset, index = tree.query(candidates, k=1)
-
-    # Since the KDTree is Euclidean for 2 dimensions by default,
-    # account for the effect of a non-zero latitude and convert from
-    # radians to arcsec.
-    offset = np.array([x[0] for x in offset])
-    offset *= np.cos(catalog.coord_dec)*180./np.pi*3600.
-
-    # Build the output data frame.
-    index = (tuple([x[0] for x in index]),)
-    flux = np.array(catalog.flux.tolist())
-    flux_err = np.array(catalog.fluxerr.tolist())
-    df = pd.DataFrame(dict(objectId=catalog.objectId.tolist(),
-                           coord_ra=(catalog.coord_ra*180./np.pi).tolist(),
-                           coord_dec=(catalog.coord_dec*180./np.pi).tolist(),
-                           magnitude=mag_from_adu(flux),
-                           magnitude_error=mag_from_adu.error(flux, flux_err),
-                           coord_ra_true=instcat['raICRS'].values[index],
-                           coord_dec_true=instcat['decICRS'].values[index],
-                           magnitude_true=instcat[band].values[index],
-                           offset=offset,
-                           galSimType=instcat['galSimType'].values[index]))
+    with profile_stage('Level2Catalog.read_src_file') as stage:
+        catalog = Level2Catalog.read_src_file(src_file, flux_col=flux_col)
+        stage.count = len(catalog)
+
+    if isinstance(app_mag_file, TruthCatalogIndex):
+        truth_index = app_mag_file
+    else:
+        truth_index = TruthCatalogIndex.read(app_mag_file)
+
+    df = truth_index.match(catalog, band, match_radius=match_radius,
+                           blend_radius=blend_radius)
+    flux = df.pop('flux').values
+    flux_err = df.pop('flux_err').values
+    df['magnitude'] = mag_from_adu(flux)
+    df['magnitude_error'] = mag_from_adu.error(flux, flux_err)
     return df, visit_name
 
 def plot_instcat_comparison(app_mag_file, repo, visit, raft, sensor,
@@ -184,10 +366,10 @@ def plot_instcat_comparison(app_mag_file, repo, visit, raft, sensor,
 
     Parameters
     ----------
-    app_mag_file : str
+    app_mag_file : str or TruthCatalogIndex
         Filename of a pickled pandas data frame of in-band apparent
         magnitudes computed from an instance catalog via
-        compute_apparent_mags.py.
+        compute_apparent_mags.py, or a TruthCatalogIndex built from one.
     repo : str
         Output repo containing the Stack forced source catalogs.
     visit : int
@@ -248,6 +430,8 @@ def plot_instcat_comparison(app_mag_file, repo, visit, raft, sensor,
 def plot_instcat_overlay(df, visit_name, component, fontsize='x-small'):
     """
     Overlay the measured and instance catalog object sky positions.
+    For more than plot_config['max_points'] objects, the density of
+    measured positions is shown instead.
 
     Parameters
     ----------
@@ -267,19 +451,27 @@ def plot_instcat_overlay(df, visit_name, component, fontsize='x-small'):
     (float, float, float, float)
         Axis (xmin, xmax, ymin, ymax) values in data coordinates.
     """
-    plt.errorbar(df['coord_ra'], df['coord_dec'], fmt='.',
-                 label='measured position')
-    plt.scatter(df['coord_ra_true'], df['coord_dec_true'], s=60,
-                label='true position', facecolors='none', edgecolors='r')
+    if len(df) > plot_config['max_points']:
+        plt.hexbin(df['coord_ra'], df['coord_dec'],
+                   gridsize=plot_config['gridsize'], bins='log', mincnt=1)
+        colorbar = plt.colorbar()
+        colorbar.set_label('measured objects / bin', fontsize=fontsize)
+    else:
+        plt.errorbar(df['coord_ra'], df['coord_dec'], fmt='.',
+                     label='measured position')
+        plt.scatter(df['coord_ra_true'], df['coord_dec_true'], s=60,
+                    label='true position', facecolors='none', edgecolors='r')
+        plt.legend(fontsize=fontsize)
     plt.xlabel('RA (deg)', fontsize=fontsize)
     plt.ylabel('Dec (deg)', fontsize=fontsize)
-    plt.legend(fontsize=fontsize)
     plt.title('%(visit_name)s, %(component)s' % locals(), fontsize=fontsize)
     return plt.axis()
 
 def plot_instcat_magnitudes(df, visit_name, component, fontsize='x-small'):
     """
-    Plot the measured - true magnitude vs true magnitude.
+    Plot the measured - true magnitude vs true magnitude.  For more
+    than plot_config['max_points'] objects, the density of points is
+    shown instead.
 
     Parameters
     ----------
@@ -294,8 +486,13 @@ def plot_instcat_magnitudes(df, visit_name, component, fontsize='x-small'):
     fontsize : str or int, optional
         Font size to use in plots.  Default: 'x-small'
     """
-    plt.errorbar(df['magnitude_true'], df['magnitude'] - df['magnitude_true'],
-                 fmt='.', label='pointSource')
+    if len(df) > plot_config['max_points']:
+        plt.hexbin(df['magnitude_true'], df['magnitude'] - df['magnitude_true'],
+                   gridsize=plot_config['gridsize'], bins='log', mincnt=1)
+    else:
+        plt.errorbar(df['magnitude_true'],
+                     df['magnitude'] - df['magnitude_true'],
+                     fmt='.', label='pointSource')
     axis_range = plt.axis()
     plt.plot(axis_range[:2], [0, 0], 'k:')
     plt.xlabel('true magnitude', fontsize=fontsize)
@@ -342,7 +539,9 @@ def plot_instcat_offsets(df, visit_name, component, fontsize='x-small',
                          field=None, arrow_scale=150.):
     """
     Make a matplotlib.quiver plot of measured position offsets relative
-    to the instance catalog values.
+    to the instance catalog values.  For more than
+    plot_config['max_points'] objects, the offsets are averaged in
+    plot_config['offset_bins'] x plot_config['offset_bins'] cells.
 
     Parameters
     ----------
@@ -372,7 +571,11 @@ def plot_instcat_offsets(df, visit_name, component, fontsize='x-small',
     # normalized relative to the nominal x-axis range.
     scale_factor = arrow_scale/3600.
     length = scale_factor*df['offset'].values/np.sqrt(xhat**2 + yhat**2)
-    q = plt.quiver(X, Y, length*xhat, length*yhat, units='xy', angles='xy',
+    U, V = length*xhat, length*yhat
+    if len(df) > plot_config['max_points']:
+        X, Y, U, V = _binned_mean_vectors(X.values, Y.values, U.values,
+                                          V.values, plot_config['offset_bins'])
+    q = plt.quiver(X, Y, U, V, units='xy', angles='xy',
                    scale_units='xy', scale=1)
     plt.quiverkey(q, 0.9, 0.9, scale_factor, 'offset (1")', labelpos='N',
                   fontproperties={'size': fontsize})
@@ -381,3 +584,29 @@ def plot_instcat_offsets(df, visit_name, component, fontsize='x-small',
     plt.xlabel('RA (deg)', fontsize=fontsize)
     plt.ylabel('Dec (deg)', fontsize=fontsize)
     plt.title('%(visit_name)s, %(component)s' % locals(), fontsize=fontsize)
+
+def _binned_mean_vectors(x, y, u, v, nbins):
+    """
+    Average the (u, v) vectors at (x, y) positions in an nbins x nbins
+    grid, returning the cell centers and mean vectors of the non-empty
+    cells.  Vectors with non-finite components, e.g., from zero
+    offsets, are omitted.
+    """
+    finite = np.isfinite(u) & np.isfinite(v)
+    x, y, u, v = x[finite], y[finite], u[finite], v[finite]
+    if len(x) == 0:
+        return x, y, u, v
+    x_edges = np.linspace(x.min(), x.max(), nbins + 1)
+    y_edges = np.linspace(y.min(), y.max(), nbins + 1)
+    ix = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, nbins - 1)
+    iy = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, nbins - 1)
+    cell = ix*nbins + iy
+    counts = np.bincount(cell, minlength=nbins**2)
+    occupied = np.where(counts > 0)[0]
+    counts = counts[occupied]
+    u_mean = np.bincount(cell, weights=u, minlength=nbins**2)[occupied]/counts
+    v_mean = np.bincount(cell, weights=v, minlength=nbins**2)[occupied]/counts
+    x_centers = (x_edges[:-1] + x_edges[1:])/2.
+    y_centers = (y_edges[:-1] + y_edges[1:])/2.
+    return (x_centers[occupied//nbins], y_centers[occupied % nbins],
+            u_mean, v_mean)
@@ -0,0 +1,173 @@
+"""
+Persistent cache of apparent magnitudes for instance catalog objects.
+
+The magnitudes are stored in an SQLite database keyed by uniqueId,
+band, and a hash of the object parameters that determine the apparent
+magnitude (SED, magNorm, internal and Galactic dust, and redshift), so
+that a cached value is used only if none of those have changed.  This
+lets repeated visits of a field compute the magnitudes only for objects
+that have not been seen before.  The version of the throughputs (and of
+any SED photometry table) used to compute the magnitudes is stored in a
+metadata table, and the cached magnitudes are cleared when it changes.
+"""
+from __future__ import absolute_import, print_function, division
+import sqlite3
+import numpy as np
+import pandas as pd
+
+__all__ = ['MagnitudeCache']
+
+cache_version = 1
+
+class MagnitudeCache(object):
+    """
+    SQLite-backed cache of object apparent magnitudes.
+
+    Attributes
+    ----------
+    db_file : str
+        The SQLite database file.
+    photometry_version : str
+        Identifier of the throughputs and SED photometry used to
+        compute the cached magnitudes.
+    conn : sqlite3.Connection
+        The database connection.
+    """
+    parameter_columns = ('sedFilepath', 'magNorm', 'internalAv', 'internalRv',
+                         'galacticAv', 'galacticRv', 'redshift')
+
+    def __init__(self, db_file, photometry_version=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        db_file : str
+            The SQLite database file.  It is created if it does not
+            exist.
+        photometry_version : str, optional
+            Identifier of the throughputs and SED photometry used to
+            compute the magnitudes.  If it differs from the one stored
+            in the database, the cached magnitudes are deleted.
+            Default: None (i.e., sed_photometry.throughput_version())
+        """
+        if photometry_version is None:
+            from .sed_photometry import throughput_version
+            photometry_version = throughput_version()
+        self.db_file = db_file
+        self.photometry_version = photometry_version
+        self.conn = sqlite3.connect(db_file)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            self.conn.execute('PRAGMA user_version = %i' % cache_version)
+        elif version != cache_version:
+            raise RuntimeError('%s has magnitude cache version %i, expected %i'
+                               % (db_file, version, cache_version))
+        self.conn.execute('''create table if not exists magnitudes
+                             (uniqueId integer, band text, params integer,
+                              magnitude real,
+                              primary key (uniqueId, band, params))''')
+        self.conn.execute('''create table if not exists metadata
+                             (key text primary key, value text)''')
+        row = self.conn.execute("select value from metadata "
+                                "where key='photometry_version'").fetchone()
+        if row is None or row[0] != photometry_version:
+            self.conn.execute('delete from magnitudes')
+            self.conn.execute('insert or replace into metadata values '
+                              "('photometry_version', ?)",
+                              (photometry_version,))
+        self.conn.execute('''create temporary table lookup
+                             (row integer, uniqueId integer, params integer)''')
+        self.conn.commit()
+
+    @staticmethod
+    def parameter_hashes(objs):
+        """
+        Hash the parameters that determine the apparent magnitudes.
+
+        Parameters
+        ----------
+        objs : pandas.DataFrame
+            DataFrame of phosim objects.
+
+        Returns
+        -------
+        numpy.array
+            int64 hash values.
+        """
+        params = pd.DataFrame()
+        for column in MagnitudeCache.parameter_columns:
+            if column == 'sedFilepath':
+                params[column] = objs[column].astype(str).values
+            else:
+                params[column] \
+                    = pd.to_numeric(objs[column]).values.astype(np.float64)
+        return pd.util.hash_pandas_object(params, index=False)\
+                      .values.view(np.int64)
+
+    @staticmethod
+    def _unique_ids(objs):
+        return pd.to_numeric(objs['uniqueId']).values.astype(np.int64)
+
+    def lookup(self, objs, band):
+        """
+        Find the cached magnitudes of the objects.
+
+        Parameters
+        ----------
+        objs : pandas.DataFrame
+            DataFrame of phosim objects.
+        band : str
+            The LSST band.
+
+        Returns
+        -------
+        numpy.array
+            The magnitudes, with NaNs for objects not in the cache.
+        """
+        mags = np.full(len(objs), np.nan)
+        if len(objs) == 0:
+            return mags
+        self.conn.executemany('insert into lookup values (?, ?, ?)',
+                              zip(range(len(objs)),
+                                  self._unique_ids(objs).tolist(),
+                                  self.parameter_hashes(objs).tolist()))
+        rows = self.conn.execute('''select lookup.row, magnitudes.magnitude
+                                    from lookup join magnitudes
+                                    on magnitudes.uniqueId=lookup.uniqueId
+                                    and magnitudes.params=lookup.params
+                                    and magnitudes.band=?''',
+                                 (band,)).fetchall()
+        self.conn.execute('delete from lookup')
+        if rows:
+            rows = np.array(rows)
+            mags[rows[:, 0].astype(int)] = rows[:, 1]
+        return mags
+
+    def insert(self, objs, band, mags):
+        """
+        Add magnitudes to the cache, replacing any existing entries.
+
+        Parameters
+        ----------
+        objs : pandas.DataFrame
+            DataFrame of phosim objects.
+        band : str
+            The LSST band.
+        mags : sequence of floats
+            The apparent magnitudes of the objects.
+        """
+        self.conn.executemany('insert or replace into magnitudes '
+                              'values (?, ?, ?, ?)',
+                              zip(self._unique_ids(objs).tolist(),
+                                  [band]*len(objs),
+                                  self.parameter_hashes(objs).tolist(),
+                                  np.asarray(mags, dtype=float).tolist()))
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('select count(*) from magnitudes').fetchone()[0]
+
+    def close(self):
+        "Close the database connection."
+        self.conn.close()
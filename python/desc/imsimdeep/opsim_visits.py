@@ -0,0 +1,172 @@
+"""
+In-memory index of OpSim visit metadata.
+
+The Summary table rows for many visits are read with one query per
+batch of obsHistIDs, rather than querying the OpSim db for each visit.
+The ObservationMetaData objects are built from these rows on demand by
+ObservationMetaDataGenerator's per-record converter, so that they are
+the same as the ones from getObservationMetaData.  The OpSim v3
+Summary table stores angles in radians.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from .spherical_match import SphericalMatcher
+
+__all__ = ['OpSimVisitIndex']
+
+class OpSimVisitIndex(object):
+    """
+    Table of OpSim visits indexed by obsHistID, with pointing lookups.
+
+    Attributes
+    ----------
+    visits : pandas.DataFrame
+        Summary table columns, indexed by obsHistID.
+    opsim_db : str
+        sqlite3 db file from which the visits were read.
+    """
+    _chunk_size = 500
+
+    def __init__(self, visits, opsim_db=None):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        visits : pandas.DataFrame
+            Summary table columns, indexed by obsHistID.
+        opsim_db : str, optional
+            sqlite3 db file from which the visits were read.  It is
+            needed by obs_metadata.  Default: None
+        """
+        self.visits = visits
+        self.opsim_db = opsim_db
+        self._matcher = None
+        self._generator = None
+
+    @staticmethod
+    def from_opsim_db(opsim_db, obsHistIDs=None, columns=None,
+                      cache_file=None):
+        """
+        Read the visit metadata from an OpSim db file.
+
+        Parameters
+        ----------
+        opsim_db : str
+            sqlite3 db file containing observing plan.
+        obsHistIDs : sequence of ints, optional
+            The visits to read.  Default: None (i.e., all visits)
+        columns : sequence of str, optional
+            Summary table columns to read.  obs_metadata needs the
+            columns used by ObservationMetaDataGenerator.
+            Default: None (i.e., all)
+        cache_file : str, optional
+            Pickle file in which to save the table for later runs.  It
+            is used if it was made from the same OpSim db file, visits,
+            and columns.  Default: None
+
+        Returns
+        -------
+        OpSimVisitIndex
+        """
+        stat = os.stat(opsim_db)
+        key = dict(opsim_db=os.path.abspath(opsim_db), size=stat.st_size,
+                   mtime=stat.st_mtime,
+                   obsHistIDs=None if obsHistIDs is None
+                   else sorted(int(x) for x in obsHistIDs),
+                   columns=None if columns is None else list(columns))
+        if cache_file is not None and os.path.isfile(cache_file):
+            cached = pd.read_pickle(cache_file)
+            if cached['key'] == key:
+                return OpSimVisitIndex(cached['visits'], opsim_db=opsim_db)
+
+        if columns is None:
+            selection = '*'
+        else:
+            selection = ', '.join(['obsHistID'] + [x for x in columns
+                                                   if x != 'obsHistID'])
+        conn = sqlite3.connect(opsim_db)
+        try:
+            if obsHistIDs is None:
+                visits = pd.read_sql('select %s from Summary' % selection,
+                                     conn)
+            else:
+                ids = key['obsHistIDs']
+                visits = pd.concat(
+                    [pd.read_sql('select %s from Summary where obsHistID in (%s)'
+                                 % (selection, ','.join(['?']*len(chunk))),
+                                 conn, params=chunk)
+                     for chunk in (ids[i:i + OpSimVisitIndex._chunk_size]
+                                   for i in range(0, max(len(ids), 1),
+                                                  OpSimVisitIndex._chunk_size))],
+                    ignore_index=True)
+        finally:
+            conn.close()
+        # The Summary table has a row for each proposal a visit satisfies.
+        visits = visits.drop_duplicates('obsHistID').set_index('obsHistID')\
+                       .sort_index()
+        if cache_file is not None:
+            pd.to_pickle(dict(key=key, visits=visits), cache_file)
+        return OpSimVisitIndex(visits, opsim_db=opsim_db)
+
+    def __len__(self):
+        return len(self.visits)
+
+    def __contains__(self, obsHistID):
+        return obsHistID in self.visits.index
+
+    def obs_metadata(self, obsHistID, boundLength=1.75, boundType='circle'):
+        """
+        Create the ObservationMetaData for a visit, as
+        ObservationMetaDataGenerator.getObservationMetaData would.
+
+        Parameters
+        ----------
+        obsHistID : int
+            The visit.
+        boundLength : float, optional
+            Radius in degrees of the sky cone.  Default: 1.75
+        boundType : str, optional
+            Shape of the bounding region.  Default: 'circle'
+
+        Returns
+        -------
+        lsst.sims.utils.ObservationMetaData
+        """
+        if self._generator is None:
+            from lsst.sims.catUtils.utils import ObservationMetaDataGenerator
+            self._generator = ObservationMetaDataGenerator(
+                database=self.opsim_db, driver='sqlite')
+        record = self.visits.loc[[obsHistID]].reset_index()\
+                            .to_records(index=False)[0]
+        return self._generator.ObservationMetaDataFromPointing(
+            record, OpSimColumns=record.dtype.names, boundLength=boundLength,
+            boundType=boundType)
+
+    def visits_near(self, ra, dec, radius):
+        """
+        Find the visits whose pointings are within a radius of a
+        position.
+
+        Parameters
+        ----------
+        ra : float
+            Right ascension in degrees.
+        dec : float
+            Declination in degrees.
+        radius : float
+            Radius in degrees.
+
+        Returns
+        -------
+        numpy.array
+            The obsHistIDs, sorted.
+        """
+        if self._matcher is None:
+            self._matcher = SphericalMatcher(np.degrees(self.visits['fieldRA']),
+                                             np.degrees(self.visits['fieldDec']))
+        indexes = self._matcher.within([ra], [dec], radius*3600.)[0]
+        return np.sort(self.visits.index.values[indexes])
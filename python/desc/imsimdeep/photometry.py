@@ -0,0 +1,143 @@
+"""
+Conversion of measured fluxes to calibrated magnitudes and summary
+statistics of photometric residuals, binned in true magnitude.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import pandas as pd
+
+__all__ = ['MagFromAdu', 'residual_statistics']
+
+class MagFromAdu(object):
+    """
+    Class to convert from ADU to magnitude given zero point fluxes.
+
+    Attributes
+    ----------
+    fluxmag0 : float or numpy.array
+        Zero point flux(es) in ADU.  For an array, the sensor_index
+        arguments of the methods select the zero point for each flux.
+    """
+    def __init__(self, fluxmag0):
+        self.fluxmag0 = np.asarray(fluxmag0, dtype=float)
+
+    def _fluxmag0(self, sensor_index):
+        if sensor_index is None:
+            return self.fluxmag0
+        return self.fluxmag0[sensor_index]
+
+    def __call__(self, counts, sensor_index=None):
+        """
+        Convert the flux in ADU to the calibrated magnitude
+        from the zero point.
+
+        Parameters
+        ----------
+        counts : numpy.array
+            Fluxes in ADU.
+        sensor_index : numpy.array, optional
+            Index into the fluxmag0 array for each flux.  Default: None
+
+        Returns
+        -------
+        numpy.array
+            The magnitudes.
+        """
+        return -2.5*np.log10(counts/self._fluxmag0(sensor_index))
+
+    def error(self, counts, counts_err, sensor_index=None):
+        """
+        Convert the error in ADU to magnitude error, i.e.,
+        2.5/ln(10)*counts_err/counts.  The zero point uncertainty is
+        not included.
+
+        Parameters
+        ----------
+        counts : numpy.array
+            Fluxes in ADU.
+        counts_err : numpy.array
+            Flux errors in ADU.
+        sensor_index : numpy.array, optional
+            Unused, but accepted for symmetry with __call__.
+
+        Returns
+        -------
+        numpy.array
+            The magnitude errors.
+        """
+        return 2.5/np.log(10.)*np.abs(counts_err/counts)
+
+def _grouped_median(keys, values, nkeys):
+    """
+    Compute the median of the values for each integer key in
+    range(nkeys), with NaN for keys without values.
+    """
+    order = np.lexsort((values, keys))
+    counts = np.bincount(keys, minlength=nkeys)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(nkeys, np.nan)
+    occupied = counts > 0
+    sorted_values = values[order]
+    lower = sorted_values[starts[occupied] + (counts[occupied] - 1)//2]
+    upper = sorted_values[starts[occupied] + counts[occupied]//2]
+    medians[occupied] = (lower + upper)/2.
+    return medians
+
+def residual_statistics(mag_true, mag_meas, bins, groups=None):
+    """
+    Compute statistics of measured - true magnitude residuals in bins
+    of true magnitude.
+
+    Parameters
+    ----------
+    mag_true : numpy.array
+        True magnitudes.
+    mag_meas : numpy.array
+        Measured magnitudes.
+    bins : numpy.array
+        Bin edges in true magnitude.
+    groups : numpy.array, optional
+        Group labels, e.g., sensor names or visits, for each object.
+        If given, statistics are computed separately for each group.
+        Default: None
+
+    Returns
+    -------
+    pandas.DataFrame
+        Data frame with columns mag_min, mag_max, count, mean, median,
+        and sigma_mad (1.4826 times the median absolute deviation) for
+        each non-empty bin, and a 'group' column if groups is given.
+    """
+    mag_true = np.asarray(mag_true, dtype=float)
+    residuals = np.asarray(mag_meas, dtype=float) - mag_true
+    bins = np.asarray(bins, dtype=float)
+    nbins = len(bins) - 1
+    bin_index = np.digitize(mag_true, bins) - 1
+    good = (bin_index >= 0) & (bin_index < nbins) & np.isfinite(residuals)
+    if groups is not None:
+        group_codes, group_labels = pd.factorize(np.asarray(groups)[good])
+    else:
+        group_codes = np.zeros(np.count_nonzero(good), dtype=int)
+        group_labels = [None]
+    nkeys = len(group_labels)*nbins
+    keys = group_codes*nbins + bin_index[good]
+    residuals = residuals[good]
+
+    counts = np.bincount(keys, minlength=nkeys)
+    sums = np.bincount(keys, weights=residuals, minlength=nkeys)
+    medians = _grouped_median(keys, residuals, nkeys)
+    mads = _grouped_median(keys, np.abs(residuals - medians[keys]), nkeys)
+
+    occupied = np.where(counts > 0)[0]
+    columns = dict(mag_min=bins[occupied % nbins],
+                   mag_max=bins[occupied % nbins + 1],
+                   count=counts[occupied],
+                   mean=sums[occupied]/counts[occupied],
+                   median=medians[occupied],
+                   sigma_mad=1.4826*mads[occupied])
+    column_names = ['mag_min', 'mag_max', 'count', 'mean', 'median',
+                    'sigma_mad']
+    if groups is not None:
+        columns['group'] = np.asarray(group_labels)[occupied//nbins]
+        column_names.insert(0, 'group')
+    return pd.DataFrame(columns, columns=column_names)
@@ -0,0 +1,217 @@
+"""
+Lightweight timing and memory instrumentation of pipeline stages.
+
+Stages are instrumented with the profile_stage context manager or the
+profiled decorator.  When profiling is disabled (the default), these
+do nothing beyond a flag check.  The following environment variables
+control the instrumentation:
+
+IMSIMDEEP_PROFILE
+    If set to a non-empty value, record wall time, CPU time, and item
+    counts for each stage in stage_registry.  The RSS is sampled at the
+    entry and exit of every stage, giving the largest RSS at exit,
+    rss_gb, and the largest growth of the RSS over a call,
+    rss_growth_gb.  The USS, uss_gb, is only sampled at the exit of
+    outermost stages, since reading /proc/<pid>/smaps is too slow to
+    do for every nested stage; it is None for nested stages.
+IMSIMDEEP_PROFILE_FILE
+    If set, enable profiling and write the registry as JSON to this
+    file at exit.  The string '%(pid)i' is replaced by the process id.
+IMSIMDEEP_CPROFILE
+    If set to a directory name, run cProfile for each outermost stage
+    and write the stats to <dir>/<stage name>-<pid>-<call number>.prof.
+IMSIMDEEP_TRACEMALLOC
+    If set to a non-empty value, record the peak Python memory
+    allocation during each stage, tracemalloc_peak_gb, using
+    tracemalloc.  The peak is reset at the entry of each stage, which
+    needs Python 3.9 or later; for earlier versions of Python 3, it is
+    only recorded for outermost stages.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import time
+import json
+import atexit
+import functools
+from collections import OrderedDict
+
+__all__ = ['profile_stage', 'profiled', 'stage_registry', 'enable_profiling',
+           'dump_profile']
+
+stage_registry = OrderedDict()
+
+_config = dict(enabled=bool(os.environ.get('IMSIMDEEP_PROFILE')
+                            or os.environ.get('IMSIMDEEP_PROFILE_FILE')),
+               cprofile_dir=os.environ.get('IMSIMDEEP_CPROFILE'),
+               tracemalloc=bool(os.environ.get('IMSIMDEEP_TRACEMALLOC')),
+               stack=[])
+
+def enable_profiling(enabled=True):
+    """
+    Enable or disable the recording of stage information.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Default: True
+    """
+    _config['enabled'] = enabled
+
+class _NullStage(object):
+    "Stand-in for _Stage when profiling is disabled."
+    count = None
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+
+_null_stage = _NullStage()
+
+class _Stage(object):
+    """
+    Context manager that accumulates the resource usage of a stage in
+    stage_registry.
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage.
+    count : int
+        Number of items processed, which can be set within the context.
+    """
+    def __init__(self, name, count=None):
+        self.name = name
+        self.count = count
+        self._outermost = False
+        self._profiler = None
+        self._tracemalloc_peak = None
+
+    def __enter__(self):
+        import psutil
+        self._outermost = not _config['stack']
+        if _config['tracemalloc']:
+            import tracemalloc
+            if self._outermost:
+                tracemalloc.start()
+                self._tracemalloc_peak = 0
+            elif hasattr(tracemalloc, 'reset_peak'):
+                # Save the enclosing stage's peak before resetting it.
+                parent = _config['stack'][-1]
+                if parent._tracemalloc_peak is not None:
+                    parent._tracemalloc_peak = max(
+                        parent._tracemalloc_peak,
+                        tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                self._tracemalloc_peak = 0
+        _config['stack'].append(self)
+        if self._outermost and _config['cprofile_dir'] is not None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._process = psutil.Process()
+        self._rss0 = self._process.memory_info().rss
+        times = os.times()
+        self._cpu0 = times[0] + times[1]
+        self._wall0 = time.time()
+        return self
+
+    def __exit__(self, *args):
+        wall_time = time.time() - self._wall0
+        times = os.times()
+        cpu_time = times[0] + times[1] - self._cpu0
+        rss = self._process.memory_info().rss
+        _config['stack'].pop()
+        entry = stage_registry.setdefault(
+            self.name, OrderedDict(calls=0, wall_time=0., cpu_time=0.,
+                                   count=0, rss_gb=0., rss_growth_gb=0.,
+                                   uss_gb=None, tracemalloc_peak_gb=None))
+        entry['calls'] += 1
+        entry['wall_time'] += wall_time
+        entry['cpu_time'] += cpu_time
+        if self.count is not None:
+            entry['count'] += self.count
+        entry['rss_gb'] = max(entry['rss_gb'], rss/1024.**3)
+        entry['rss_growth_gb'] = max(entry['rss_growth_gb'],
+                                     (rss - self._rss0)/1024.**3)
+        if self._tracemalloc_peak is not None:
+            import tracemalloc
+            # The peak since the entry of this stage, or since the
+            # entry of its last nested stage, which is no lower.
+            peak = max(self._tracemalloc_peak,
+                       tracemalloc.get_traced_memory()[1])/1024.**3
+            entry['tracemalloc_peak_gb'] = max(entry['tracemalloc_peak_gb']
+                                               or 0., peak)
+            if self._outermost:
+                tracemalloc.stop()
+        if self._outermost:
+            uss = self._process.memory_full_info().uss/1024.**3
+            entry['uss_gb'] = max(entry['uss_gb'] or 0., uss)
+            if self._profiler is not None:
+                self._profiler.disable()
+                self._profiler.dump_stats(
+                    os.path.join(_config['cprofile_dir'], '%s-%i-%i.prof'
+                                 % (self.name, os.getpid(), entry['calls'])))
+        return False
+
+def profile_stage(name, count=None):
+    """
+    Context manager to record the resource usage of a stage.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    count : int, optional
+        Number of items processed.  This can also be set via the count
+        attribute of the returned object.
+
+    Examples
+    --------
+    >>> with profile_stage('select_by_chip_name') as stage:
+    ...     my_objs = ...
+    ...     stage.count = len(my_objs)
+    """
+    if not _config['enabled']:
+        return _null_stage
+    return _Stage(name, count=count)
+
+def profiled(name=None):
+    """
+    Decorator to record the resource usage of each call of a function.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the stage.  Default: the function's __name__.
+    """
+    def decorator(func):
+        stage_name = func.__name__ if name is None else name
+        @functools.wraps(func)
+        def wrapper(*args, **kwds):
+            if not _config['enabled']:
+                return func(*args, **kwds)
+            with _Stage(stage_name):
+                return func(*args, **kwds)
+        return wrapper
+    return decorator
+
+def dump_profile(outfile):
+    """
+    Write the stage registry to a JSON file.
+
+    Parameters
+    ----------
+    outfile : str
+        Output filename.
+    """
+    with open(outfile, 'w') as output:
+        json.dump(dict(pid=os.getpid(), stages=stage_registry), output,
+                  indent=2)
+
+def _dump_at_exit():
+    if stage_registry:
+        dump_profile(os.environ['IMSIMDEEP_PROFILE_FILE']
+                     % dict(pid=os.getpid()))
+
+if os.environ.get('IMSIMDEEP_PROFILE_FILE'):
+    atexit.register(_dump_at_exit)
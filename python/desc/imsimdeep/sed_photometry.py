@@ -0,0 +1,166 @@
+"""
+Precomputed synthetic photometry of the SED library.
+
+For an SED normalized to magnorm in the imsim bandpass, and without
+dust extinction or redshift, the apparent magnitude in band b is
+
+    mag_b = magnorm + (m_b - m_imsim),
+
+where m_b and m_imsim are the magnitudes of the un-normalized SED in
+band b and in the imsim bandpass.  The offsets m_b - m_imsim depend
+only on the SED and the throughputs, so they are computed once and
+stored in a versioned table keyed by SED file name.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+import lsst.sims.photUtils as photUtils
+import lsst.utils as lsstUtils
+from .ImSimDeep import lsst_bandpasses
+from .build_cache import file_digest
+
+__all__ = ['SedPhotometryTable', 'build_sed_photometry_table',
+           'throughput_version']
+
+table_version = 1
+
+def throughput_version():
+    """
+    Identify the version of the LSST throughputs by the content digest
+    of the baseline total throughput files.
+
+    Returns
+    -------
+    str
+        The hex digest.
+    """
+    throughput_dir = lsstUtils.getPackageDir('throughputs')
+    sha1 = hashlib.sha1()
+    for band in 'ugrizy':
+        sha1.update(file_digest(os.path.join(throughput_dir, 'baseline',
+                                             'total_%s.dat' % band))
+                    .encode('utf-8'))
+    return sha1.hexdigest()
+
+def _sed_files(sed_dir):
+    "All SED files in the sims_sed_library, relative to sed_dir."
+    sed_names = []
+    for root, _, files in os.walk(sed_dir):
+        sed_names.extend(os.path.relpath(os.path.join(root, item), sed_dir)
+                         for item in files
+                         if item.endswith('.gz') or item.endswith('.dat')
+                         or item.endswith('.spec'))
+    return sorted(sed_names)
+
+def _calc_mag(sed, bandpass):
+    "Sed.calcMag, returning np.inf for SEDs with no flux in the band."
+    try:
+        return sed.calcMag(bandpass)
+    except Exception as eObj:
+        if str(eObj).startswith("This SED has no flux"):
+            return np.inf
+        raise eObj
+
+def build_sed_photometry_table(outfile, sed_names=None):
+    """
+    Compute the imsim bandpass magnitude and the band magnitude
+    offsets for each SED and write them to a file.
+
+    Parameters
+    ----------
+    outfile : str
+        Output filename.
+    sed_names : sequence of str, optional
+        SED file names relative to the sims_sed_library directory.
+        Default: None (i.e., all of the SEDs in the library).
+
+    Returns
+    -------
+    SedPhotometryTable
+    """
+    sed_dir = lsstUtils.getPackageDir('sims_sed_library')
+    if sed_names is None:
+        sed_names = _sed_files(sed_dir)
+    bps, control_bandpass = lsst_bandpasses()
+    rows = []
+    for sed_name in sed_names:
+        sed = photUtils.Sed()
+        sed.readSED_flambda(os.path.join(sed_dir, sed_name))
+        mag_imsim = _calc_mag(sed, control_bandpass)
+        rows.append([mag_imsim] + [_calc_mag(sed, bps[band]) - mag_imsim
+                                   for band in 'ugrizy'])
+    table = pd.DataFrame(rows, index=list(sed_names),
+                         columns=['imsim'] + list('ugrizy'))
+    contents = dict(version=table_version,
+                    throughputs=throughput_version(), table=table)
+    with open(outfile, 'wb') as output:
+        pickle.dump(contents, output, protocol=2)
+    return SedPhotometryTable(table, contents['throughputs'])
+
+class SedPhotometryTable(object):
+    """
+    Table of band magnitude offsets relative to the imsim bandpass
+    magnitude for un-normalized SEDs.
+
+    Attributes
+    ----------
+    table : pandas.DataFrame
+        Data frame indexed by SED file name with columns 'imsim' (the
+        imsim bandpass magnitude) and u, g, r, i, z, y (the offsets).
+    throughputs : str
+        The throughput version used to compute the table.
+    """
+    def __init__(self, table, throughputs):
+        self.table = table
+        self.throughputs = throughputs
+
+    @staticmethod
+    def read(infile, check_throughputs=True):
+        """
+        Read a table written by build_sed_photometry_table.
+
+        Parameters
+        ----------
+        infile : str
+            The table file.
+        check_throughputs : bool, optional
+            If True, raise a RuntimeError if the table was computed
+            with different throughputs than those currently set up.
+            Default: True
+
+        Returns
+        -------
+        SedPhotometryTable
+        """
+        with open(infile, 'rb') as input_:
+            contents = pickle.load(input_)
+        if contents['version'] != table_version:
+            raise RuntimeError('SED photometry table version %s, expected %s'
+                               % (contents['version'], table_version))
+        if check_throughputs and contents['throughputs'] != throughput_version():
+            raise RuntimeError('SED photometry table %s was computed with '
+                               'different throughputs' % infile)
+        return SedPhotometryTable(contents['table'], contents['throughputs'])
+
+    def __contains__(self, sed_name):
+        return sed_name in self.table.index
+
+    def mag_offsets(self, sed_name):
+        """
+        The band magnitude offsets for an SED.
+
+        Parameters
+        ----------
+        sed_name : str
+            SED file name relative to the sims_sed_library directory.
+
+        Returns
+        -------
+        dict
+            Offsets keyed by band.
+        """
+        row = self.table.loc[sed_name]
+        return dict((band, row[band]) for band in 'ugrizy')
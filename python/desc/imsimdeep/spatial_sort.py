@@ -0,0 +1,234 @@
+"""
+Spatially sorted text instance catalogs with a block index.
+
+The object lines are ordered along a Hilbert curve in a Lambert
+azimuthal equal-area projection about the mean object position, with
+all of the non-object lines moved to the top of the file.  The sorted
+object lines are divided into blocks of consecutive lines, and the
+byte range and bounding circle of each block are written to a JSON
+sidecar file, <instcat>.blocks.json.  A cone selection then only needs
+to read the byte ranges of the blocks that overlap the cone.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import json
+import mmap
+import numpy as np
+from .spherical_match import unit_vectors, great_circle_separation
+
+__all__ = ['spatial_sort_instcat', 'read_block_index', 'sorted_cone_select']
+
+index_format = 'imsimdeep_instcat_blocks'
+index_version = 1
+
+def _hilbert_index(x, y, order):
+    """
+    Distance along the Hilbert curve of the integer grid points (x, y),
+    0 <= x, y < 2**order.
+    """
+    x = np.array(x, dtype=np.int64)
+    y = np.array(y, dtype=np.int64)
+    n = 2**order
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n//2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s*s*((3*rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant.
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap].copy()
+        s //= 2
+    return d
+
+def _center(ra, dec):
+    "The RA, Dec in degrees of the mean unit vector."
+    xyz = unit_vectors(ra, dec).sum(axis=0)
+    if not np.any(xyz):
+        return 0., 0.
+    return (np.degrees(np.arctan2(xyz[1], xyz[0])) % 360.,
+            np.degrees(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1]))))
+
+def _lambert_projection(ra, dec, ra0, dec0):
+    "Lambert azimuthal equal-area projection about (ra0, dec0)."
+    ra, dec, ra0, dec0 = (np.radians(np.asarray(x, dtype=float))
+                          for x in (ra, dec, ra0, dec0))
+    cos_c = (np.sin(dec0)*np.sin(dec)
+             + np.cos(dec0)*np.cos(dec)*np.cos(ra - ra0))
+    k = np.sqrt(2./np.maximum(1. + cos_c, 1e-12))
+    x = k*np.cos(dec)*np.sin(ra - ra0)
+    y = k*(np.cos(dec0)*np.sin(dec) - np.sin(dec0)*np.cos(dec)*np.cos(ra - ra0))
+    return x, y
+
+def _scan_instcat(infile):
+    """
+    Find the non-object lines and the byte ranges and positions of the
+    object lines.
+    """
+    header_lines = []
+    offsets, lengths, ra, dec = [], [], [], []
+    offset = 0
+    with open(infile, 'rb') as input_:
+        for line in input_:
+            if line.startswith(b'object'):
+                tokens = line.split()
+                offsets.append(offset)
+                lengths.append(len(line))
+                ra.append(float(tokens[2]))
+                dec.append(float(tokens[3]))
+            else:
+                header_lines.append(line if line.endswith(b'\n')
+                                    else line + b'\n')
+            offset += len(line)
+    return (header_lines, np.array(offsets, dtype=np.int64),
+            np.array(lengths, dtype=np.int64), np.array(ra), np.array(dec))
+
+def _index_file(instcat_file):
+    return instcat_file + '.blocks.json'
+
+def spatial_sort_instcat(infile, outfile=None, block_size=10000, order=16):
+    """
+    Sort the object lines of a text instance catalog along a Hilbert
+    curve and write the block index.
+
+    Parameters
+    ----------
+    infile : str
+        The text instance catalog.
+    outfile : str, optional
+        The sorted instance catalog.  Default: None (i.e., sort infile
+        in place)
+    block_size : int, optional
+        Number of object lines per block of the index.  Default: 10000
+    order : int, optional
+        Order of the Hilbert curve, i.e., the projected positions are
+        binned on a 2**order x 2**order grid.  Default: 16
+
+    Returns
+    -------
+    dict
+        The block index.
+    """
+    if outfile is None:
+        outfile = infile
+    header_lines, offsets, lengths, ra, dec = _scan_instcat(infile)
+    ra0, dec0 = _center(ra, dec)
+    x, y = _lambert_projection(ra, dec, ra0, dec0)
+    grid = []
+    for coord in (x, y):
+        coord_min = coord.min() if len(coord) > 0 else 0.
+        scale = (2**order - 1)/max(np.ptp(coord) if len(coord) > 0 else 0.,
+                                   1e-12)
+        grid.append(np.round((coord - coord_min)*scale))
+    order_index = np.argsort(_hilbert_index(grid[0], grid[1], order),
+                             kind='mergesort')
+
+    tmp_file = outfile + '.tmp'
+    blocks = []
+    with open(infile, 'rb') as input_, open(tmp_file, 'wb') as output:
+        for line in header_lines:
+            output.write(line)
+        header_bytes = output.tell()
+        contents = (mmap.mmap(input_.fileno(), 0, access=mmap.ACCESS_READ)
+                    if len(offsets) > 0 else None)
+        try:
+            for start in range(0, len(order_index), block_size):
+                rows = order_index[start:start + block_size]
+                block_offset = output.tell()
+                for row in rows:
+                    line = contents[offsets[row]:offsets[row] + lengths[row]]
+                    output.write(line if line.endswith(b'\n')
+                                 else line + b'\n')
+                block_ra, block_dec = _center(ra[rows], dec[rows])
+                radius = np.max(great_circle_separation(block_ra, block_dec,
+                                                        ra[rows],
+                                                        dec[rows]))/3600.
+                blocks.append(dict(offset=block_offset,
+                                   length=output.tell() - block_offset,
+                                   count=len(rows), ra=block_ra,
+                                   dec=block_dec, radius=radius))
+        finally:
+            if contents is not None:
+                contents.close()
+    os.rename(tmp_file, outfile)
+    stat = os.stat(outfile)
+    block_index = dict(format=index_format, version=index_version,
+                       size=stat.st_size, mtime=stat.st_mtime,
+                       header_bytes=header_bytes, blocks=blocks)
+    with open(_index_file(outfile), 'w') as output:
+        json.dump(block_index, output, indent=2)
+    return block_index
+
+def read_block_index(instcat_file):
+    """
+    Read the block index of a spatially sorted instance catalog.
+
+    Parameters
+    ----------
+    instcat_file : str
+        The text instance catalog.
+
+    Returns
+    -------
+    dict or None
+        The block index, or None if there is no index file or if the
+        catalog has changed since the index was written.
+    """
+    index_file = _index_file(instcat_file)
+    if not os.path.isfile(index_file) or not os.path.isfile(instcat_file):
+        return None
+    with open(index_file) as input_:
+        block_index = json.load(input_)
+    stat = os.stat(instcat_file)
+    if (block_index.get('format') != index_format
+            or block_index['version'] > index_version
+            or block_index['size'] != stat.st_size
+            or block_index['mtime'] != stat.st_mtime):
+        return None
+    return block_index
+
+def sorted_cone_select(infile, block_index, ra, dec, radius, outfile):
+    """
+    Write the instance catalog lines of objects within a cone, reading
+    only the blocks that overlap the cone.
+
+    Parameters
+    ----------
+    infile : str
+        The spatially sorted text instance catalog.
+    block_index : dict
+        The block index from read_block_index.
+    ra : float
+        RA of the cone center in degrees.
+    dec : float
+        Dec of the cone center in degrees.
+    radius : float
+        Cone radius in degrees.
+    outfile : str
+        The output text instance catalog.
+    """
+    blocks = block_index['blocks']
+    if blocks:
+        block_seps = great_circle_separation(ra, dec,
+                                             [x['ra'] for x in blocks],
+                                             [x['dec'] for x in blocks])/3600.
+        block_radii = np.array([x['radius'] for x in blocks])
+        selected_blocks = np.where(block_seps <= radius + block_radii
+                                   + 1e-9)[0]
+    else:
+        selected_blocks = []
+    with open(infile, 'rb') as input_, open(outfile, 'wb') as output:
+        output.write(input_.read(block_index['header_bytes']))
+        for i in selected_blocks:
+            input_.seek(blocks[i]['offset'])
+            lines = input_.read(blocks[i]['length']).splitlines(True)
+            tokens = [line.split(None, 4) for line in lines]
+            separation = great_circle_separation(
+                ra, dec, [float(x[2]) for x in tokens],
+                [float(x[3]) for x in tokens])
+            for line, keep in zip(lines, separation <= radius*3600.):
+                if keep:
+                    output.write(line)
@@ -0,0 +1,175 @@
+"""
+Positional matching of objects on the sphere using a KD tree of 3D
+unit vectors.  Euclidean (chord) distances between unit vectors are
+monotonic in the angular separation, so nearest neighbor queries are
+exact everywhere on the sky, including near RA=0/360 and the poles,
+and chord lengths convert exactly to great-circle separations.
+
+sklearn is imported only when a SphericalMatcher is constructed, so
+that the separation functions need only numpy.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+
+__all__ = ['SphericalMatcher', 'unit_vectors', 'great_circle_separation']
+
+def unit_vectors(ra, dec):
+    """
+    Convert sky coordinates to 3D unit vectors.
+
+    Parameters
+    ----------
+    ra : numpy.array
+        Right ascension values in degrees.
+    dec : numpy.array
+        Declination values in degrees.
+
+    Returns
+    -------
+    numpy.array
+        Array of shape (len(ra), 3) of unit vectors.
+    """
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    cos_dec = np.cos(dec)
+    return np.column_stack((cos_dec*np.cos(ra), cos_dec*np.sin(ra),
+                            np.sin(dec)))
+
+def _chord_to_arcsec(chord):
+    "Convert chord lengths between unit vectors to separations in arcsec."
+    return np.degrees(2.*np.arcsin(np.minimum(chord/2., 1.)))*3600.
+
+def _arcsec_to_chord(separation):
+    "Convert angular separations in arcsec to chord lengths."
+    return 2.*np.sin(np.radians(np.minimum(separation/3600., 180.))/2.)
+
+def great_circle_separation(ra0, dec0, ra1, dec1):
+    """
+    Angular separations computed with the haversine formula.
+
+    Parameters
+    ----------
+    ra0, dec0 : numpy.array
+        Coordinates of the first set of positions in degrees.
+    ra1, dec1 : numpy.array
+        Coordinates of the second set of positions in degrees.
+
+    Returns
+    -------
+    numpy.array
+        Separations in arcsec.
+    """
+    ra0, dec0, ra1, dec1 = (np.radians(np.asarray(x, dtype=float))
+                            for x in (ra0, dec0, ra1, dec1))
+    hav = (np.sin((dec1 - dec0)/2.)**2
+           + np.cos(dec0)*np.cos(dec1)*np.sin((ra1 - ra0)/2.)**2)
+    return np.degrees(2.*np.arcsin(np.sqrt(np.minimum(hav, 1.))))*3600.
+
+class SphericalMatcher(object):
+    """
+    Class to find the nearest reference objects to a set of positions.
+
+    Attributes
+    ----------
+    tree : sklearn.neighbors.KDTree
+        KD tree of the 3D unit vectors of the reference positions.
+    size : int
+        Number of reference objects.
+    """
+    def __init__(self, ra, dec, leaf_size=40):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        ra : numpy.array
+            Right ascension values of the reference objects in degrees.
+        dec : numpy.array
+            Declination values of the reference objects in degrees.
+        leaf_size : int, optional
+            Leaf size of the KD tree.  Default: 40
+        """
+        import sklearn.neighbors
+        self.tree = sklearn.neighbors.KDTree(unit_vectors(ra, dec),
+                                             leaf_size=leaf_size)
+        self.size = len(ra)
+
+    def match(self, ra, dec, k=1, radius=None):
+        """
+        Find the k nearest reference objects for each position.
+
+        Parameters
+        ----------
+        ra : numpy.array
+            Right ascension values in degrees.
+        dec : numpy.array
+            Declination values in degrees.
+        k : int, optional
+            Number of neighbors to return for each position.  Default: 1
+        radius : float, optional
+            Match radius in arcsec.  Neighbors farther than this have
+            separations set to np.inf and indexes set to -1.
+            Default: None (i.e., no maximum separation).
+
+        Returns
+        -------
+        (numpy.array, numpy.array)
+            Great-circle separations in arcsec and indexes of the
+            reference objects, each of shape (len(ra),) for k=1, or
+            (len(ra), k) otherwise, sorted by separation.
+        """
+        k = min(k, self.size)
+        chord, index = self.tree.query(unit_vectors(ra, dec), k=k)
+        separation = _chord_to_arcsec(chord)
+        if radius is not None:
+            outside = separation > radius
+            separation[outside] = np.inf
+            index[outside] = -1
+        if k == 1:
+            return separation[:, 0], index[:, 0]
+        return separation, index
+
+    def count_within(self, ra, dec, radius):
+        """
+        Count the reference objects within a radius of each position,
+        e.g., to flag blends.
+
+        Parameters
+        ----------
+        ra : numpy.array
+            Right ascension values in degrees.
+        dec : numpy.array
+            Declination values in degrees.
+        radius : float
+            Radius in arcsec.
+
+        Returns
+        -------
+        numpy.array
+            Number of reference objects within the radius.
+        """
+        return self.tree.query_radius(unit_vectors(ra, dec),
+                                      _arcsec_to_chord(radius),
+                                      count_only=True)
+
+    def within(self, ra, dec, radius):
+        """
+        Find the reference objects within a radius of each position.
+
+        Parameters
+        ----------
+        ra : numpy.array
+            Right ascension values in degrees.
+        dec : numpy.array
+            Declination values in degrees.
+        radius : float
+            Radius in arcsec.
+
+        Returns
+        -------
+        numpy.array
+            Object array of index arrays of the reference objects
+            within the radius of each position.
+        """
+        return self.tree.query_radius(unit_vectors(ra, dec),
+                                      _arcsec_to_chord(radius))
@@ -0,0 +1,303 @@
+"""
+Reference catalogs and astrometry.net index files for wide areas.
+
+The requested sky region is divided into HEALPix tiles (nested
+ordering).  The stars within each tile's bounding circle, enlarged by
+an overlap margin, are queried once and written directly to a FITS
+table in the format produced by refcat_to_astrometry_net_input.  The
+index files of each tile are built in a pool of worker processes, in
+a tile-<pixel> subdirectory, and a single andConfig.py lists all of
+them.  build-astrometry-index needs numeric index IDs, so each tile's
+index ID is the numeric root followed by the zero-padded pixel number,
+and build_index_files appends the two-digit scale number.
+
+The star query and the index building are done by callables that can
+be replaced, e.g., by local stand-ins for testing:
+
+star_source(ra, dec, radius)
+    Return a pandas.DataFrame of the stars within radius degrees of
+    (ra, dec), with columns id, ra, dec, u, g, r, i, z, y, isvariable,
+    and starnotgal.
+index_builder(ref_file, index_id, max_scale_number, output_dir, manifest)
+    Build the index files for a reference FITS file, returning the
+    index filenames relative to output_dir.
+
+healpy is required to compute the tiles.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import astropy.io.fits as fits
+from .build_cache import BuildManifest
+from .spherical_match import great_circle_separation
+from .profiling import profile_stage, profiled
+
+__all__ = ['CatSimStarSource', 'sky_tiles', 'tile_cone', 'write_refcat_fits',
+           'make_tiled_index_files']
+
+refcat_columns = ('id', 'ra', 'dec', 'u', 'g', 'r', 'i', 'z', 'y',
+                  'isvariable', 'starnotgal')
+
+# FITS column formats matching the text2fits.py conversion in
+# refcat_to_astrometry_net_input.
+_fits_formats = dict(id='K', isvariable='J', starnotgal='J')
+
+# Largest index ID, which build-astrometry-index reads as an int.
+_max_index_id = 2**31 - 1
+
+def _healpy():
+    try:
+        import healpy
+    except ImportError:
+        raise ImportError('healpy is needed for tiled reference catalogs')
+    return healpy
+
+def sky_tiles(ra, dec, radius, nside):
+    """
+    Find the HEALPix tiles overlapping a cone.
+
+    Parameters
+    ----------
+    ra : float
+        RA of the cone center in degrees.
+    dec : float
+        Dec of the cone center in degrees.
+    radius : float
+        Cone radius in degrees.
+    nside : int
+        HEALPix nside parameter.
+
+    Returns
+    -------
+    numpy.array
+        Nested pixel numbers of the tiles, sorted.
+    """
+    healpy = _healpy()
+    vec = healpy.ang2vec(ra, dec, lonlat=True)
+    return np.sort(healpy.query_disc(nside, vec, np.radians(radius),
+                                     inclusive=True, nest=True))
+
+def tile_cone(pixel, nside, margin=0.):
+    """
+    The bounding circle of a HEALPix tile.
+
+    Parameters
+    ----------
+    pixel : int
+        Nested pixel number.
+    nside : int
+        HEALPix nside parameter.
+    margin : float, optional
+        Overlap margin in degrees added to the radius.  Default: 0
+
+    Returns
+    -------
+    (float, float, float)
+        RA and Dec of the tile center and the radius, in degrees.
+    """
+    healpy = _healpy()
+    ra, dec = healpy.pix2ang(nside, pixel, nest=True, lonlat=True)
+    corners = healpy.boundaries(nside, pixel, step=4, nest=True)
+    corner_ra, corner_dec = healpy.vec2ang(corners.T, lonlat=True)
+    radius = np.max(great_circle_separation(ra, dec, corner_ra,
+                                            corner_dec))/3600.
+    return float(ra), float(dec), radius + margin
+
+class CatSimStarSource(object):
+    """
+    Query the CatSim allstars table for the reference stars in a cone.
+
+    Attributes
+    ----------
+    catsim_db_info : dict
+        Connection information (host, port, database, driver) for the
+        CatSim database.
+    chunk_size : int
+        The memory chunk size to pass to InstanceCatalog.write_catalog.
+    """
+    def __init__(self, catsim_db_info=None, chunk_size=20000):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        catsim_db_info : dict, optional
+            Connection information for the CatSim database.
+            Default: connection info for the UW fatboy server.
+        chunk_size : int, optional
+            The memory chunk size to pass to
+            InstanceCatalog.write_catalog.  Default: 20000
+        """
+        if catsim_db_info is None:
+            from .build_index_files import catsim_uw
+            catsim_db_info = catsim_uw
+        self.catsim_db_info = catsim_db_info
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        return 'CatSimStarSource(%s)' % sorted(self.catsim_db_info.items())
+
+    def __call__(self, ra, dec, radius):
+        from lsst.sims.utils import ObservationMetaData
+        from .build_index_files import CatalogDBObject, SimulationReference
+        obs_md = ObservationMetaData(pointingRA=ra, pointingDec=dec,
+                                     boundType='circle', boundLength=radius)
+        stars = CatalogDBObject.from_objid('allstars', **self.catsim_db_info)
+        ref_stars = SimulationReference(stars, obs_metadata=obs_md)
+        fd, tmp_file = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            ref_stars.write_catalog(tmp_file, write_mode='w',
+                                    write_header=True,
+                                    chunk_size=self.chunk_size)
+            return pd.read_csv(tmp_file, names=refcat_columns, comment='#',
+                               skipinitialspace=True)
+        finally:
+            os.remove(tmp_file)
+
+def write_refcat_fits(stars, outfile):
+    """
+    Write reference stars to a FITS binary table for
+    build-astrometry-index.
+
+    Parameters
+    ----------
+    stars : pandas.DataFrame
+        The stars, with the columns in refcat_columns.
+    outfile : str
+        The output FITS file.
+    """
+    columns = [fits.Column(name=name, format=_fits_formats.get(name, 'D'),
+                           array=stars[name].values)
+               for name in refcat_columns]
+    fits.BinTableHDU.from_columns(columns).writeto(outfile, overwrite=True)
+
+def _tile_index_ids(index_id_root, pixels, nside):
+    """
+    The index IDs of the tiles, without the scale numbers, checking
+    that the IDs of all of the scales are valid.
+    """
+    if index_id_root != int(index_id_root) or index_id_root < 0:
+        raise ValueError('index_id_root must be a non-negative integer: %s'
+                         % index_id_root)
+    width = len(str(12*nside**2 - 1))
+    index_ids = ['%i%0*i' % (index_id_root, width, pixel) for pixel in pixels]
+    max_scale_id = int('%i%0*i99' % (index_id_root, width, 12*nside**2 - 1))
+    if max_scale_id > _max_index_id:
+        raise ValueError('index IDs up to %i for index_id_root=%i and '
+                         'nside=%i exceed %i'
+                         % (max_scale_id, index_id_root, nside,
+                            _max_index_id))
+    return index_ids
+
+def _default_index_builder(ref_file, index_id, max_scale_number, output_dir,
+                           manifest):
+    from .build_index_files import build_index_files
+    return build_index_files(ref_file, index_id,
+                             max_scale_number=max_scale_number,
+                             output_dir=output_dir, manifest=manifest,
+                             write_config=False)
+
+def _build_tile_index(index_builder, ref_file, index_id, max_scale_number,
+                      tile_dir):
+    "Build the index files of a tile, with a manifest in the tile directory."
+    manifest = BuildManifest(os.path.join(tile_dir, 'manifest.json'))
+    index_files = index_builder(ref_file, index_id, max_scale_number,
+                                tile_dir, manifest)
+    return [os.path.join(os.path.basename(tile_dir), item)
+            for item in index_files]
+
+def _write_tile_refcat(star_source, ra, dec, radius, outfile):
+    "Query the stars in a tile's cone and write the FITS table."
+    stars = star_source(ra, dec, radius)
+    write_refcat_fits(stars.drop_duplicates('id'), outfile)
+
+@profiled()
+def make_tiled_index_files(ra, dec, radius, index_id_root, nside=32,
+                           margin=0.1, max_scale_number=4, output_dir='.',
+                           processes=None, star_source=None,
+                           index_builder=None):
+    """
+    Make per-tile reference catalogs and astrometry.net index files
+    covering a cone and write an andConfig.py listing all of them.
+
+    Parameters
+    ----------
+    ra : float
+        RA of the region center in degrees.
+    dec : float
+        Dec of the region center in degrees.
+    radius : float
+        Radius of the region in degrees.
+    index_id_root : int
+        Numeric root of the IDs of the index files.  The tile's pixel
+        number, zero-padded to the number of digits of the largest
+        pixel number, and the two-digit scale number are appended.
+        The resulting IDs must fit in a 32-bit int.
+    nside : int, optional
+        HEALPix nside parameter of the tiles.  Default: 32
+    margin : float, optional
+        Overlap margin of the tiles in degrees.  Default: 0.1
+    max_scale_number : int, optional
+        Maximum scale for generating index files. Default: 4
+    output_dir : str, optional
+        Output directory.  Default: '.'
+    processes : int, optional
+        Number of processes building index files.
+        Default: None (i.e., multiprocessing.cpu_count())
+    star_source : callable, optional
+        Function returning the stars in a cone.
+        Default: None (i.e., CatSimStarSource())
+    index_builder : callable, optional
+        Function building the index files for a tile.  It must be
+        picklable, e.g., a module-level function.
+        Default: None (i.e., build_index_files)
+
+    Returns
+    -------
+    list of str
+        The index filenames, relative to output_dir.
+    """
+    from .build_index_files import write_and_config_py
+    if star_source is None:
+        star_source = CatSimStarSource()
+    if index_builder is None:
+        index_builder = _default_index_builder
+    pixels = sky_tiles(ra, dec, radius, nside)
+    index_ids = _tile_index_ids(index_id_root, pixels, nside)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    manifest = BuildManifest(os.path.join(output_dir, 'tiles_manifest.json'))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = []
+        for pixel, index_id in zip(pixels, index_ids):
+            tile_ra, tile_dec, tile_radius = tile_cone(pixel, nside, margin)
+            tile_dir = os.path.join(output_dir, 'tile-%i' % pixel)
+            if not os.path.isdir(tile_dir):
+                os.makedirs(tile_dir)
+            ref_file = os.path.join(tile_dir, 'refcat.fits')
+            inputs = dict(pixel=int(pixel), nside=nside, ra=tile_ra,
+                          dec=tile_dec, radius=tile_radius,
+                          star_source=repr(star_source))
+            with profile_stage('make_tiled_index_files.query'):
+                manifest.run_stage('refcat-%i' % pixel, inputs, [ref_file],
+                                   _write_tile_refcat, star_source, tile_ra,
+                                   tile_dec, tile_radius, ref_file)
+            results.append(pool.apply_async(_build_tile_index,
+                                            (index_builder, ref_file,
+                                             index_id, max_scale_number,
+                                             tile_dir)))
+        index_files = []
+        for result in results:
+            index_files.extend(result.get())
+    finally:
+        pool.close()
+        pool.join()
+
+    write_and_config_py(index_files, output_dir)
+    return index_files
@@ -0,0 +1,347 @@
+"""
+Pipelined processing of a visit's instance catalog.
+
+The object lines of the instance catalog are read in chunks and passed
+through bounded queues to a pool of processes that computes the
+apparent magnitudes and a pool that assigns the objects to sensors.
+The calling process appends each chunk to the per-sensor instance
+catalogs while later chunks are still being processed.  The queues and the
+number of chunks in flight per pool bound the memory use: a slow stage
+blocks the stages upstream of it.
+
+The outputs are the per-sensor instance catalogs and a data frame of
+the apparent magnitudes, in the format written by
+compute_apparent_mags.py with an added chipName column, for use with
+instcat_comparison once the Stack has processed the simulated images.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import threading
+import collections
+import multiprocessing
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+import pandas as pd
+from .profiling import profile_stage, profiled
+
+__all__ = ['instcat_chunks', 'run_visit_pipeline']
+
+_end_of_stream = None
+
+def instcat_chunks(instcat, chunk_size=100000):
+    """
+    Read the header lines and the object lines of an instance catalog
+    in chunks.
+
+    Parameters
+    ----------
+    instcat : str
+        Text instance catalog or binary instance catalog directory.
+    chunk_size : int, optional
+        Number of object lines per chunk.  Default: 100000
+
+    Returns
+    -------
+    (list of str, generator)
+        The lines preceding the first object line and a generator of
+        lists of object lines, without line terminators.
+    """
+    from .binary_instcat import is_binary_instcat, BinaryInstanceCatalog
+    if is_binary_instcat(instcat):
+        catalog = BinaryInstanceCatalog(instcat)
+        header_lines = [text for _, text in catalog.header['header_lines']]
+        def chunks():
+            for start in range(0, len(catalog), chunk_size):
+                yield catalog.object_lines(
+                    np.arange(start, min(start + chunk_size, len(catalog))))
+        return header_lines, chunks()
+
+    input_ = open(instcat)
+    header_lines = []
+    first_object = None
+    for line in input_:
+        if line.startswith('object'):
+            first_object = line.rstrip('\n')
+            break
+        header_lines.append(line.rstrip('\n'))
+
+    def chunks():
+        with input_:
+            if first_object is None:
+                return
+            chunk = [first_object]
+            for line in input_:
+                if not line.startswith('object'):
+                    continue
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+                chunk.append(line.rstrip('\n'))
+            if chunk:
+                yield chunk
+    return header_lines, chunks()
+
+# Per-process state of the pool workers, set by the initializers.
+_worker = dict()
+
+def _init_magnitude_worker(header_lines, band, sed_table_file):
+    _worker['header_lines'] = header_lines
+    _worker['band'] = band
+    _worker['app_mags'] = dict()
+    _worker['sed_table'] = None
+    if sed_table_file is not None:
+        from .sed_photometry import SedPhotometryTable
+        _worker['sed_table'] = SedPhotometryTable.read(sed_table_file)
+
+def _compute_magnitudes(lines):
+    """
+    Parse and validate a chunk of object lines with desc.imsim and
+    compute the apparent magnitudes of the accepted objects.  The
+    returned data frame has a row for each line, with the accepted
+    column False for the objects that the validation rejected or that
+    have no SED.
+    """
+    import desc.imsim
+    from .ImSimDeep import ApparentMagnitude
+    from .instance_catalog_tools import parse_instcat_lines
+    band = _worker['band']
+    objs = parse_instcat_lines(_worker['header_lines'], lines)[1]
+    if len(objs) != len(lines):
+        raise RuntimeError('%i objects parsed from %i object lines'
+                           % (len(objs), len(lines)))
+    accepted = desc.imsim.validate_phosim_object_list(objs).accepted
+    accepted = (objs.index.isin(accepted.index)
+                & objs['sedFilepath'].notnull().values)
+    mags = np.nan*np.ones(len(objs))
+    sed_names = np.asarray(objs['sedFilepath'].values, dtype=object)
+    sed_groups = pd.Series(sed_names[accepted]).groupby(sed_names[accepted])
+    rows = np.where(accepted)[0]
+    for sed_name, positions in sed_groups.indices.items():
+        if sed_name not in _worker['app_mags']:
+            _worker['app_mags'][sed_name] \
+                = ApparentMagnitude(sed_name, sed_table=_worker['sed_table'])
+        my_rows = rows[positions]
+        mags[my_rows] = _worker['app_mags'][sed_name].magnitudes(
+            objs.iloc[my_rows], band)
+    mags[accepted & ~np.isfinite(mags)] = 1000.
+    df = pd.DataFrame(dict(uniqueId=pd.to_numeric(objs['uniqueId']).values,
+                           raICRS=pd.to_numeric(objs['raICRS']).values,
+                           decICRS=pd.to_numeric(objs['decICRS']).values,
+                           galSimType=np.asarray(objs['galSimType'].values)),
+                      columns=['uniqueId', 'raICRS', 'decICRS',
+                               'galSimType'])
+    df[band] = mags
+    df['accepted'] = accepted
+    return df
+
+def _init_chip_worker(commands):
+    import lsst.obs.lsstSim as obs_lsstSim
+    from .instance_catalog_tools import obs_metadata
+    _worker['camera'] = obs_lsstSim.LsstSimMapper().camera
+    _worker['obs_md'] = obs_metadata(commands)
+
+def _chip_names(ra, dec):
+    "Sensor names for the object positions; None for off-focal plane."
+    import lsst.sims.coordUtils as coordUtils
+    return np.asarray(coordUtils.chipNameFromRaDec(ra, dec,
+                                                   camera=_worker['camera'],
+                                                   obs_metadata=_worker['obs_md']))
+
+def _reader(chunks, out_queue, errors):
+    "Put the object line chunks on the queue."
+    try:
+        for index, lines in enumerate(chunks):
+            if errors:
+                break
+            out_queue.put(dict(index=index, lines=lines))
+    except Exception as eobj:
+        errors.append(eobj)
+    finally:
+        out_queue.put(_end_of_stream)
+
+def _pool_stage(pool, func, make_args, key, max_pending, in_queue, out_queue,
+                errors):
+    """
+    Apply func to each chunk from in_queue in the process pool, with
+    at most max_pending chunks submitted at a time, and put the chunks
+    on out_queue in order with the result stored under key.
+    """
+    pending = collections.deque()
+    def finish_oldest():
+        chunk, result = pending.popleft()
+        chunk[key] = result.get()
+        out_queue.put(chunk)
+    upstream_done = False
+    try:
+        while True:
+            chunk = in_queue.get()
+            if chunk is _end_of_stream:
+                upstream_done = True
+                break
+            if errors:
+                # Drain the upstream queue so the upstream stages finish.
+                continue
+            pending.append((chunk, pool.apply_async(func, make_args(chunk))))
+            if len(pending) >= max_pending:
+                finish_oldest()
+        while pending:
+            finish_oldest()
+    except Exception as eobj:
+        errors.append(eobj)
+        if not upstream_done:
+            _drain(in_queue)
+    finally:
+        out_queue.put(_end_of_stream)
+
+def _drain(in_queue):
+    "Discard items from the queue through the end of the stream."
+    while in_queue.get() is not _end_of_stream:
+        pass
+
+class _SensorCatalogWriter(object):
+    "Append object lines to per-sensor instance catalogs."
+    def __init__(self, outdir, header_lines, visit, chip_names=None):
+        self.outdir = outdir
+        self.header_lines = header_lines
+        self.visit = visit
+        self.chip_names = chip_names
+        self.files = dict()
+
+    def filename(self, chip_name):
+        "Instance catalog filename for a sensor, e.g., 'R:2,2 S:1,1'."
+        raft, sensor = chip_name.split()
+        return os.path.join(self.outdir, 'instcat_%07i_R%s_S%s.txt'
+                            % (self.visit, raft[2:].replace(',', ''),
+                               sensor[2:].replace(',', '')))
+
+    def write(self, lines, chip_names):
+        for chip_name in np.unique(chip_names[chip_names != np.array(None)]):
+            if self.chip_names is not None and chip_name not in self.chip_names:
+                continue
+            if chip_name not in self.files:
+                self.files[chip_name] = open(self.filename(chip_name), 'w')
+                self.files[chip_name].write('\n'.join(self.header_lines)
+                                            + '\n')
+            self.files[chip_name].write(
+                '\n'.join(lines[i] for i in np.where(chip_names == chip_name)[0])
+                + '\n')
+
+    def close(self):
+        for output in self.files.values():
+            output.close()
+
+@profiled()
+def run_visit_pipeline(instcat, outdir, chunk_size=100000,
+                       magnitude_processes=None, chip_processes=None,
+                       max_pending=None, chip_names=None, sed_table_file=None):
+    """
+    Compute the apparent magnitudes and write the per-sensor instance
+    catalogs for a visit in one pass over the instance catalog.
+
+    Parameters
+    ----------
+    instcat : str
+        Text instance catalog or binary instance catalog directory.
+    outdir : str
+        Output directory for the per-sensor instance catalogs.
+    chunk_size : int, optional
+        Number of objects per chunk.  Default: 100000
+    magnitude_processes : int, optional
+        Number of processes computing apparent magnitudes.
+        Default: None (i.e., multiprocessing.cpu_count())
+    chip_processes : int, optional
+        Number of processes assigning objects to sensors.
+        Default: None (i.e., max(1, multiprocessing.cpu_count()//4))
+    max_pending : int, optional
+        Maximum number of chunks submitted to each pool and held in
+        each queue.  Default: None (i.e., twice the number of processes
+        of the larger pool)
+    chip_names : sequence of str, optional
+        Sensors for which to write instance catalogs, e.g.,
+        ['R:2,2 S:1,1'].  Default: None (i.e., all sensors)
+    sed_table_file : str, optional
+        SedPhotometryTable file to use for the apparent magnitudes.
+        Default: None
+
+    Returns
+    -------
+    pandas.DataFrame
+        The apparent magnitudes, with the sensor names in the chipName
+        column.
+    """
+    from .instance_catalog_tools import parse_commands
+    if magnitude_processes is None:
+        magnitude_processes = multiprocessing.cpu_count()
+    if chip_processes is None:
+        chip_processes = max(1, multiprocessing.cpu_count()//4)
+    if max_pending is None:
+        max_pending = 2*max(magnitude_processes, chip_processes)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    header_lines, chunks = instcat_chunks(instcat, chunk_size=chunk_size)
+    commands = parse_commands(header_lines)
+    band = commands['bandpass']
+
+    magnitude_pool = multiprocessing.Pool(magnitude_processes,
+                                          initializer=_init_magnitude_worker,
+                                          initargs=(header_lines, band,
+                                                    sed_table_file))
+    chip_pool = multiprocessing.Pool(chip_processes,
+                                     initializer=_init_chip_worker,
+                                     initargs=(commands,))
+    line_queue = queue.Queue(maxsize=max_pending)
+    magnitude_queue = queue.Queue(maxsize=max_pending)
+    chip_queue = queue.Queue(maxsize=max_pending)
+    errors = []
+    threads = [threading.Thread(target=_reader,
+                                args=(chunks, line_queue, errors)),
+               threading.Thread(target=_pool_stage,
+                                args=(magnitude_pool, _compute_magnitudes,
+                                      lambda chunk: (chunk['lines'],),
+                                      'mags', max_pending, line_queue,
+                                      magnitude_queue, errors)),
+               threading.Thread(target=_pool_stage,
+                                args=(chip_pool, _chip_names,
+                                      lambda chunk: (chunk['mags']['raICRS'].values,
+                                                     chunk['mags']['decICRS'].values),
+                                      'chip_names', max_pending,
+                                      magnitude_queue, chip_queue, errors))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    writer = _SensorCatalogWriter(outdir, header_lines, commands['obshistid'],
+                                  chip_names=chip_names)
+    data_frames = []
+    try:
+        while True:
+            chunk = chip_queue.get()
+            if chunk is _end_of_stream:
+                break
+            with profile_stage('run_visit_pipeline.write',
+                               count=len(chunk['lines'])):
+                writer.write(chunk['lines'], chunk['chip_names'])
+            mags = chunk['mags']
+            mags['chipName'] = chunk['chip_names']
+            data_frames.append(mags[mags.pop('accepted').values])
+    except Exception as eobj:
+        errors.append(eobj)
+        _drain(chip_queue)
+        raise
+    finally:
+        writer.close()
+        for thread in threads:
+            thread.join()
+        for pool in (magnitude_pool, chip_pool):
+            pool.close()
+            pool.join()
+    if errors:
+        raise errors[0]
+    if not data_frames:
+        return pd.DataFrame(columns=['uniqueId', 'raICRS', 'decICRS',
+                                     'galSimType', band, 'chipName'])
+    return pd.concat(data_frames, ignore_index=True)
@@ -3,9 +3,14 @@ Example unit tests for ImSimDeep package
 """
 from __future__ import absolute_import, print_function
 import os
+import shutil
+import tempfile
 from collections import namedtuple
 import unittest
+import numpy as np
 import pandas as pd
+import lsst.utils as lsstUtils
+import lsst.sims.photUtils as photUtils
 import desc.imsim
 import desc.imsimdeep
 
@@ -29,5 +34,65 @@ class ObservedSEDsTestCase(unittest.TestCase):
             app_mag = desc.imsimdeep.ApparentMagnitude(pars.sedFilepath)
             self.assertAlmostEqual(app_mag(pars, 'u'), uband_mags[i])
 
+class SedPhotometryTableTestCase(unittest.TestCase):
+    "TestCase class for the SED photometry table."
+    def setUp(self):
+        infile = os.path.join(os.environ['IMSIMDEEP_DIR'], 'tests',
+                              'tiny_instcat.txt')
+        self.objects = desc.imsim.parsePhoSimInstanceFile(infile).objects
+        self.tmp_dir = tempfile.mkdtemp()
+        self.table_file = os.path.join(self.tmp_dir, 'sed_table.pkl')
+        desc.imsimdeep.build_sed_photometry_table(
+            self.table_file, sed_names=list(self.objects['sedFilepath']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_table_magnitudes(self):
+        "Test the table magnitudes against the full Sed integration."
+        sed_table = desc.imsimdeep.SedPhotometryTable.read(self.table_file)
+        for i in range(len(self.objects)):
+            # The undusted, zero-redshift version of each object.
+            pars = self.objects.iloc[i].copy()
+            pars['internalAv'] = pars['galacticAv'] = pars['redshift'] = 0.
+            app_mag = desc.imsimdeep.ApparentMagnitude(pars.sedFilepath)
+            table_app_mag = desc.imsimdeep.ApparentMagnitude(
+                pars.sedFilepath, sed_table=sed_table)
+            self.assertIsNotNone(table_app_mag.mag_offsets)
+            for band in 'ugrizy':
+                self.assertAlmostEqual(table_app_mag(pars, band),
+                                       app_mag(pars, band), places=6)
+
+    def test_magnitudes(self):
+        "Test the magnitudes of a set of objects with and without dust."
+        sed_table = desc.imsimdeep.SedPhotometryTable.read(self.table_file)
+        objs = self.objects.iloc[[1, 1, 1]].reset_index(drop=True)
+        objs.loc[0, ['internalAv', 'galacticAv', 'redshift']] = 0.
+        app_mag = desc.imsimdeep.ApparentMagnitude(objs['sedFilepath'][0],
+                                                   sed_table=sed_table)
+        mags = app_mag.magnitudes(objs, 'r')
+
+        # The table magnitude of the undusted, zero-redshift object
+        # against a direct Sed integration.
+        throughput_dir = lsstUtils.getPackageDir('throughputs')
+        bandpass = photUtils.Bandpass()
+        bandpass.readThroughput(os.path.join(throughput_dir, 'baseline',
+                                             'total_r.dat'))
+        imsim_bandpass = photUtils.Bandpass()
+        imsim_bandpass.imsimBandpass()
+        sed = photUtils.Sed()
+        sed.readSED_flambda(os.path.join(
+            lsstUtils.getPackageDir('sims_sed_library'),
+            objs['sedFilepath'][0]))
+        sed.multiplyFluxNorm(sed.calcFluxNorm(objs['magNorm'][0],
+                                              imsim_bandpass))
+        self.assertAlmostEqual(mags[0], sed.calcMag(bandpass), delta=1e-6)
+
+        # The other objects are computed without the table.
+        no_table = desc.imsimdeep.ApparentMagnitude(objs['sedFilepath'][0])
+        np.testing.assert_allclose(mags[1:], [no_table(objs.iloc[i], 'r')
+                                              for i in (1, 2)], rtol=1e-10)
+        self.assertNotAlmostEqual(mags[0], mags[1])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+"""
+Smoke test of the benchmark harness.
+"""
+from __future__ import absolute_import, print_function
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.environ['IMSIMDEEP_DIR'], 'benchmarks'))
+import run_benchmarks
+
+class RunBenchmarksTestCase(unittest.TestCase):
+    "TestCase class for the benchmark harness."
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_run_benchmarks(self):
+        "Run one benchmark on a tiny synthetic catalog."
+        results = run_benchmarks.run_benchmarks(
+            [100], selection=['truth_catalog_match'], work_dir=self.work_dir)
+        self.assertEqual(list(results.keys()), ['truth_catalog_match[100]'])
+        result = results['truth_catalog_match[100]']
+        self.assertEqual(result['items'], 100)
+        self.assertGreater(result['peak_rss_gb'], 0)
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+        baseline = dict((key, dict(elapsed=value['elapsed']/10.,
+                                   peak_rss_gb=value['peak_rss_gb']))
+                        for key, value in results.items())
+        regressions = run_benchmarks.compare_to_baseline(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(run_benchmarks.compare_to_baseline(results, results),
+                         [])
+
+if __name__ == '__main__':
+    unittest.main()
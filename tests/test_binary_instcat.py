@@ -0,0 +1,89 @@
+"""
+Unit tests for binary_instcat module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import desc.imsim
+import desc.imsimdeep
+
+class BinaryInstcatTestCase(unittest.TestCase):
+    "TestCase class for the binary instance catalog format."
+    def setUp(self):
+        self.instcat_file = os.path.join(os.environ['IMSIMDEEP_DIR'], 'tests',
+                                         'tiny_instcat.txt')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bin_dir = os.path.join(self.tmp_dir, 'instcat.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _round_trip(self, instcat_file, parse_objects=True):
+        desc.imsimdeep.text_to_binary(instcat_file, self.bin_dir,
+                                      parse_objects=parse_objects)
+        self.assertTrue(desc.imsimdeep.is_binary_instcat(self.bin_dir))
+        outfile = os.path.join(self.tmp_dir, 'round_trip.txt')
+        desc.imsimdeep.binary_to_text(self.bin_dir, outfile)
+        with open(instcat_file) as input_:
+            expected = input_.read()
+        with open(outfile) as input_:
+            self.assertEqual(input_.read(), expected)
+
+    def test_round_trip(self):
+        "Test exact text round trip and the readers."
+        self._round_trip(self.instcat_file)
+        self.assertEqual(desc.imsimdeep.instcat_commands(self.bin_dir),
+                         desc.imsimdeep.instcat_commands(self.instcat_file))
+        catalog = desc.imsimdeep.BinaryInstanceCatalog(self.bin_dir)
+        self.assertEqual(len(catalog), 2)
+        ra, dec = catalog.coordinates()
+        np.testing.assert_array_equal(ra, [53.0449009, 53.0124861])
+        np.testing.assert_array_equal(dec, [-27.3220807, -27.5409958])
+        self.assertEqual(catalog.object_lines([1])[0].split()[1], '140314')
+        objs = catalog.objects()
+        expected = desc.imsim.parsePhoSimInstanceFile(self.instcat_file).objects
+        self.assertEqual(list(objs.columns), list(expected.columns))
+        self.assertEqual(list(objs['sedFilepath']),
+                         list(expected['sedFilepath']))
+
+    def test_irregular_tokens(self):
+        "Test tokens that do not round-trip through numeric formatting."
+        instcat_file = os.path.join(self.tmp_dir, 'irregular.txt')
+        with open(instcat_file, 'w') as output:
+            output.write('# comment\nfilter 2\n')
+            output.write('object 1 1.0 2.50 20 a.spec 1e-05 0 0 0 0 0 point none\n')
+            output.write('object 2  1.5 -0.0 21 b.spec +3 inf 0 0 0 0 point none CCM 0.1 3.1\n')
+            output.write('object 3 1.25 2.0 22 a.spec 0.0100 0 0 0 0 0 point none')
+        self._round_trip(instcat_file, parse_objects=False)
+
+    def test_sky_cone_select(self):
+        "Test that the binary and text cone selections are identical."
+        instcat_file = os.path.join(self.tmp_dir, 'interleaved.txt')
+        with open(self.instcat_file) as input_:
+            lines = input_.readlines()
+        # Put non-object lines between and after the object lines, and
+        # omit the final newline.
+        lines.insert(-1, '# comment between the objects\n')
+        lines.append('# trailing comment')
+        with open(instcat_file, 'w') as output:
+            output.write(''.join(lines))
+        for radius in (0.1, 1.):
+            shutil.rmtree(self.bin_dir, ignore_errors=True)
+            desc.imsimdeep.text_to_binary(instcat_file, self.bin_dir,
+                                          parse_objects=False)
+            outfiles = []
+            for infile in (instcat_file, self.bin_dir):
+                outfiles.append(os.path.join(self.tmp_dir, 'cone_%i.txt'
+                                             % len(outfiles)))
+                desc.imsimdeep.sky_cone_select(infile, 53.0449009,
+                                               -27.3220807, radius,
+                                               outfiles[-1])
+            with open(outfiles[0], 'rb') as input0, \
+                    open(outfiles[1], 'rb') as input1:
+                self.assertEqual(input0.read(), input1.read())
+
+if __name__ == '__main__':
+    unittest.main()
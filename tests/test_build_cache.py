@@ -0,0 +1,95 @@
+"""
+Unit tests for build_cache module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import desc.imsimdeep
+
+class BuildManifestTestCase(unittest.TestCase):
+    "TestCase class for BuildManifest."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest_file = os.path.join(self.tmp_dir, 'manifest.json')
+        self.outfile = os.path.join(self.tmp_dir, 'output.txt')
+        self.ncalls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_output(self, contents):
+        self.ncalls += 1
+        with open(self.outfile, 'w') as output:
+            output.write(contents)
+
+    def test_run_stage(self):
+        "Test that up-to-date stages are skipped."
+        inputs = dict(obsHistID=230, boundLength=0.3)
+        manifest = desc.imsimdeep.BuildManifest(self.manifest_file)
+        self.assertTrue(manifest.run_stage('stage', inputs, [self.outfile],
+                                           self._write_output, 'foo'))
+        self.assertEqual(self.ncalls, 1)
+
+        # A new manifest instance reads the records from the file.
+        manifest = desc.imsimdeep.BuildManifest(self.manifest_file)
+        self.assertFalse(manifest.run_stage('stage', inputs, [self.outfile],
+                                            self._write_output, 'foo'))
+        self.assertEqual(self.ncalls, 1)
+
+        # Changed inputs.
+        inputs['boundLength'] = 0.4
+        self.assertTrue(manifest.run_stage('stage', inputs, [self.outfile],
+                                           self._write_output, 'foo'))
+        self.assertEqual(self.ncalls, 2)
+
+        # Modified output.
+        with open(self.outfile, 'a') as output:
+            output.write('bar')
+        self.assertTrue(manifest.run_stage('stage', inputs, [self.outfile],
+                                           self._write_output, 'foo'))
+        self.assertEqual(self.ncalls, 3)
+
+        # Missing output.
+        os.remove(self.outfile)
+        self.assertTrue(manifest.run_stage('stage', inputs, [self.outfile],
+                                           self._write_output, 'foo'))
+        self.assertEqual(self.ncalls, 4)
+
+    def test_shell_command(self):
+        "Test stages run as shell commands."
+        manifest = desc.imsimdeep.BuildManifest(self.manifest_file)
+        command = 'echo foo > %s' % self.outfile
+        self.assertTrue(manifest.run_stage('stage', dict(command=command),
+                                           [self.outfile], command))
+        self.assertTrue(manifest.is_current('stage', dict(command=command),
+                                            [self.outfile]))
+        self.assertFalse(manifest.run_stage('stage', dict(command=command),
+                                            [self.outfile], command))
+
+        # A failed command raises and is not recorded.
+        command = 'echo bar > %s; exit 1' % self.outfile
+        with self.assertRaises(RuntimeError) as context:
+            manifest.run_stage('stage', dict(command=command),
+                               [self.outfile], command)
+        self.assertIn('exit status 1', str(context.exception))
+        self.assertNotIn('stage', manifest.stages)
+
+        # So does a command that does not produce its outputs.
+        missing = os.path.join(self.tmp_dir, 'missing.txt')
+        self.assertRaises(RuntimeError, manifest.run_stage, 'stage',
+                          dict(command='true'), [missing], 'true')
+        self.assertNotIn('stage', manifest.stages)
+
+    def test_no_manifest_file(self):
+        "Test that stages are always run without a manifest file."
+        manifest = desc.imsimdeep.BuildManifest()
+        for ncalls in (1, 2):
+            manifest.run_stage('stage', dict(), [self.outfile],
+                               self._write_output, 'foo')
+            self.assertEqual(self.ncalls, ncalls)
+        self.assertFalse(os.path.isfile(self.manifest_file))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Unit tests for chip_assignment module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import unittest
+import numpy as np
+import pandas as pd
+import lsst.obs.lsstSim as obs_lsstSim
+import lsst.sims.coordUtils as coordUtils
+import desc.imsim
+import desc.imsimdeep
+
+# Silence the annoying INFO from the Stack when creating a mapper
+# without a registry.sqlite3 file.
+desc.imsim.get_logger('ERROR')
+
+class ChipAssignmentTestCase(unittest.TestCase):
+    "TestCase class for the parallel chip assignment."
+    def setUp(self):
+        instcat_file = os.path.join(os.environ['IMSIMDEEP_DIR'], 'tests',
+                                    'tiny_instcat.txt')
+        self.commands = desc.imsimdeep.instcat_commands(instcat_file)
+
+    def test_parallel_chip_names(self):
+        "Test that the parallel chip names match the serial call."
+        rng = np.random.RandomState(1001)
+        nobjs = 2000
+        ra = self.commands['rightascension'] + rng.uniform(-2, 2, nobjs)
+        dec = self.commands['declination'] + rng.uniform(-2, 2, nobjs)
+        expected = coordUtils.chipNameFromRaDec(
+            ra, dec, camera=obs_lsstSim.LsstSimMapper().camera,
+            obs_metadata=desc.imsimdeep.obs_metadata(self.commands))
+        chip_names = desc.imsimdeep.parallel_chip_names(ra, dec, self.commands,
+                                                        processes=3,
+                                                        chunk_size=150)
+        self.assertEqual(list(chip_names), list(expected))
+        self.assertIn(None, list(chip_names))
+
+    def test_select_by_chip_name(self):
+        "Test the opt-in parallel chip selection."
+        rng = np.random.RandomState(1002)
+        nobjs = 2000
+        objs = pd.DataFrame(
+            dict(ra=self.commands['rightascension'] + rng.uniform(-1, 1, nobjs),
+                 dec=self.commands['declination'] + rng.uniform(-1, 1, nobjs)))
+        obs_md = desc.imsimdeep.obs_metadata(self.commands)
+        camera = obs_lsstSim.LsstSimMapper().camera
+        # The central sensor and one that no object lands on.
+        for chip_name, min_objs in (('R:2,2 S:1,1', 1), ('R:0,0 S:1,1', 0)):
+            expected = desc.imsimdeep.select_by_chip_name(objs, chip_name,
+                                                          obs_md, camera)
+            my_objs = desc.imsimdeep.select_by_chip_name(objs, chip_name,
+                                                         obs_md, camera,
+                                                         processes=3)
+            self.assertEqual(list(my_objs.index), list(expected.index))
+            self.assertGreaterEqual(len(my_objs), min_objs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Unit tests for instcat_batch module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import astropy.io.fits as fits
+import desc.imsimdeep
+from desc.imsimdeep.instcat_comparison import _calibrations
+
+class InstcatBatchTestCase(unittest.TestCase):
+    "TestCase class for the batch instcat_comparison functions."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.repo = os.path.join(self.tmp_dir, 'repo')
+        self.app_mag_files = dict()
+        self.keys = []
+        for visit, band in ((230, 'r'), (231, 'i')):
+            ra = np.linspace(0.01, 0.05, 5)
+            dec = np.linspace(-30.05, -30.01, 5)
+            instcat = pd.DataFrame(dict(raICRS=ra, decICRS=dec,
+                                        galSimType=['pointSource']*5))
+            instcat[band] = np.arange(20., 25.)
+            self.app_mag_files[visit] = os.path.join(self.tmp_dir,
+                                                     'mags_%i.pkl' % visit)
+            instcat.to_pickle(self.app_mag_files[visit])
+            for raft_name, sensor_name in (('R22', 'S11'), ('R22', 'S12')):
+                sensor_dir = os.path.join(self.repo, 'forced', '0',
+                                          'v%i-f%s' % (visit, band),
+                                          raft_name)
+                if not os.path.isdir(sensor_dir):
+                    os.makedirs(sensor_dir)
+                columns = [fits.Column(name='id', format='K',
+                                       array=np.arange(5)),
+                           fits.Column(name='coord_ra', format='D',
+                                       array=np.radians(ra)),
+                           fits.Column(name='coord_dec', format='D',
+                                       array=np.radians(dec)),
+                           fits.Column(name='base_PsfFlux_flux', format='D',
+                                       array=np.full(5, 100.)),
+                           fits.Column(name='base_PsfFlux_fluxSigma',
+                                       format='D', array=np.ones(5))]
+                fits.BinTableHDU.from_columns(columns).writeto(
+                    os.path.join(sensor_dir, sensor_name + '.fits'))
+                raft = '%s,%s' % tuple(raft_name[1:])
+                sensor = '%s,%s' % tuple(sensor_name[1:])
+                # Pre-load the calexp calibration cache, so that no
+                # calexps are needed.
+                key = (self.repo, visit, raft, sensor)
+                _calibrations[key] = (1e10, band)
+                self.keys.append(key)
+
+    def tearDown(self):
+        for key in self.keys:
+            _calibrations.pop(key, None)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_sensor_catalogs(self):
+        "Test finding the sensor catalogs of a visit."
+        self.assertEqual(desc.imsimdeep.find_sensor_catalogs(self.repo, 230),
+                         [('2,2', '1,1'), ('2,2', '1,2')])
+        self.assertEqual(desc.imsimdeep.find_sensor_catalogs(self.repo, 232),
+                         [])
+        self.assertEqual(desc.imsimdeep.find_sensor_catalogs(
+            self.repo, 230, catalog_type='src'), [])
+
+    def test_batch_instcat_comparison(self):
+        "Test the combined results and the recorded failures."
+        # A visit without an apparent magnitude file and a visit
+        # without catalogs.
+        os.remove(self.app_mag_files[231])
+        self.app_mag_files[232] = self.app_mag_files[230]
+        df, errors = desc.imsimdeep.batch_instcat_comparison(
+            self.app_mag_files, self.repo, processes=2)
+        self.assertEqual(len(df), 10)
+        self.assertEqual(set(df['visit']), set([230]))
+        self.assertEqual(sorted(set(zip(df['raft'], df['sensor']))),
+                         [('2,2', '1,1'), ('2,2', '1,2')])
+        np.testing.assert_allclose(df['offset'].values, 0., atol=1e-6)
+        np.testing.assert_allclose(df['magnitude'].values, 20.)
+        self.assertEqual(sorted(errors), [(231, None, None),
+                                          (232, None, None)])
+
+        # A sensor with an unreadable catalog.
+        df, errors = desc.imsimdeep.batch_instcat_comparison(
+            {230: self.app_mag_files[230]}, self.repo, processes=1,
+            flux_col='missing_flux')
+        self.assertEqual(len(df), 0)
+        self.assertEqual(sorted(errors), [(230, '2,2', '1,1'),
+                                          (230, '2,2', '1,2')])
+
+    def test_write_batch_results(self):
+        "Test writing the combined data frame."
+        df, errors = desc.imsimdeep.batch_instcat_comparison(
+            self.app_mag_files, self.repo, processes=1)
+        self.assertEqual(errors, dict())
+        outfile = os.path.join(self.tmp_dir, 'batch.pkl')
+        desc.imsimdeep.write_batch_results(df, outfile)
+        pd.testing.assert_frame_equal(pd.read_pickle(outfile), df)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+"""
+Unit tests for instcat_comparison module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import astropy.io.fits as fits
+import pandas as pd
+from desc.imsimdeep.instcat_comparison import Level2Catalog, \
+    TruthCatalogIndex, plot_instcat_offsets, plot_config, _binned_mean_vectors
+from desc.imsimdeep.spherical_match import great_circle_separation
+
+class Level2CatalogTestCase(unittest.TestCase):
+    "TestCase class for Level2Catalog."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_files = []
+        for i, flux in enumerate(([10., -1., np.nan, 5.], [3., 0.])):
+            nrows = len(flux)
+            columns = [fits.Column(name='id', format='K',
+                                   array=np.arange(nrows) + 100*i),
+                       fits.Column(name='coord_ra', format='D',
+                                   array=np.linspace(0.1, 0.2, nrows)),
+                       fits.Column(name='coord_dec', format='D',
+                                   array=np.linspace(-0.5, -0.4, nrows)),
+                       fits.Column(name='base_PsfFlux_flux', format='D',
+                                   array=np.array(flux)),
+                       fits.Column(name='base_PsfFlux_fluxSigma', format='D',
+                                   array=np.ones(nrows)),
+                       fits.Column(name='other', format='20D',
+                                   array=np.zeros((nrows, 20)))]
+            src_file = os.path.join(self.tmp_dir, 'src_%i.fits' % i)
+            fits.BinTableHDU.from_columns(columns).writeto(src_file)
+            self.src_files.append(src_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_src_file(self):
+        "Test reading of a single file."
+        catalog = Level2Catalog.read_src_file(self.src_files[0])
+        self.assertEqual(len(catalog), 4)
+        self.assertTrue(catalog.coord_ra.dtype.isnative)
+        np.testing.assert_array_equal(catalog.objectId, np.arange(4))
+
+        catalog = Level2Catalog.read_src_file(self.src_files[0],
+                                              positive_flux=True)
+        np.testing.assert_array_equal(catalog.objectId, [0, 3])
+        np.testing.assert_array_equal(catalog.flux, [10., 5.])
+
+    def test_read_src_files(self):
+        "Test reading of multiple files."
+        catalog = Level2Catalog.read_src_files(self.src_files,
+                                               positive_flux=True)
+        np.testing.assert_array_equal(catalog.objectId, [0, 3, 100])
+        np.testing.assert_array_equal(catalog.file_index, [0, 0, 1])
+
+class TruthCatalogIndexTestCase(unittest.TestCase):
+    "TestCase class for TruthCatalogIndex."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(1234)
+        nobjs = 500
+        self.instcat = pd.DataFrame(
+            dict(raICRS=rng.uniform(-0.2, 0.2, nobjs) % 360.,
+                 decICRS=rng.uniform(-30.2, -29.8, nobjs),
+                 galSimType=rng.choice(['pointSource', 'sersic'], nobjs),
+                 r=rng.uniform(18, 25, nobjs)))
+        # Measured positions: perturbed instance catalog positions and
+        # some spurious detections.
+        nmeas = 100
+        ra = np.append(self.instcat['raICRS'].values[:nmeas]
+                       + rng.normal(0, 1e-4, nmeas),
+                       rng.uniform(-0.2, 0.2, 20) % 360.)
+        dec = np.append(self.instcat['decICRS'].values[:nmeas]
+                        + rng.normal(0, 1e-4, nmeas),
+                        rng.uniform(-30.2, -29.8, 20))
+        self.catalog = Level2Catalog(np.arange(len(ra)), np.radians(ra),
+                                     np.radians(dec), np.ones(len(ra)),
+                                     np.ones(len(ra)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _brute_force_match(self, match_radius=None):
+        "Nearest instance catalog object by computing all separations."
+        ra = np.degrees(self.catalog.coord_ra)
+        dec = np.degrees(self.catalog.coord_dec)
+        offsets, indexes = [], []
+        for ra_meas, dec_meas in zip(ra, dec):
+            seps = great_circle_separation(ra_meas, dec_meas,
+                                           self.instcat['raICRS'].values,
+                                           self.instcat['decICRS'].values)
+            indexes.append(np.argmin(seps))
+            offsets.append(seps[indexes[-1]])
+        offsets, indexes = np.array(offsets), np.array(indexes)
+        if match_radius is None:
+            return offsets, indexes, np.arange(len(ra))
+        matched = np.where(offsets <= match_radius)[0]
+        return offsets[matched], indexes[matched], matched
+
+    def _check_match(self, truth_index, match_radius=None):
+        df = truth_index.match(self.catalog, 'r', match_radius=match_radius)
+        offsets, indexes, matched = self._brute_force_match(match_radius)
+        truth = self.instcat.iloc[indexes]
+        np.testing.assert_array_equal(df['objectId'].values, matched)
+        np.testing.assert_allclose(df['offset'].values, offsets, atol=1e-6)
+        np.testing.assert_array_equal(df['coord_ra_true'].values,
+                                      truth['raICRS'].values)
+        np.testing.assert_array_equal(df['magnitude_true'].values,
+                                      truth['r'].values)
+        np.testing.assert_array_equal(df['galSimType'].astype(str).values,
+                                      truth['galSimType'].values)
+
+    def test_match(self):
+        "Test the matches against a brute force search."
+        truth_index = TruthCatalogIndex(self.instcat)
+        self._check_match(truth_index)
+        self._check_match(truth_index, match_radius=1.)
+
+    def test_pickle_round_trip(self):
+        "Test reading from a pickle file and pickling an index."
+        app_mag_file = os.path.join(self.tmp_dir, 'app_mags.pkl')
+        self.instcat.to_pickle(app_mag_file)
+        truth_index = TruthCatalogIndex.read(app_mag_file)
+        self._check_match(truth_index)
+        self._check_match(pickle.loads(pickle.dumps(truth_index)),
+                          match_radius=1.)
+
+class OffsetPlotTestCase(unittest.TestCase):
+    "TestCase class for the binned offset vectors."
+    def setUp(self):
+        rng = np.random.RandomState(5678)
+        nobjs = 10000
+        ra_true = rng.uniform(10., 11., nobjs)
+        dec_true = rng.uniform(-30., -29., nobjs)
+        ra = ra_true + 1e-4
+        dec = dec_true.copy()
+        # Objects with zero offsets have undefined directions.
+        ra[:10] = ra_true[:10]
+        offset = great_circle_separation(ra_true, dec_true, ra, dec)
+        self.df = pd.DataFrame(dict(coord_ra_true=ra_true,
+                                    coord_dec_true=dec_true,
+                                    coord_ra=ra, coord_dec=dec,
+                                    offset=offset))
+        self.max_points = plot_config['max_points']
+
+    def tearDown(self):
+        plot_config['max_points'] = self.max_points
+        plt.close('all')
+
+    def test_binned_mean_vectors(self):
+        "Test the cell means, omitting non-finite vectors."
+        x = np.array([0., 0.2, 0.3, 0.8, 1.])
+        y = np.array([0., 0.2, 0.3, 0.8, 1.])
+        u = np.array([1., 3., np.nan, 2., 5.])
+        v = np.array([1., 1., 7., np.inf, 6.])
+        xc, yc, um, vm = _binned_mean_vectors(x, y, u, v, 2)
+        np.testing.assert_allclose(xc, [0.25, 0.75])
+        np.testing.assert_allclose(yc, [0.25, 0.75])
+        np.testing.assert_allclose(um, [2., 5.])
+        np.testing.assert_allclose(vm, [1., 6.])
+
+        xc, yc, um, vm = _binned_mean_vectors(x[2:4], y[2:4], u[2:4],
+                                              v[2:4], 2)
+        self.assertEqual(len(xc), 0)
+
+    def test_plot_instcat_offsets(self):
+        "Test the quiver plots of individual and binned offsets."
+        for max_points, num_vectors in ((len(self.df), len(self.df)),
+                                        (100, plot_config['offset_bins']**2)):
+            plot_config['max_points'] = max_points
+            plt.figure()
+            plot_instcat_offsets(self.df, 'v230-fr', 'R:2,2 S:1,1')
+            quiver = plt.gca().collections[0]
+            self.assertEqual(len(quiver.U), num_vectors)
+            if max_points < len(self.df):
+                self.assertTrue(np.all(np.isfinite(quiver.U)))
+                np.testing.assert_allclose(quiver.V, 0., atol=1e-12)
+
+class StubButler(object):
+    "Butler stand-in serving calexp metadata as dicts."
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.reads = []
+
+    def get(self, datasetType, dataId=None):
+        self.reads.append((datasetType, dataId['visit'], dataId['raft'],
+                           dataId['sensor']))
+        return self.metadata[dataId['visit']]
+
+class StubAfwImage(object):
+    "Stand-in for lsst.afw.image reading the stub metadata."
+    class Calib(object):
+        def __init__(self, metadata):
+            self.metadata = metadata
+
+        def getFluxMag0(self):
+            return self.metadata['FLUXMAG0'], self.metadata['FLUXMAG0ERR']
+
+    class Filter(object):
+        def __init__(self, metadata):
+            self.metadata = metadata
+
+        def getName(self):
+            return self.metadata['FILTER']
+
+class CalexpCalibrationTestCase(unittest.TestCase):
+    "TestCase class for calexp_calibration."
+    def setUp(self):
+        # The function module, which is shadowed by the function of
+        # the same name in the package namespace.
+        self.module = sys.modules['desc.imsimdeep.instcat_comparison']
+        self.afwImage = self.module.afwImage
+        self.module.afwImage = StubAfwImage
+        self.repo = 'stub_repo'
+        self.butler = StubButler({230: dict(FLUXMAG0=1e12, FLUXMAG0ERR=1e9,
+                                            FILTER='r'),
+                                  231: dict(FLUXMAG0=2e12, FLUXMAG0ERR=1e9,
+                                            FILTER='i')})
+        self.module._butlers[self.repo] = self.butler
+
+    def tearDown(self):
+        self.module.afwImage = self.afwImage
+        self.module._butlers.pop(self.repo)
+        for key in list(self.module._calibrations):
+            if key[0] == self.repo:
+                del self.module._calibrations[key]
+
+    def test_calexp_calibration(self):
+        "Test that the metadata are read once per sensor-visit."
+        for _ in range(3):
+            self.assertEqual(self.module.calexp_calibration(self.repo, 230,
+                                                            '2,2', '1,1'),
+                             (1e12, 'r'))
+        self.assertEqual(self.butler.reads,
+                         [('calexp_md', 230, '2,2', '1,1')])
+        for _ in range(2):
+            self.assertEqual(self.module.calexp_calibration(self.repo, 231,
+                                                            '2,2', '1,1'),
+                             (2e12, 'i'))
+        self.assertEqual(len(self.butler.reads), 2)
+
+if __name__ == '__main__':
+    unittest.main()
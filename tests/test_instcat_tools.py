@@ -3,9 +3,11 @@ Unit tests for instcat_tools
 """
 from __future__ import print_function, absolute_import
 import os
+import tempfile
 from collections import namedtuple
 import unittest
 import numpy as np
+import pandas as pd
 import lsst.obs.lsstSim as obs_lsstSim
 import desc.imsim
 import desc.imsimdeep
@@ -79,5 +81,49 @@ class InstcatToolsTestCase(unittest.TestCase):
         self.assertAlmostEqual(ra, 31.115931707503101)
         self.assertAlmostEqual(dec, -10.095510308565457)
 
+    def test_encode_categoricals(self):
+        "Test the conversion of string columns to categoricals."
+        objs = pd.DataFrame(dict(sedFilepath=['a.spec', 'b.spec', 'a.spec',
+                                              None],
+                                 galSimType=['sersic', 'pointSource',
+                                             'sersic', 'sersic'],
+                                 magNorm=[20., 21., 22., 23.]))
+        expected = objs.copy()
+        self.assertIs(desc.imsimdeep.encode_categoricals(objs), objs)
+        for column in ('sedFilepath', 'galSimType'):
+            self.assertEqual(objs[column].dtype.name, 'category')
+            self.assertEqual(list(objs[column].astype(object).fillna('')),
+                             list(expected[column].fillna('')))
+        self.assertEqual(objs['sedFilepath'].cat.codes.values[-1], -1)
+        self.assertEqual(len(objs['sedFilepath'].cat.categories), 2)
+        self.assertEqual(objs['magNorm'].dtype, np.float64)
+        self.assertIs(desc.imsimdeep.encode_categoricals(objs,
+                                                         columns=['xyz']),
+                      objs)
+
+    def test_read_instance_catalog(self):
+        "Test the chunked reading of a text instance catalog."
+        commands, expected = desc.imsim.parsePhoSimInstanceFile(
+            self.instcat_file)
+        # The chunks are parsed without writing temporary files.
+        mkstemp = tempfile.mkstemp
+        def no_mkstemp(*args, **kwds):
+            raise AssertionError('temporary file written')
+        tempfile.mkstemp = no_mkstemp
+        try:
+            results = [desc.imsimdeep.read_instance_catalog(
+                self.instcat_file, chunk_size=chunk_size)
+                       for chunk_size in (1, 2, 10)]
+        finally:
+            tempfile.mkstemp = mkstemp
+        for my_commands, objs in results:
+            self.assertEqual(my_commands, commands)
+            self.assertEqual(objs['sedFilepath'].dtype.name, 'category')
+            self.assertEqual(list(objs.columns), list(expected.columns))
+            self.assertEqual(list(objs.index), list(expected.index))
+            for column in expected.columns:
+                self.assertEqual(list(objs[column].astype(object)),
+                                 list(expected[column].astype(object)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+"""
+Unit tests for magnitude_cache module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import desc.imsimdeep
+
+class MagnitudeCacheTestCase(unittest.TestCase):
+    "TestCase class for MagnitudeCache."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, 'mags.sqlite3')
+        nobjs = 10
+        self.objs = pd.DataFrame(dict(uniqueId=np.arange(nobjs) + 2**40,
+                                      sedFilepath=['a.spec', 'b.spec']*5,
+                                      magNorm=np.linspace(20, 25, nobjs),
+                                      internalAv=np.zeros(nobjs),
+                                      internalRv=np.zeros(nobjs),
+                                      galacticAv=np.ones(nobjs)*0.1,
+                                      galacticRv=np.ones(nobjs)*3.1,
+                                      redshift=np.zeros(nobjs)))
+        self.mags = np.linspace(21, 26, nobjs)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookup(self):
+        "Test lookups of cached and changed objects."
+        cache = desc.imsimdeep.MagnitudeCache(self.db_file,
+                                              photometry_version='v1')
+        np.testing.assert_array_equal(cache.lookup(self.objs, 'r'),
+                                      np.nan*np.ones(len(self.objs)))
+        cache.insert(self.objs[:6], 'r', self.mags[:6])
+        cache.close()
+
+        cache = desc.imsimdeep.MagnitudeCache(self.db_file,
+                                              photometry_version='v1')
+        self.assertEqual(len(cache), 6)
+        objs = self.objs.copy()
+        objs['sedFilepath'] = objs['sedFilepath'].astype('category')
+        objs.loc[1, 'galacticAv'] = 0.2
+        mags = cache.lookup(objs, 'r')
+        np.testing.assert_array_equal(mags[[0, 2, 3, 4, 5]],
+                                      self.mags[[0, 2, 3, 4, 5]])
+        self.assertTrue(np.all(np.isnan(mags[[1, 6, 7, 8, 9]])))
+        self.assertTrue(np.all(np.isnan(cache.lookup(objs, 'i'))))
+        cache.close()
+
+    def test_photometry_version(self):
+        "Test that a new photometry version clears the cache."
+        cache = desc.imsimdeep.MagnitudeCache(self.db_file,
+                                              photometry_version='v1')
+        cache.insert(self.objs, 'r', self.mags)
+        cache.close()
+        cache = desc.imsimdeep.MagnitudeCache(self.db_file,
+                                              photometry_version='v1')
+        self.assertEqual(len(cache), len(self.objs))
+        cache.close()
+        cache = desc.imsimdeep.MagnitudeCache(self.db_file,
+                                              photometry_version='v2')
+        self.assertEqual(len(cache), 0)
+        self.assertTrue(np.all(np.isnan(cache.lookup(self.objs, 'r'))))
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Unit tests for opsim_visits module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+import desc.imsimdeep
+
+# Columns of the OpSim v3 Summary table.
+summary_columns = ('obsHistID', 'sessionID', 'propID', 'fieldID', 'fieldRA',
+                   'fieldDec', 'filter', 'expDate', 'expMJD', 'night',
+                   'visitTime', 'visitExpTime', 'finRank', 'FWHMeff',
+                   'FWHMgeom', 'transparency', 'airmass', 'vSkyBright',
+                   'filtSkyBrightness', 'rotSkyPos', 'rotTelPos', 'lst',
+                   'altitude', 'azimuth', 'dist2Moon', 'solarElong', 'moonRA',
+                   'moonDec', 'moonAlt', 'moonAZ', 'moonPhase', 'sunAlt',
+                   'sunAz', 'phaseAngle', 'rScatter', 'mieScatter',
+                   'moonIllum', 'moonBright', 'darkBright', 'rawSeeing',
+                   'wind', 'humidity', 'slewDist', 'slewTime',
+                   'fiveSigmaDepth', 'ditheredRA', 'ditheredDec')
+column_types = dict(obsHistID='integer', sessionID='integer',
+                    propID='integer', fieldID='integer', night='integer',
+                    filter='text')
+
+class OpSimVisitIndexTestCase(unittest.TestCase):
+    "TestCase class for OpSimVisitIndex."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.opsim_db = os.path.join(self.tmp_dir, 'opsim.db')
+        conn = sqlite3.connect(self.opsim_db)
+        conn.execute('create table Summary (%s)'
+                     % ', '.join('%s %s' % (column, column_types.get(column,
+                                                                     'real'))
+                                 for column in summary_columns))
+        rows = []
+        for i, (ra, dec) in enumerate([(0.1, -30.), (359.9, -30.),
+                                       (10., -30.), (0., 90.)]):
+            for propID in (1, 2):
+                row = dict((column, 0.5) for column in summary_columns)
+                row.update(obsHistID=i + 1, propID=propID,
+                           fieldRA=np.radians(ra), fieldDec=np.radians(dec),
+                           expMJD=59580. + i, filter='r', rotSkyPos=0.1,
+                           fiveSigmaDepth=24.5, FWHMeff=0.7, FWHMgeom=0.6)
+                rows.append(tuple(row[column] for column in summary_columns))
+        conn.executemany('insert into Summary values (%s)'
+                         % ','.join(['?']*len(summary_columns)), rows)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read(self):
+        "Test reading selected visits and the cache file."
+        cache_file = os.path.join(self.tmp_dir, 'visits.pkl')
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(
+            self.opsim_db, obsHistIDs=[3, 1], cache_file=cache_file)
+        self.assertEqual(list(index.visits.index), [1, 3])
+        self.assertIn(3, index)
+        self.assertNotIn(2, index)
+        self.assertTrue(os.path.isfile(cache_file))
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(
+            self.opsim_db, obsHistIDs=[1, 3], cache_file=cache_file)
+        self.assertEqual(len(index), 2)
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(
+            self.opsim_db, columns=['fieldRA', 'fieldDec'])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(list(index.visits.columns), ['fieldRA', 'fieldDec'])
+
+    def test_visits_near(self):
+        "Test the pointing lookups across RA=0."
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(self.opsim_db)
+        np.testing.assert_array_equal(index.visits_near(0., -30., 1.), [1, 2])
+        np.testing.assert_array_equal(index.visits_near(0., 89.5, 1.), [4])
+        self.assertEqual(len(index.visits_near(180., 0., 1.)), 0)
+
+    def test_obs_metadata(self):
+        "Test the ObservationMetaData construction."
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(self.opsim_db)
+        obs_md = index.obs_metadata(3, boundLength=0.3)
+        self.assertAlmostEqual(obs_md.pointingRA, 10.)
+        self.assertAlmostEqual(obs_md.mjd.TAI, 59582.)
+        self.assertEqual(obs_md.bandpass, 'r')
+        self.assertEqual(obs_md.OpsimMetaData['obsHistID'], 3)
+
+    def test_obs_metadata_generator(self):
+        "Compare with ObservationMetaDataGenerator.getObservationMetaData."
+        from lsst.sims.catUtils.utils import ObservationMetaDataGenerator
+        generator = ObservationMetaDataGenerator(database=self.opsim_db,
+                                                 driver='sqlite')
+        index = desc.imsimdeep.OpSimVisitIndex.from_opsim_db(self.opsim_db)
+        for obsHistID in (1, 4):
+            expected = generator.getObservationMetaData(obsHistID=obsHistID,
+                                                        boundLength=0.3)[0]
+            obs_md = index.obs_metadata(obsHistID, boundLength=0.3)
+            for attr in ('pointingRA', 'pointingDec', 'rotSkyPos',
+                         'boundLength'):
+                self.assertAlmostEqual(getattr(obs_md, attr),
+                                       getattr(expected, attr))
+            self.assertEqual(obs_md.mjd.TAI, expected.mjd.TAI)
+            self.assertEqual(obs_md.bandpass, expected.bandpass)
+            self.assertEqual(obs_md.boundType, expected.boundType)
+            self.assertEqual(obs_md.m5, expected.m5)
+            self.assertEqual(obs_md.seeing, expected.seeing)
+            self.assertEqual(obs_md.skyBrightness, expected.skyBrightness)
+            for key, value in expected.OpsimMetaData.items():
+                self.assertEqual(obs_md.OpsimMetaData[key], value, key)
+
+if __name__ == '__main__':
+    unittest.main()
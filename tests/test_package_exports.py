@@ -0,0 +1,33 @@
+"""
+Unit tests for the lazily imported package namespace.
+"""
+from __future__ import absolute_import, print_function
+import importlib
+import unittest
+import desc.imsimdeep
+
+class PackageExportsTestCase(unittest.TestCase):
+    "TestCase class for the desc.imsimdeep public names."
+    def test_exports(self):
+        "Test that the export table matches the submodules' __all__."
+        for submodule, names in desc.imsimdeep._submodule_exports:
+            module = importlib.import_module('desc.imsimdeep.' + submodule)
+            if hasattr(module, '__all__'):
+                self.assertEqual(list(names), list(module.__all__))
+            for name in names:
+                self.assertIs(getattr(desc.imsimdeep, name),
+                              getattr(module, name))
+
+    def test_shadowed_names(self):
+        "Test exported functions with the same names as their submodules."
+        importlib.import_module('desc.imsimdeep.instcat_batch')
+        self.assertTrue(callable(desc.imsimdeep.instcat_comparison))
+        self.assertTrue(callable(desc.imsimdeep.build_index_files))
+
+    def test_missing_name(self):
+        "Test that unknown names raise AttributeError."
+        self.assertRaises(AttributeError, getattr, desc.imsimdeep,
+                          'no_such_name')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Unit tests for photometry module.
+"""
+from __future__ import absolute_import, print_function
+import unittest
+import numpy as np
+import desc.imsimdeep
+
+class PhotometryTestCase(unittest.TestCase):
+    "TestCase class for photometry functions."
+    def setUp(self):
+        np.random.seed(1234)
+
+    def tearDown(self):
+        pass
+
+    def test_MagFromAdu(self):
+        "Test the conversion with per-sensor zero points."
+        mag_from_adu = desc.imsimdeep.MagFromAdu([1e10, 1e11])
+        counts = np.array([1e2, 1e2, 1e3])
+        sensor_index = np.array([0, 1, 1])
+        np.testing.assert_allclose(mag_from_adu(counts, sensor_index),
+                                   [20., 22.5, 20.])
+        np.testing.assert_allclose(mag_from_adu.error(counts, 0.01*counts),
+                                   2.5/np.log(10.)*0.01)
+
+    def test_residual_statistics(self):
+        "Compare residual statistics to per-bin numpy calculations."
+        nobjs = 5000
+        mag_true = np.random.uniform(16, 25, nobjs)
+        mag_meas = mag_true + np.random.normal(0.01, 0.05, nobjs)
+        groups = np.random.choice(['R22_S11', 'R22_S12', 'R22_S21'], nobjs)
+        bins = np.arange(16, 26)
+        stats = desc.imsimdeep.residual_statistics(mag_true, mag_meas, bins,
+                                                   groups=groups)
+        self.assertEqual(len(stats), 27)
+        self.assertEqual(stats['count'].sum(), nobjs)
+        for _, row in stats.iterrows():
+            index = np.where((groups == row['group'])
+                             & (mag_true >= row['mag_min'])
+                             & (mag_true < row['mag_max']))
+            resids = (mag_meas - mag_true)[index]
+            self.assertEqual(row['count'], len(resids))
+            self.assertAlmostEqual(row['mean'], np.mean(resids))
+            self.assertAlmostEqual(row['median'], np.median(resids))
+            mad = np.median(np.abs(resids - np.median(resids)))
+            self.assertAlmostEqual(row['sigma_mad'], 1.4826*mad)
+
+        stats = desc.imsimdeep.residual_statistics(mag_true, mag_meas, bins)
+        self.assertEqual(len(stats), 9)
+        self.assertNotIn('group', stats.columns)
+
+if __name__ == '__main__':
+    unittest.main()
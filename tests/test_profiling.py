@@ -0,0 +1,98 @@
+"""
+Unit tests for profiling module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+import desc.imsimdeep
+
+class ProfilingTestCase(unittest.TestCase):
+    "TestCase class for the profiling tools."
+    def setUp(self):
+        desc.imsimdeep.stage_registry.clear()
+
+    def tearDown(self):
+        desc.imsimdeep.enable_profiling(False)
+        desc.imsimdeep.stage_registry.clear()
+
+    def test_disabled(self):
+        "Test that nothing is recorded if profiling is disabled."
+        desc.imsimdeep.enable_profiling(False)
+        with desc.imsimdeep.profile_stage('my_stage') as stage:
+            stage.count = 10
+        self.assertEqual(len(desc.imsimdeep.stage_registry), 0)
+
+    def test_profile_stage(self):
+        "Test the context manager and decorator."
+        desc.imsimdeep.enable_profiling()
+
+        @desc.imsimdeep.profiled('my_func')
+        def my_func(nitems):
+            "Function to profile."
+            with desc.imsimdeep.profile_stage('my_stage') as stage:
+                stage.count = nitems
+                return sum(range(nitems))
+
+        for _ in range(3):
+            self.assertEqual(my_func(1000), 499500)
+        registry = desc.imsimdeep.stage_registry
+        self.assertEqual(list(registry.keys()), ['my_stage', 'my_func'])
+        self.assertEqual(registry['my_func']['calls'], 3)
+        self.assertEqual(registry['my_stage']['count'], 3000)
+        self.assertGreaterEqual(registry['my_func']['wall_time'],
+                                registry['my_stage']['wall_time'])
+        # The RSS is sampled for every stage, the USS only for the
+        # outermost stages.
+        self.assertGreater(registry['my_func']['rss_gb'], 0)
+        self.assertGreater(registry['my_stage']['rss_gb'], 0)
+        self.assertGreater(registry['my_func']['uss_gb'], 0)
+        self.assertIsNone(registry['my_stage']['uss_gb'])
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            outfile = os.path.join(tmp_dir, 'profile.json')
+            desc.imsimdeep.dump_profile(outfile)
+            with open(outfile) as input_:
+                contents = json.load(input_)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(contents['stages']['my_func']['calls'], 3)
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'),
+                         'tracemalloc.reset_peak is not available')
+    def test_tracemalloc_peaks(self):
+        "Test the per-stage tracemalloc peaks of nested stages."
+        desc.imsimdeep.enable_profiling()
+        config = sys.modules['desc.imsimdeep.profiling']._config
+        config['tracemalloc'] = True
+        try:
+            with desc.imsimdeep.profile_stage('outer'):
+                with desc.imsimdeep.profile_stage('big'):
+                    data = bytearray(50*1024**2)
+                    del data
+                with desc.imsimdeep.profile_stage('small'):
+                    data = bytearray(1024**2)
+                    del data
+        finally:
+            config['tracemalloc'] = False
+        registry = desc.imsimdeep.stage_registry
+        big = registry['big']['tracemalloc_peak_gb']*1024
+        small = registry['small']['tracemalloc_peak_gb']*1024
+        outer = registry['outer']['tracemalloc_peak_gb']*1024
+        self.assertGreater(big, 49)
+        # The peak of a stage excludes the allocations of earlier
+        # stages, but includes those of its nested stages.
+        self.assertLess(small, 10)
+        self.assertGreater(outer, 49)
+        self.assertGreaterEqual(registry['big']['rss_growth_gb'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
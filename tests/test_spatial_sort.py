@@ -0,0 +1,77 @@
+"""
+Unit tests for spatial_sort module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import desc.imsimdeep
+from desc.imsimdeep.spatial_sort import _hilbert_index
+
+class SpatialSortTestCase(unittest.TestCase):
+    "TestCase class for spatially sorted instance catalogs."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.instcat_file = os.path.join(self.tmp_dir, 'instcat.txt')
+        rng = np.random.RandomState(87)
+        nobjs = 1000
+        ra = (rng.uniform(-1, 1, nobjs) + 360.) % 360.
+        dec = rng.uniform(-31, -29, nobjs)
+        with open(self.instcat_file, 'w') as output:
+            output.write('rightascension 0.0\ndeclination -30.0\nfilter 2\n')
+            for i in range(nobjs):
+                output.write('object %i %.7f %.7f 20 starSED/a.spec.gz '
+                             '0 0 0 0 0 0 point none none\n'
+                             % (i, ra[i], dec[i]))
+                if i == nobjs//2:
+                    output.write('# a comment\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hilbert_index(self):
+        "Test that the Hilbert curve visits each grid cell once."
+        order = 3
+        x, y = np.meshgrid(np.arange(2**order), np.arange(2**order))
+        d = _hilbert_index(x.ravel(), y.ravel(), order)
+        self.assertEqual(sorted(d), list(range(4**order)))
+        path = np.argsort(d)
+        steps = (np.abs(np.diff(x.ravel()[path]))
+                 + np.abs(np.diff(y.ravel()[path])))
+        self.assertTrue(np.all(steps == 1))
+
+    def test_sort_and_cone_select(self):
+        "Test the sorted lines and the block index cone selection."
+        with open(self.instcat_file) as input_:
+            lines = input_.readlines()
+        outfile = os.path.join(self.tmp_dir, 'sorted.txt')
+        block_index = desc.imsimdeep.spatial_sort_instcat(self.instcat_file,
+                                                          outfile,
+                                                          block_size=50)
+        self.assertEqual(len(block_index['blocks']), 20)
+        with open(outfile) as input_:
+            sorted_lines = input_.readlines()
+        self.assertEqual(sorted(sorted_lines), sorted(lines))
+        self.assertEqual(sorted_lines[:4], lines[:3] + ['# a comment\n'])
+        self.assertIsNotNone(desc.imsimdeep.read_block_index(outfile))
+
+        # Compare to the selection from the unsorted file.
+        expected = os.path.join(self.tmp_dir, 'expected.txt')
+        selected = os.path.join(self.tmp_dir, 'selected.txt')
+        for ra, dec, radius in ((0., -30., 0.3), (359.5, -30.5, 0.2)):
+            desc.imsimdeep.sky_cone_select(self.instcat_file, ra, dec, radius,
+                                           expected)
+            desc.imsimdeep.sky_cone_select(outfile, ra, dec, radius, selected)
+            with open(expected) as input0, open(selected) as input1:
+                self.assertEqual(sorted(input0.readlines()),
+                                 sorted(input1.readlines()))
+
+        # A modified catalog invalidates the block index.
+        with open(outfile, 'a') as output:
+            output.write('# another comment\n')
+        self.assertIsNone(desc.imsimdeep.read_block_index(outfile))
+
+if __name__ == '__main__':
+    unittest.main()
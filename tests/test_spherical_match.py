@@ -0,0 +1,62 @@
+"""
+Unit tests for spherical_match module.
+"""
+from __future__ import absolute_import, print_function
+import unittest
+import numpy as np
+import desc.imsimdeep
+
+class SphericalMatcherTestCase(unittest.TestCase):
+    "TestCase class for SphericalMatcher."
+    def setUp(self):
+        np.random.seed(8734)
+
+    def tearDown(self):
+        pass
+
+    def test_match_wrap_and_poles(self):
+        "Test matches across RA=0/360 and near the poles."
+        ra_ref = np.array([359.9999, 0.0001, 120., 45., 180.])
+        dec_ref = np.array([0., 10., 89.9999, -89.99995, -30.])
+        matcher = desc.imsimdeep.SphericalMatcher(ra_ref, dec_ref)
+        ra = np.array([0.0001, 359.9999, 300., 225., 180.])
+        dec = np.array([0., 10., 89.9999, -89.99995, -30.0001])
+        offset, index = matcher.match(ra, dec)
+        np.testing.assert_array_equal(index, np.arange(5))
+        expected = desc.imsimdeep.great_circle_separation(ra, dec,
+                                                          ra_ref, dec_ref)
+        np.testing.assert_allclose(offset, expected, rtol=1e-6)
+        self.assertAlmostEqual(offset[0], 0.72, places=6)
+        self.assertAlmostEqual(offset[-1], 0.36, places=6)
+
+    def test_match_brute_force(self):
+        "Compare to a brute force search."
+        ra_ref = np.random.uniform(0, 360, 500)
+        dec_ref = np.degrees(np.arcsin(np.random.uniform(-1, 1, 500)))
+        ra = np.random.uniform(0, 360, 50)
+        dec = np.degrees(np.arcsin(np.random.uniform(-1, 1, 50)))
+        matcher = desc.imsimdeep.SphericalMatcher(ra_ref, dec_ref)
+        offset, index = matcher.match(ra, dec, k=3)
+        for i in range(len(ra)):
+            seps = desc.imsimdeep.great_circle_separation(ra[i], dec[i],
+                                                          ra_ref, dec_ref)
+            np.testing.assert_array_equal(index[i], np.argsort(seps)[:3])
+            np.testing.assert_allclose(offset[i], np.sort(seps)[:3],
+                                       rtol=1e-6)
+
+    def test_radius(self):
+        "Test match radius and blend counts."
+        ra_ref = np.array([10., 10., 10.])
+        dec_ref = np.array([0., 1./3600., 10./3600.])
+        matcher = desc.imsimdeep.SphericalMatcher(ra_ref, dec_ref)
+        offset, index = matcher.match([10., 10.], [0.5/3600., 1.], radius=2.)
+        self.assertEqual(index[1], -1)
+        self.assertTrue(np.isinf(offset[1]))
+        self.assertAlmostEqual(offset[0], 0.5, places=6)
+        counts = matcher.count_within([10.], [0.5/3600.], 2.)
+        self.assertEqual(counts[0], 2)
+        indexes = matcher.within([10.], [0.5/3600.], 2.)
+        self.assertEqual(sorted(indexes[0]), [0, 1])
+
+if __name__ == '__main__':
+    unittest.main()
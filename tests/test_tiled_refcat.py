@@ -0,0 +1,112 @@
+"""
+Unit tests for tiled_refcat module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import astropy.io.fits as fits
+import desc.imsimdeep
+try:
+    import healpy
+except ImportError:
+    healpy = None
+
+class LocalStarSource(object):
+    "Stand-in for the CatSim query: a fixed set of random stars."
+    def __init__(self, nstars=2000, seed=52):
+        rng = np.random.RandomState(seed)
+        self.stars = pd.DataFrame(dict(id=np.arange(nstars),
+                                       ra=rng.uniform(52, 54, nstars),
+                                       dec=rng.uniform(-28.5, -26.5, nstars)))
+        for band in 'ugrizy':
+            self.stars[band] = rng.uniform(16, 24, nstars)
+        self.stars['isvariable'] = 0
+        self.stars['starnotgal'] = 1
+        self.calls = 0
+
+    def __repr__(self):
+        return 'LocalStarSource()'
+
+    def __call__(self, ra, dec, radius):
+        self.calls += 1
+        seps = desc.imsimdeep.great_circle_separation(ra, dec,
+                                                      self.stars['ra'],
+                                                      self.stars['dec'])
+        return self.stars[seps <= radius*3600.]
+
+def local_index_builder(ref_file, index_id, max_scale_number, output_dir,
+                        manifest):
+    "Stand-in for build_index_files."
+    index_files = ['index-%s%02i.fits' % (index_id, scale)
+                   for scale in range(max_scale_number + 1)]
+    for item in index_files:
+        shutil.copy(ref_file, os.path.join(output_dir, item))
+    return index_files
+
+@unittest.skipIf(healpy is None, 'healpy is not available')
+class TiledRefcatTestCase(unittest.TestCase):
+    "TestCase class for tiled reference catalogs."
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_make_tiled_index_files(self):
+        "Test the tiles, FITS tables, and andConfig.py."
+        ra, dec, radius, nside = 53., -27.5, 0.5, 64
+        star_source = LocalStarSource()
+        pixels = desc.imsimdeep.sky_tiles(ra, dec, radius, nside)
+        index_files = desc.imsimdeep.make_tiled_index_files(
+            ra, dec, radius, 7, nside=nside, margin=0.05,
+            max_scale_number=1, output_dir=self.tmp_dir, processes=2,
+            star_source=star_source, index_builder=local_index_builder)
+        self.assertEqual(star_source.calls, len(pixels))
+        self.assertEqual(len(index_files), 2*len(pixels))
+        # The index IDs are numeric: root, 5-digit pixel, scale.
+        self.assertIn('tile-%i/index-7%05i01.fits' % (pixels[0], pixels[0]),
+                      index_files)
+        for item in index_files:
+            int(os.path.basename(item)[len('index-'):-len('.fits')])
+
+        # Each star in the region is in the tile containing it.
+        pixel = healpy.ang2pix(nside, ra, dec, nest=True, lonlat=True)
+        with fits.open(os.path.join(self.tmp_dir, 'tile-%i' % pixel,
+                                    'refcat.fits')) as hdus:
+            ids = set(hdus[1].data['id'])
+        stars = star_source.stars
+        in_tile = healpy.ang2pix(nside, stars['ra'].values,
+                                 stars['dec'].values, nest=True,
+                                 lonlat=True) == pixel
+        self.assertTrue(set(stars['id'][in_tile]).issubset(ids))
+
+        with open(os.path.join(self.tmp_dir, 'andConfig.py')) as input_:
+            config = input_.read()
+        for item in index_files:
+            self.assertIn("'%s'" % item, config)
+
+        # A second run reuses the tile reference catalogs.
+        desc.imsimdeep.make_tiled_index_files(
+            ra, dec, radius, 7, nside=nside, margin=0.05,
+            max_scale_number=1, output_dir=self.tmp_dir, processes=2,
+            star_source=star_source, index_builder=local_index_builder)
+        self.assertEqual(star_source.calls, len(pixels))
+
+    def test_index_id_checks(self):
+        "Test the checks of the index ID root."
+        for index_id_root in ('tile_', -1, 1.5):
+            self.assertRaises((ValueError, TypeError),
+                              desc.imsimdeep.make_tiled_index_files,
+                              53., -27.5, 0.5, index_id_root,
+                              output_dir=self.tmp_dir)
+        # The IDs of nside=1024 tiles overflow a 32-bit int.
+        self.assertRaises(ValueError, desc.imsimdeep.make_tiled_index_files,
+                          53., -27.5, 0.5, 1, nside=1024,
+                          output_dir=self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Unit tests for visit_pipeline module.
+"""
+from __future__ import absolute_import, print_function
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import lsst.obs.lsstSim as obs_lsstSim
+import lsst.sims.coordUtils as coordUtils
+import desc.imsim
+import desc.imsimdeep
+
+# Silence the INFO from the Stack when creating a mapper without a
+# registry.sqlite3 file.
+desc.imsim.get_logger('ERROR')
+
+class VisitPipelineTestCase(unittest.TestCase):
+    "TestCase class for the visit pipeline."
+    def setUp(self):
+        self.instcat_file = os.path.join(os.environ['IMSIMDEEP_DIR'], 'tests',
+                                         'tiny_instcat.txt')
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_instcat_chunks(self):
+        "Test reading the object lines in chunks."
+        header_lines, chunks = desc.imsimdeep.instcat_chunks(self.instcat_file,
+                                                             chunk_size=1)
+        self.assertEqual(len(header_lines), 19)
+        self.assertEqual(header_lines[0], 'rightascension 31.1133844')
+        chunks = list(chunks)
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1][0].startswith('object 140314 '))
+
+    def test_parse_chunks(self):
+        "Test parsing the chunks against the imsim instcat reader."
+        expected = desc.imsim.parsePhoSimInstanceFile(self.instcat_file)
+        header_lines, chunks = desc.imsimdeep.instcat_chunks(self.instcat_file,
+                                                             chunk_size=1)
+        for i, lines in enumerate(chunks):
+            commands, objs = desc.imsimdeep.parse_instcat_lines(header_lines,
+                                                                lines)
+            self.assertEqual(commands, expected.commands)
+            for column in expected.objects.columns:
+                self.assertEqual(objs[column].values[0],
+                                 expected.objects[column].values[i])
+
+    def _centered_instcat(self):
+        """
+        Write a copy of the test catalog with the objects moved near
+        the center of sensor R:2,2 S:1,1.
+        """
+        commands = desc.imsimdeep.instcat_commands(self.instcat_file)
+        obs_md = desc.imsimdeep.obs_metadata(commands)
+        camera = obs_lsstSim.LsstSimMapper().camera
+        ra, dec = desc.imsimdeep.chip_center_coords('R:2,2 S:1,1', obs_md,
+                                                    camera)
+        instcat_file = os.path.join(self.tmp_dir, 'instcat.txt')
+        with open(self.instcat_file) as input_, \
+                open(instcat_file, 'w') as output:
+            for i, line in enumerate(input_):
+                if line.startswith('object'):
+                    tokens = line.split()
+                    tokens[2] = '%.7f' % (ra + 0.01*(i % 2))
+                    tokens[3] = '%.7f' % dec
+                    line = ' '.join(tokens) + '\n'
+                output.write(line)
+        return instcat_file, obs_md, camera
+
+    def test_run_visit_pipeline(self):
+        "Compare the pipeline outputs to the serial calculations."
+        instcat_file, obs_md, camera = self._centered_instcat()
+        outdir = os.path.join(self.tmp_dir, 'sensors')
+        df = desc.imsimdeep.run_visit_pipeline(instcat_file, outdir,
+                                               chunk_size=1,
+                                               magnitude_processes=1,
+                                               chip_processes=1)
+
+        # The serial calculation, as in compute_apparent_mags.py.
+        commands, objs = desc.imsimdeep.read_instance_catalog(instcat_file)
+        objs = desc.imsim.validate_phosim_object_list(objs).accepted
+        band = commands['bandpass']
+        mags = [desc.imsimdeep.ApparentMagnitude(objs.iloc[i].sedFilepath)(
+            objs.iloc[i], band) for i in range(len(objs))]
+        chip_names = coordUtils.chipNameFromRaDec(objs['raICRS'].values,
+                                                  objs['decICRS'].values,
+                                                  camera=camera,
+                                                  obs_metadata=obs_md)
+
+        self.assertEqual(list(df['uniqueId']),
+                         list(pd.to_numeric(objs['uniqueId'])))
+        np.testing.assert_array_equal(df['raICRS'], objs['raICRS'])
+        np.testing.assert_array_equal(df['decICRS'], objs['decICRS'])
+        self.assertEqual(list(df['galSimType']), list(objs['galSimType']))
+        np.testing.assert_allclose(df[band], mags)
+        self.assertEqual(list(df['chipName']), list(chip_names))
+
+        # The per-sensor instance catalog has the header and the object
+        # lines of the objects on the sensor.
+        header_lines, chunks = desc.imsimdeep.instcat_chunks(instcat_file)
+        object_lines = [line for chunk in chunks for line in chunk]
+        sensor_file = os.path.join(outdir, 'instcat_%07i_R22_S11.txt'
+                                   % commands['obshistid'])
+        with open(sensor_file) as input_:
+            contents = input_.read()
+        expected = header_lines + [line for line, chip_name
+                                   in zip(object_lines, chip_names)
+                                   if chip_name == 'R:2,2 S:1,1']
+        self.assertGreater(len(expected), len(header_lines))
+        self.assertEqual(contents, '\n'.join(expected) + '\n')
+
+if __name__ == '__main__':
+    unittest.main()